@@ -2,12 +2,15 @@
 Flask app:
 - /login and /callback OAuth
 - /refresh-token to rotate
-- /sync-recent to run ingest then rollups
-- registers API blueprints
+- /sync-recent to run ingest then rollups, the similarity index is
+  updated after the response is sent
+- /sync-top to store changed top track and artist lists
+- registers API blueprints, imported when the app is created
+- compresses /api/* responses the client accepts compressed
 """
 
 from __future__ import annotations
-import os
+import importlib
 import secrets
 import urllib.parse
 from datetime import datetime, timedelta, timezone
@@ -15,32 +18,23 @@ from typing import Dict, Any, List
 
 from flask import Flask, jsonify, redirect, request, session
 from flask_cors import CORS
-from dotenv import load_dotenv
 
-import requests
-from sqlalchemy import select
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import config
 
-from .models import get_engine, user_info, now_utc
-from .services.spotify import current_session_token, mint_access_token, sget
-from .services.ingest import sync_recent_core
-from .services.rollups import rollup_days
+# route modules under backend.routes, each exposing bp; imported by
+# create_app() so importing this module stays cheap
+BLUEPRINTS = (
+    "recent", "summary", "heatmap", "skipped", "export", "leaderboard",
+    "sessions", "live", "settings", "top", "similar", "year_review",
+)
 
-from .routes.recent import bp as recent_bp
-from .routes.summary import bp as summary_bp
-from .routes.heatmap import bp as heatmap_bp
-from .routes.skipped import bp as skipped_bp
-from .routes.export import bp as export_bp
-
-load_dotenv()
-
-CLIENT_ID = os.getenv("CLIENT_ID", "")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET", "")
-REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://localhost:5000/callback")
-FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev-secret-change-me")
+CLIENT_ID = config.CLIENT_ID
+CLIENT_SECRET = config.CLIENT_SECRET
+REDIRECT_URI = config.REDIRECT_URI
+FLASK_SECRET_KEY = config.FLASK_SECRET_KEY
 
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
-SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_TOKEN_URL = config.SPOTIFY_TOKEN_URL
 
 SCOPES = "user-read-private user-read-email user-read-recently-played user-top-read"
 
@@ -54,13 +48,17 @@ def create_app() -> Flask:
     CORS(app, resources={r"/api/*": {"origins": ["http://localhost:5173"]}}, supports_credentials=True)
     CORS(app, resources={r"/login": {"origins": ["http://localhost:5173"]}}, supports_credentials=True)
     CORS(app, resources={r"/sync-recent": {"origins": ["http://localhost:5173"]}}, supports_credentials=True)
+    CORS(app, resources={r"/sync-top": {"origins": ["http://localhost:5173"]}}, supports_credentials=True)
 
     # Blueprints
-    app.register_blueprint(recent_bp)
-    app.register_blueprint(summary_bp)
-    app.register_blueprint(heatmap_bp)
-    app.register_blueprint(skipped_bp)
-    app.register_blueprint(export_bp)
+    for name in BLUEPRINTS:
+        app.register_blueprint(importlib.import_module(f".routes.{name}", __package__).bp)
+
+    # br or gzip for /api/* bodies over COMPRESS_MIN_BYTES
+    from .services import compress
+    app.after_request(compress.after_request)
+
+    # services, requests and SQLAlchemy load on a handler's first call
 
     @app.get("/")
     def index():
@@ -83,6 +81,11 @@ def create_app() -> Flask:
 
     @app.get("/callback")
     def callback():
+        import requests
+        from .models import get_engine, user_info, now_utc
+        from .services.spotify import sget
+        from .services.upsert import upsert
+
         code = request.args.get("code")
         state = request.args.get("state")
         if not code or not state or state != session.get("oauth_state"):
@@ -117,25 +120,15 @@ def create_app() -> Flask:
 
         # Upsert user with refresh token
         with get_engine().begin() as conn:
-            stmt = sqlite_insert(user_info).values(
-                user_id=uid,
-                display_name=display_name,
-                email=email,
-                profile_image=profile_image,
-                country=country,
-                refresh_token=refresh_token,
-            ).on_conflict_do_update(
-                index_elements=[user_info.c.user_id],
-                set_={
-                    "display_name": display_name,
-                    "email": email,
-                    "profile_image": profile_image,
-                    "country": country,
-                    "refresh_token": refresh_token,  # rotate if new
-                    "updated_at": now_utc(),
-                }
-            )
-            conn.execute(stmt)
+            upsert(conn, user_info, [{
+                "user_id": uid,
+                "display_name": display_name,
+                "email": email,
+                "profile_image": profile_image,
+                "country": country,
+                "refresh_token": refresh_token,  # rotate if new
+            }], keys=["user_id"], update=["display_name", "email", "profile_image", "country", "refresh_token"],
+                extra_set={"updated_at": now_utc()})
 
         # Store session token only in session
         session["user_id"] = uid
@@ -147,6 +140,10 @@ def create_app() -> Flask:
 
     @app.post("/refresh-token")
     def refresh_token_route():
+        from sqlalchemy import select
+        from .models import get_engine, user_info
+        from .services.spotify import mint_access_token
+
         user_id = session.get("user_id")
         if not user_id:
             return jsonify({"error": "unauthorized"}), 401
@@ -181,6 +178,13 @@ def create_app() -> Flask:
 
     @app.post("/sync-recent")
     def sync_recent():
+        from .models import get_engine
+        from .services import cache, live, schedule, similarity
+        from .services.aggregates import rollup_global
+        from .services.ingest import sync_recent_core
+        from .services.rollups import rollup_days
+        from .services.spotify import current_session_token
+
         user_id = session.get("user_id")
         if not user_id:
             return jsonify({"error": "unauthorized"}), 401
@@ -191,8 +195,50 @@ def create_app() -> Flask:
 
         counts, days = sync_recent_core(user_id, token)
         roll = rollup_days(user_id, days)
+        glob = rollup_global(user_id, days)
+        # the cron schedule counts this sync too
+        with get_engine().begin() as conn:
+            schedule.record(conn, user_id, counts["new_plays"])
+        resp = jsonify({"counts": counts, "rollups": roll, "global": glob, "touched_days": [d.isoformat() for d in days]})
+        if days:
+            cache.invalidate(user_id)
+            # open live streams in this process get the delta right away
+            live.scheduler().publish_if_moved(user_id)
+
+            @resp.call_on_close
+            def _update_similarity():
+                # once the response is sent, the similar routes stay on the old
+                # index until then and drop their cached answers after
+                if similarity.update(user_id) is not None:
+                    cache.invalidate(user_id)
+
+        return resp
+
+    @app.post("/sync-top")
+    def sync_top_route():
+        import requests
+        from .services import cache
+        from .services.spotify import current_session_token
+        from .services.top_items import sync_top
 
-        return jsonify({"counts": counts, "rollups": roll, "touched_days": [d.isoformat() for d in days]})
+        user_id = session.get("user_id")
+        if not user_id:
+            return jsonify({"error": "unauthorized"}), 401
+
+        token = current_session_token()
+        if not token:
+            return jsonify({"error": "no_valid_token"}), 401
+
+        try:
+            # the fetch threads cannot touch the session, a rejected token is refreshed here
+            counts = sync_top(user_id, token, refresh=lambda: current_session_token(refresh=True))
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 401:
+                raise
+            return jsonify({"error": "no_valid_token"}), 401
+        if counts["changed"]:
+            cache.invalidate(user_id)
+        return jsonify({"counts": counts})
 
     return app
 
@@ -0,0 +1,54 @@
+"""
+Compare two benchmark JSON files from backend.bench.run.
+Prints median change per benchmark and exits non zero when any
+benchmark got slower than the threshold.
+
+Usage: python -m backend.bench.compare base.json head.json --threshold 1.2
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for k, v in results.items():
+        if not isinstance(v, dict):
+            continue
+        if "median_ms" in v:
+            out[prefix + k] = float(v["median_ms"])
+        else:
+            out.update(flatten(v, prefix + k + "."))
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Compare two benchmark result files")
+    p.add_argument("base")
+    p.add_argument("head")
+    p.add_argument("--threshold", type=float, default=1.2, help="fail when head/base median exceeds this")
+    args = p.parse_args(argv)
+
+    with open(args.base) as f:
+        base = flatten(json.load(f)["results"])
+    with open(args.head) as f:
+        head = flatten(json.load(f)["results"])
+
+    regressed = []
+    width = max((len(k) for k in base), default=10)
+    for name in sorted(set(base) | set(head)):
+        b, h = base.get(name), head.get(name)
+        if b is None or h is None:
+            print(f"{name:<{width}}  {'-' if b is None else b:>10}  {'-' if h is None else h:>10}")
+            continue
+        ratio = h / b if b else float("inf")
+        flag = "  REGRESSED" if ratio > args.threshold else ""
+        print(f"{name:<{width}}  {b:>10.3f}  {h:>10.3f}  x{ratio:.2f}{flag}")
+        if flag:
+            regressed.append(name)
+
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
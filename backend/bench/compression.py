@@ -0,0 +1,154 @@
+"""
+Heatmap bytes on the wire and time to first chunk:
+- builds a synthetic database and serves it with python -m backend.serve,
+  one worker, shared cache off
+- fetches /api/heatmap over a month, a year and the whole history, as
+  one JSON body and as the ?stream=1 per month NDJSON, with identity,
+  gzip and br (when the brotli package is installed)
+- reports body bytes, time to the first body byte, total time, and the
+  client's parse time: the whole body at once against the largest chunk
+- checks every variant decodes to the same days, exits non-zero if not
+
+Usage: python -m backend.bench.compression --users 2 --years 3 --repeat 10 --out compression.json
+"""
+
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import os
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, select
+
+from ..models import get_engine, reset_engine, metadata, daily_totals
+from ..services import compress
+from .run import summarize
+from .serve_load import serve, session_cookies
+from .synth import SynthConfig, populate, user_ids
+
+def _decode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return compress._brotli().decompress(body)
+    if encoding == "gzip":
+        return zlib.decompressobj(31).decompress(body)
+    return body
+
+def _fetch(port: int, cookie: str, path: str, encoding: str) -> Tuple[bytes, float, float, str]:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Cookie": f"session={cookie}", "Accept-Encoding": encoding}
+    t0 = time.perf_counter()
+    conn.request("GET", path, headers=headers)
+    resp = conn.getresponse()
+    parts = [resp.read1(1 << 16)]
+    first = time.perf_counter() - t0
+    while True:
+        b = resp.read1(1 << 16)
+        if not b:
+            break
+        parts.append(b)
+    total = time.perf_counter() - t0
+    got = resp.getheader("Content-Encoding") or "identity"
+    conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f"{path} {resp.status}")
+    return b"".join(parts), first * 1000.0, total * 1000.0, got
+
+def _days(text: bytes, streamed: bool) -> Tuple[List[Any], float]:
+    # parsed items and the longest single json.loads the client would run
+    if not streamed:
+        t0 = time.perf_counter()
+        items = json.loads(text)["items"]
+        return items, (time.perf_counter() - t0) * 1000.0
+    items: List[Any] = []
+    worst = 0.0
+    for line in text.decode().splitlines():
+        t0 = time.perf_counter()
+        chunk = json.loads(line)
+        worst = max(worst, (time.perf_counter() - t0) * 1000.0)
+        items.extend(chunk.get("items", ()))
+    return items, worst
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Heatmap bytes on the wire and time to first chunk")
+    p.add_argument("--users", type=int, default=2)
+    p.add_argument("--years", type=float, default=3.0)
+    p.add_argument("--repeat", type=int, default=10)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    encodings = ["identity"] + compress.available()
+    cfg = SynthConfig(users=args.users, years=args.years)
+    uid = user_ids(cfg)[0]
+    results: List[Dict[str, Any]] = []
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'compression.db')}"
+        reset_engine(db_url)
+        metadata.drop_all(get_engine())
+        populate(get_engine(), cfg)
+        with get_engine().connect() as conn:
+            first, last = conn.execute(
+                select(func.min(daily_totals.c.day), func.max(daily_totals.c.day)).where(daily_totals.c.user_id == uid)
+            ).one()
+        reset_engine()
+        cookie = session_cookies([uid])[uid]
+        last = datetime.fromisoformat(str(last)).replace(tzinfo=timezone.utc)
+        ranges = {
+            "month": last - timedelta(days=30),
+            "year": last - timedelta(days=365),
+            "all": datetime.fromisoformat(str(first)).replace(tzinfo=timezone.utc),
+        }
+
+        proc, port = serve(db_url, 1, 1, "")
+        try:
+            for name, start in ranges.items():
+                base = f"/api/heatmap?start={start.date().isoformat()}&end={last.date().isoformat()}"
+                expect = None
+                for streamed in (False, True):
+                    path = base + ("&stream=1" if streamed else "")
+                    for enc in encodings:
+                        firsts, totals = [], []
+                        for _ in range(args.repeat + 1):
+                            body, t_first, t_total, got = _fetch(port, cookie, path, enc)
+                            firsts.append(t_first)
+                            totals.append(t_total)
+                        text = _decode(body, got)
+                        items, parse_ms = _days(text, streamed)
+                        if expect is None:
+                            expect = items
+                        ok = items == expect
+                        mismatches += not ok
+                        r = {
+                            "range": name,
+                            "days": len(items),
+                            "mode": "stream" if streamed else "json",
+                            "encoding": got,
+                            "body_bytes": len(body),
+                            "decoded_bytes": len(text),
+                            "first_byte": summarize(firsts[1:]),
+                            "total": summarize(totals[1:]),
+                            "max_parse_ms": round(parse_ms, 3),
+                            "same_days": ok,
+                        }
+                        results.append(r)
+                        print(f"{name:<6} {r['mode']:<7}{got:<9} days={len(items):<5} bytes={len(body):<8} "
+                              f"first={r['first_byte']['median_ms']:.1f}ms total={r['total']['median_ms']:.1f}ms "
+                              f"parse={parse_ms:.2f}ms same={ok}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps({"users": args.users, "years": args.years, "min_bytes": compress.MIN_BYTES,
+                                "results": results}, indent=2) + "\n")
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Read routes against the cron sync writing to the same SQLite file:
+- builds one synthetic database and serves it with python -m backend.serve,
+  shared cache off so every request reads the database
+- closed loop clients hit the read routes for --seconds alone, then again
+  while this process runs python -m backend.jobs.sync --all back to back,
+  each run merging a fresh batch of 50 plays per user from the fake Spotify
+- storage modes: rollback journal with reads on a read-write engine (as
+  before the read engine), WAL with the same, and WAL with reads on the
+  mode=ro engine (the default now)
+- reports reader p50/p99, requests/sec and errors per phase, and sync
+  runs completed, their times and lock errors
+
+Usage: python -m backend.bench.contention --clients 4 --seconds 10 --out contention.json
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+from sqlalchemy.exc import OperationalError
+
+from .. import config
+from ..models import get_engine, reset_engine, metadata
+from ..jobs import sync
+from .fake_spotify import FakeSpotify
+from .run import summarize
+from .serve_load import load, serve, session_cookies
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+# name, journal mode, reads on a read-write engine over the same file
+MODES = (
+    ("rollback_shared", "delete", True),
+    ("wal_shared", "wal", True),
+    ("wal_readonly", "wal", False),
+)
+
+class CronLoop(threading.Thread):
+    """
+    Runs the sync job until stopped, pushing a new batch before each run.
+    """
+
+    def __init__(self, fake: FakeSpotify, streams: Dict[str, Listener], catalog: Catalog):
+        super().__init__(daemon=True)
+        self.fake = fake
+        self.streams = streams
+        self.catalog = catalog
+        self.stop = threading.Event()
+        self.samples: List[float] = []
+        self.lock_errors = 0
+
+    def run(self):
+        while not self.stop.is_set():
+            for uid, stream in self.streams.items():
+                self.fake.push(uid, [to_recent_item(self.catalog, next(stream)) for _ in range(self.fake.window)])
+            t0 = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sync.main(["--all"])
+            except OperationalError:
+                self.lock_errors += 1
+                continue
+            self.samples.append((time.perf_counter() - t0) * 1000.0)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Read latency while the sync job writes")
+    p.add_argument("--clients", type=int, default=4)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--users", type=int, default=10)
+    p.add_argument("--years", type=float, default=0.5)
+    p.add_argument("--modes", nargs="*", default=[m[0] for m in MODES])
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years)
+    catalog = Catalog(cfg)
+    uids = user_ids(cfg)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotify() as fake:
+        fake.use()
+        cookies = None
+        for name, journal, shared in MODES:
+            if name not in args.modes:
+                continue
+            # a fresh database per mode, the previous one has the synced plays
+            db_url = f"sqlite:///{os.path.join(tmp, name + '.db')}"
+            config.SQLITE_JOURNAL_MODE = journal
+            reset_engine(db_url)
+            metadata.drop_all(get_engine())
+            cursors = populate(get_engine(), cfg, catalog)["cursors"]
+            cookies = cookies or list(session_cookies(uids).values())
+            streams = {u: Listener(cfg, catalog, u, cursors[u] + timedelta(minutes=5)) for u in uids}
+
+            env = {"SQLITE_JOURNAL_MODE": journal, "READ_DATABASE_URL": db_url if shared else ""}
+            proc, port = serve(db_url, args.workers, 1, "", env)
+            try:
+                idle = load(port, cookies, args.clients, args.seconds)
+                cron = CronLoop(fake, streams, catalog)
+                cron.start()
+                busy = load(port, cookies, args.clients, args.seconds)
+                cron.stop.set()
+                cron.join()
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            reset_engine()
+
+            r = {
+                "mode": name,
+                "journal_mode": journal,
+                "read_engine": "read-write" if shared else "mode=ro",
+                "reads_alone": idle,
+                "reads_during_sync": busy,
+                "sync_runs": summarize(cron.samples) if cron.samples else {"n": 0},
+                "sync_lock_errors": cron.lock_errors,
+            }
+            results.append(r)
+            print(f"{name:<16} alone p50={idle.get('median_ms', 0):.1f}ms p99={idle['p99_ms']:.1f}ms rps={idle['rps']} | "
+                  f"during sync p50={busy.get('median_ms', 0):.1f}ms p99={busy['p99_ms']:.1f}ms rps={busy['rps']} "
+                  f"errors={busy['errors']} | syncs={len(cron.samples)} "
+                  f"median={r['sync_runs'].get('median_ms', 0):.0f}ms lock_errors={cron.lock_errors}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps({"clients": args.clients, "seconds": args.seconds, "workers": args.workers,
+                                "users": args.users, "results": results}, indent=2) + "\n")
+
+if __name__ == "__main__":
+    main()
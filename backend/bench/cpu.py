@@ -0,0 +1,124 @@
+"""
+Python CPU per call for the hot paths, under cProfile:
+- rollup_days for one day, /api/summary/last30, /api/most-skipped and
+  sync_recent_core with one page of new plays
+- reports process CPU per call, SQL compilations and statement
+  constructions per call, and the costliest functions
+- compare runs from two commits with backend.bench.compare
+
+Usage: python -m backend.bench.cpu --repeat 200 --out cpu.json
+"""
+
+from __future__ import annotations
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import tempfile
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+from ..models import get_engine, reset_engine, metadata
+from .fake_spotify import FakeSpotify
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+def _counted() -> Dict[tuple, str]:
+    # pstats keys are (filename, first line, name), match them by code object
+    from sqlalchemy.sql import compiler, _dml_constructors, _selectable_constructors
+
+    codes = {
+        compiler.SQLCompiler.__init__.__code__: "compiles",
+        _selectable_constructors.select.__code__: "selects_built",
+        _dml_constructors.update.__code__: "updates_built",
+    }
+    return {(c.co_filename, c.co_firstlineno, c.co_name): name for c, name in codes.items()}
+
+def _counts(stats: pstats.Stats) -> Dict[str, int]:
+    counted = _counted()
+    out = {name: 0 for name in counted.values()}
+    for key, (_cc, ncalls, _tt, _ct, _callers) in stats.stats.items():
+        if key in counted:
+            out[counted[key]] += ncalls
+    return out
+
+def profile(fn: Callable[[], Any], repeat: int, top: int = 8) -> Dict[str, Any]:
+    fn()  # warm caches the way a long running worker would have them
+    prof = cProfile.Profile()
+    cpu: List[float] = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        prof.enable()
+        fn()
+        prof.disable()
+        cpu.append((time.process_time() - t0) * 1000.0)
+    stats = pstats.Stats(prof)
+    per_call = {k: round(v / repeat, 2) for k, v in _counts(stats).items()}
+    hot = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:top]
+    cpu.sort()
+    return {
+        "n": repeat,
+        # cProfile inflates absolute time, compare runs made the same way
+        "median_ms": round(cpu[len(cpu) // 2], 3),
+        "mean_ms": round(sum(cpu) / len(cpu), 3),
+        "per_call": per_call,
+        "top_self": [
+            {"func": f"{os.path.basename(path)}:{line}:{fn_name}", "self_ms": round(tt * 1000.0 / repeat, 3)}
+            for (path, line, fn_name), (_cc, _nc, tt, _ct, _callers) in hot
+        ],
+    }
+
+def run(cfg: SynthConfig, repeat: int) -> Dict[str, Any]:
+    from ..app import create_app
+    from ..services.ingest import sync_recent_core
+    from ..services.rollups import rollup_days
+
+    catalog = Catalog(cfg)
+    dataset = populate(get_engine(), cfg, catalog)
+    uid = user_ids(cfg)[0]
+    day = cfg.end_dt() - timedelta(days=1)
+
+    client = create_app().test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = uid
+
+    results: Dict[str, Any] = {}
+    results["rollup_days_1"] = profile(lambda: rollup_days(uid, [day]), repeat)
+    results["summary_last30"] = profile(lambda: client.get("/api/summary/last30"), repeat)
+    results["most_skipped_30d"] = profile(lambda: client.get("/api/most-skipped?window=30d"), repeat)
+
+    stream = Listener(cfg, catalog, uid, dataset["cursors"][uid] + timedelta(minutes=5))
+    with FakeSpotify() as fake:
+        fake.use()
+
+        def sync_once():
+            fake.push(uid, [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+            sync_recent_core(uid, uid)
+
+        results["sync_recent_core"] = profile(sync_once, repeat)
+    return results
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Python CPU per call on the hot paths")
+    p.add_argument("--users", type=int, default=2)
+    p.add_argument("--years", type=float, default=0.5)
+    p.add_argument("--repeat", type=int, default=100)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_engine(f"sqlite:///{os.path.join(tmp, 'cpu.db')}")
+        metadata.drop_all(get_engine())
+        results = run(SynthConfig(users=args.users, years=args.years), args.repeat)
+        reset_engine()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps({"results": results}, indent=2) + "\n")
+    for name, r in results.items():
+        counts = " ".join(f"{k}={v}" for k, v in r["per_call"].items())
+        print(f"{name:<18} cpu={r['median_ms']:.2f}ms/call {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Track and artist name cache, memory and route latency:
+- builds a synthetic database with a large catalog
+- warms the whole catalog into the cache and reports its deep size,
+  the traced allocation, and the same rows held as plain dicts
+- times the read routes that resolve names with the cache cold
+  (cleared before every call) and warm
+Compare with the join based routes by running backend.bench.run on
+both commits and feeding the two files to backend.bench.compare.
+
+Usage: python -m backend.bench.dimensions --tracks 50000 --artists 5000
+"""
+
+from __future__ import annotations
+import argparse
+import gc
+import json
+import os
+import tempfile
+import tracemalloc
+from typing import Any, Dict
+
+from sqlalchemy import select
+
+from ..models import get_engine, reset_engine, metadata, tracks, artists
+from ..services.dimensions import Dimensions, dimensions
+from .run import api_routes, timed
+from .synth import SynthConfig, populate, user_ids
+
+ROUTES = ("recent", "summary_last30", "most_skipped_30d", "heatmap_1y", "export_last30")
+
+def _deep_size(obj, seen=None) -> int:
+    import sys
+
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(x, seen) for x in obj)
+    return size
+
+def memory(track_ids) -> Dict[str, Any]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    dims = Dimensions(max_tracks=len(track_ids) + 1)
+    dims.track_labels(track_ids)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    traced = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    out = dims.stats()
+    out["traced_bytes"] = traced
+
+    # the same rows kept as one dict per row, as a naive cache would
+    with get_engine().connect() as conn:
+        names = dict(conn.execute(select(artists.c.artist_id, artists.c.name)).all())
+        plain = {
+            r.track_id: {"title": r.title, "album": r.album_name, "artist_id": r.artist_id, "artist": names.get(r.artist_id)}
+            for r in conn.execute(select(tracks.c.track_id, tracks.c.title, tracks.c.album_name, tracks.c.artist_id))
+        }
+    out["plain_dict_bytes"] = _deep_size(plain)
+    return out
+
+def latency(cfg: SynthConfig, repeat: int) -> Dict[str, Any]:
+    from ..app import create_app
+
+    client = create_app().test_client()
+    users = user_ids(cfg)
+    paths = api_routes(cfg)
+    out: Dict[str, Any] = {}
+    for name in ROUTES:
+        for mode in ("cold", "warm"):
+            i = 0
+
+            def one():
+                nonlocal i
+                if mode == "cold":
+                    dimensions().clear()
+                with client.session_transaction() as s:
+                    s["user_id"] = users[i % len(users)]
+                client.get(paths[name])
+                i += 1
+
+            out[f"{name}_{mode}"] = timed(one, repeat)
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Dimension cache memory and latency")
+    p.add_argument("--tracks", type=int, default=50_000)
+    p.add_argument("--artists", type=int, default=5_000)
+    p.add_argument("--users", type=int, default=2)
+    p.add_argument("--years", type=float, default=1.0)
+    p.add_argument("--repeat", type=int, default=30)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years, catalog_tracks=args.tracks, catalog_artists=args.artists)
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_engine(f"sqlite:///{os.path.join(tmp, 'dims.db')}")
+        metadata.drop_all(get_engine())
+        populate(get_engine(), cfg)
+        with get_engine().connect() as conn:
+            track_ids = [r[0] for r in conn.execute(select(tracks.c.track_id))]
+        result = {"tracks": args.tracks, "artists": args.artists, "memory": memory(track_ids), "latency": latency(cfg, args.repeat)}
+        result["process_cache"] = dimensions().stats()
+        reset_engine()
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    m = result["memory"]
+    print(f"catalog tracks={m['tracks']} artists={m['artists']} cache={m['bytes'] / 1e6:.1f}MB "
+          f"({m['bytes_per_track']} B/track) traced={m['traced_bytes'] / 1e6:.1f}MB plain_dicts={m['plain_dict_bytes'] / 1e6:.1f}MB")
+    for name in ROUTES:
+        lat = result["latency"]
+        print(f"{name:<18} cold={lat[name + '_cold']['median_ms']:.2f}ms warm={lat[name + '_warm']['median_ms']:.2f}ms")
+
+if __name__ == "__main__":
+    main()
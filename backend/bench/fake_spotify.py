@@ -0,0 +1,165 @@
+"""
+Local stand-in for the Spotify Web API used by benchmarks:
+- GET /v1/me/player/recently-played with limit, after and before cursors
+- GET /v1/me/top/{tracks,artists} with time_range, limit and offset
+- bearer token selects the user feed, tokens in revoked get 401
+- POST /api/token mints "<user>" access tokens from "rt-<user>" refresh tokens
+- feeds are filled by the caller with push(), top lists with set_top()
+- latency adds a fixed delay to every GET, standing in for the round trip
+Point services.spotify at it with SPOTIFY_API_BASE and SPOTIFY_TOKEN_URL or use().
+"""
+
+from __future__ import annotations
+import json
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set
+
+def _item_ms(item: Dict[str, Any]) -> int:
+    dt = datetime.fromisoformat(item["played_at"].replace("Z", "+00:00"))
+    return int(dt.timestamp() * 1000)
+
+class FakeSpotify:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, window: int = 50, latency: float = 0.0):
+        self.window = window  # Spotify only keeps the newest 50 plays
+        self.latency = latency
+        self._feeds: Dict[str, List[Dict[str, Any]]] = {}
+        self._top: Dict[tuple, List[Dict[str, Any]]] = {}
+        self.revoked: Set[str] = set()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.token_requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def token_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/token"
+
+    def push(self, token: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            feed = self._feeds.setdefault(token, [])
+            feed.extend(items)
+            feed.sort(key=_item_ms, reverse=True)
+            del feed[self.window:]
+
+    def set_top(self, token: str, kind: str, time_range: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._top[(token, kind, time_range)] = list(items)
+
+    def start(self) -> "FakeSpotify":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def use(self) -> None:
+        """
+        Route services.spotify.sget to this server.
+        """
+        from ..services import spotify
+        spotify.SPOTIFY_API_BASE = self.base_url
+        spotify.SPOTIFY_TOKEN_URL = self.token_url
+
+    def __enter__(self) -> "FakeSpotify":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _page(self, token: str, query: Dict[str, str]) -> Dict[str, Any]:
+        limit = max(1, min(int(query.get("limit", 20)), 50))
+        with self._lock:
+            feed = list(self._feeds.get(token, ()))
+        if "after" in query:
+            after = int(query["after"])
+            feed = [it for it in feed if _item_ms(it) > after]
+        if "before" in query:
+            before = int(query["before"])
+            feed = [it for it in feed if _item_ms(it) < before]
+        page = feed[:limit]
+        nxt = None
+        if len(feed) > limit:
+            q = urllib.parse.urlencode({"limit": limit, "before": _item_ms(page[-1])})
+            nxt = f"{self.base_url}/me/player/recently-played?{q}"
+        return {
+            "items": page,
+            "next": nxt,
+            "limit": limit,
+            "cursors": {
+                "after": str(_item_ms(page[0])) if page else None,
+                "before": str(_item_ms(page[-1])) if page else None,
+            },
+        }
+
+    def _top_page(self, token: str, kind: str, query: Dict[str, str]) -> Dict[str, Any]:
+        limit = max(1, min(int(query.get("limit", 20)), 50))
+        offset = int(query.get("offset", 0))
+        time_range = query.get("time_range", "medium_term")
+        with self._lock:
+            items = list(self._top.get((token, kind, time_range), ()))
+        nxt = None
+        if offset + limit < len(items):
+            q = urllib.parse.urlencode({"time_range": time_range, "limit": limit, "offset": offset + limit})
+            nxt = f"{self.base_url}/me/top/{kind}?{q}"
+        return {"items": items[offset:offset + limit], "total": len(items), "limit": limit, "offset": offset, "next": nxt}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Dict[str, Any]) -> None:
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parsed = urllib.parse.urlparse(self.path)
+                auth = self.headers.get("Authorization", "")
+                if not auth.startswith("Bearer "):
+                    return self._send(401, {"error": {"status": 401, "message": "No token provided"}})
+                token = auth[len("Bearer "):]
+                if token in fake.revoked:
+                    return self._send(401, {"error": {"status": 401, "message": "The access token expired"}})
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                if parsed.path.rstrip("/") == "/v1/me/player/recently-played":
+                    return self._send(200, fake._page(token, query))
+                kind = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+                if parsed.path.rstrip("/").startswith("/v1/me/top/") and kind in ("tracks", "artists"):
+                    return self._send(200, fake._top_page(token, kind, query))
+                return self._send(404, {"error": {"status": 404, "message": "Service not found"}})
+
+            def do_POST(self):
+                fake.token_requests += 1
+                length = int(self.headers.get("Content-Length", "0"))
+                form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+                if urllib.parse.urlparse(self.path).path != "/api/token":
+                    return self._send(404, {"error": "not_found"})
+                rt = form.get("refresh_token", "")
+                if form.get("grant_type") != "refresh_token" or not rt.startswith("rt-"):
+                    return self._send(400, {"error": "invalid_grant"})
+                return self._send(200, {"access_token": rt[len("rt-"):], "token_type": "Bearer", "expires_in": 3600})
+
+        return Handler
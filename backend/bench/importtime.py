@@ -0,0 +1,101 @@
+"""
+Cold start cost of the entry points:
+- runs each entry in a fresh interpreter under -X importtime
+- reports median import time, wall time and the slowest modules
+- flags heavy modules pulled in where they are not needed: the sync job
+  loads no flask or numpy, importing the app no SQLAlchemy, requests or
+  numpy, creating it the blueprints but still no requests or numpy
+- exits non-zero when an entry's median is over --target-ms
+
+Usage: python -m backend.bench.importtime --target-ms 250 --out importtime.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from .run import summarize
+
+# entry name -> (python code, modules it should not import)
+ENTRIES = {
+    "jobs.sync": ("import backend.jobs.sync", ("flask", "numpy")),
+    "app.import": ("import backend.app", ("sqlalchemy", "requests", "numpy")),
+    "app": ("import backend.app; backend.app.create_app()", ("requests", "numpy")),
+}
+
+def _parse(stderr: str) -> List[Dict[str, Any]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        # nesting shows as extra indent after the single separator space
+        rows.append({"module": name[1:].rstrip(), "self_us": int(self_us), "cumulative_us": int(cum_us)})
+    return rows
+
+def measure(code: str, avoid=(), top: int = 10) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = _parse(proc.stderr)
+    # top level imports carry the whole tree, summing them gives the total
+    total_us = sum(r["cumulative_us"] for r in rows if not r["module"].startswith(" ") and r["module"] != "gc")
+    names = {r["module"].strip() for r in rows}
+    return {
+        "import_ms": total_us / 1000.0,
+        "wall_ms": wall_ms,
+        "modules": len(rows),
+        "unwanted": sorted(m for m in avoid if m in names),
+        "slowest": [
+            {"module": r["module"].strip(), "self_ms": r["self_us"] / 1000.0}
+            for r in sorted(rows, key=lambda r: r["self_us"], reverse=True)[:top]
+        ],
+    }
+
+def run(repeat: int = 5) -> Dict[str, Any]:
+    out = {}
+    for name, (code, avoid) in ENTRIES.items():
+        # one unmeasured run so .pyc writes and a cold page cache do not count
+        measure(code, avoid)
+        runs = [measure(code, avoid) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["import_ms"])
+        out[name] = {
+            "import": summarize([r["import_ms"] for r in runs]),
+            "wall": summarize([r["wall_ms"] for r in runs]),
+            "modules": best["modules"],
+            "unwanted": best["unwanted"],
+            "slowest": best["slowest"],
+        }
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Import time of the backend entry points")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--target-ms", type=float, default=None, help="fail when an entry imports slower than this")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    results = run(args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+    failed = False
+    for name, r in results.items():
+        import_ms = r["import"]["median_ms"]
+        over = args.target_ms is not None and import_ms > args.target_ms
+        failed = failed or over or bool(r["unwanted"])
+        slow = ", ".join(f"{s['module']} {s['self_ms']:.1f}" for s in r["slowest"][:5])
+        print(f"{name:<10} import={import_ms:.1f}ms wall={r['wall']['median_ms']:.1f}ms modules={r['modules']} "
+              f"{'OVER ' if over else ''}{'unwanted=' + ','.join(r['unwanted']) + ' ' if r['unwanted'] else ''}slowest: {slow}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Memory and time of the ingest hot loop on a large synthetic fetch:
+- serves --items Recently Played items as JSON pages of 50, decoded one
+  page at a time like sget does
+- the old loop (every raw page kept, then one 8 key dict per play and
+  the replace/fromisoformat/astimezone timestamp parse) against
+  services/ingest.normalize building StagedPlay records page by page
+- traced peak and retained memory, and wall time, of each
+- the played_at parse alone per call: the old one, ingest._parse_dt and
+  a pure Python epoch ms parser slicing the fixed Spotify layout; the C
+  fromisoformat behind _parse_dt wins, so ingest keeps datetimes
+- staging the result into a throwaway SQLite database through the old
+  multi row VALUES against stage()
+
+Usage: python -m backend.bench.ingest_records --items 100000 --out records.json
+"""
+
+from __future__ import annotations
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import delete, insert
+
+from ..models import get_engine, reset_engine, metadata, ingest_staging, user_info
+from ..services import ingest
+from ..services.upsert import insert_ignore
+from .run import timed
+from .synth import SynthConfig, Catalog, Listener, to_recent_item, user_ids
+
+PAGE = 50
+
+def _old_parse_dt(iso_str: str) -> datetime:
+    if iso_str.endswith("Z"):
+        iso_str = iso_str.replace("Z", "+00:00")
+    dt = datetime.fromisoformat(iso_str)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def _days_from_civil(y: int, m: int, d: int) -> int:
+    # days since 1970-01-01 of a proleptic Gregorian date
+    y -= m <= 2
+    era, yoe = divmod(y, 400)
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+def _epoch_ms_parse(iso_str: str) -> int:
+    # epoch ms straight from Spotify's fixed 2024-01-02T03:04:05.678Z layout
+    s = iso_str
+    days = _days_from_civil(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+    ms = int(s[20:23]) if len(s) == 24 else 0
+    return ((days * 24 + int(s[11:13])) * 60 + int(s[14:16])) * 60_000 + int(s[17:19]) * 1000 + ms
+
+def _old_loop(user_id: str, pages: List[str]) -> List[Dict[str, Any]]:
+    # fetch_recent before StagedPlay, with json.loads standing in for sget
+    all_items = []
+    for page in pages:
+        all_items.extend(json.loads(page)["items"])
+    normalized = []
+    for it in all_items:
+        tr = it.get("track") or {}
+        if tr.get("type") != "track":
+            continue
+        normalized.append({
+            "user_id": user_id,
+            "played_at": _old_parse_dt(it["played_at"]),
+            "track_id": tr["id"],
+            "track_title": tr.get("name"),
+            "album_name": (tr.get("album") or {}).get("name"),
+            "duration_ms": int(tr.get("duration_ms") or 0),
+            "artist_id": (tr.get("artists") or [{}])[0].get("id"),
+            "artist_name": (tr.get("artists") or [{}])[0].get("name"),
+        })
+    normalized.sort(key=lambda x: x["played_at"])
+    return normalized
+
+def _new_loop(user_id: str, pages: List[str]) -> List[ingest.StagedPlay]:
+    records: List[ingest.StagedPlay] = []
+    for page in pages:
+        records.extend(ingest.normalize(user_id, json.loads(page)["items"]))
+    records.sort(key=ingest._played_at)
+    return records
+
+def _pages(cfg: SynthConfig, catalog: Catalog, items: int) -> List[Tuple[str, List[str]]]:
+    """
+    Per user JSON pages, newest first like Spotify, items split evenly.
+    """
+    uids = user_ids(cfg)
+    start = cfg.start_dt()
+    out = []
+    for uid in uids:
+        stream = Listener(cfg, catalog, uid, start)
+        plays = [to_recent_item(catalog, next(stream)) for _ in range(items // len(uids))]
+        plays.reverse()
+        out.append((uid, [json.dumps({"items": plays[i:i + PAGE]}) for i in range(0, len(plays), PAGE)]))
+    return out
+
+def _traced(fn: Callable[[], Any]) -> Tuple[Any, Dict[str, float]]:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"peak_mb": round((peak - base) / 2**20, 2), "retained_mb": round((current - base) / 2**20, 2)}
+
+def _old_stage(rows: List[Dict[str, Any]]) -> int:
+    with get_engine().begin() as conn:
+        return insert_ignore(conn, ingest_staging, rows, ["user_id", "played_at"])
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Ingest record memory and time")
+    p.add_argument("--items", type=int, default=100_000)
+    p.add_argument("--users", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--no-stage", action="store_true", help="skip the SQLite staging comparison")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=1)
+    catalog = Catalog(cfg)
+    fetches = _pages(cfg, catalog, args.items)
+    total = sum(len(pages) for _, pages in fetches) * PAGE
+    result: Dict[str, Any] = {"items": total, "users": args.users}
+
+    def run(loop):
+        return [loop(uid, pages) for uid, pages in fetches]
+
+    old, result["old_memory"] = _traced(lambda: run(_old_loop))
+    new, result["new_memory"] = _traced(lambda: run(_new_loop))
+    mismatches = sum(
+        1 for o, n in zip(old, new) for a, b in zip(o, n) if tuple(a.values()) != tuple(b)
+    ) + sum(abs(len(o) - len(n)) for o, n in zip(old, new))
+    result["mismatches"] = mismatches
+    result["old_time"] = timed(lambda: run(_old_loop), args.repeat)
+    result["new_time"] = timed(lambda: run(_new_loop), args.repeat)
+
+    stamps = [json.loads(fetches[0][1][0])["items"][0]["played_at"]] * 100_000
+    for name, parse in (("old", _old_parse_dt), ("new", ingest._parse_dt), ("epoch_ms", _epoch_ms_parse)):
+        t0 = time.perf_counter()
+        for s in stamps:
+            parse(s)
+        result[f"{name}_parse_ns"] = round((time.perf_counter() - t0) / len(stamps) * 1e9)
+    sample = {it["played_at"] for _, pages in fetches[:1] for page in pages for it in json.loads(page)["items"]}
+    result["epoch_ms_mismatches"] = sum(1 for s in sample if _epoch_ms_parse(s) != ingest._to_millis(ingest._parse_dt(s)))
+    mismatches += result["epoch_ms_mismatches"]
+
+    if not args.no_stage:
+        with tempfile.TemporaryDirectory() as tmp:
+            reset_engine(f"sqlite:///{os.path.join(tmp, 'records.db')}")
+            metadata.create_all(get_engine())
+            with get_engine().begin() as conn:
+                conn.execute(insert(user_info), [{"user_id": uid, "refresh_token": uid} for uid, _ in fetches])
+
+            def staged(fn, batches, clear=True) -> Dict[str, float]:
+                if clear:
+                    with get_engine().begin() as conn:
+                        conn.execute(delete(ingest_staging))
+                t0 = time.perf_counter()
+                n = sum(fn(b) for b in batches)
+                return {"ms": round((time.perf_counter() - t0) * 1000.0, 1), "rows": n}
+
+            result["old_stage"] = staged(_old_stage, old)
+            result["new_stage"] = staged(ingest.stage, new)
+            # a re-run after a crash, every row already staged
+            result["new_stage_rerun"] = staged(ingest.stage, new, clear=False)
+            reset_engine()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    print(json.dumps(result, indent=2))
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Hot window latency against history size, with and without archiving:
+- builds one synthetic database per history length
+- times 30 day summary, most skipped and a 7 day rollup
+- archives cold months and times the same calls again
+
+Usage: python -m backend.bench.partitions --years 1 2 4 --out partitions.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+from datetime import timedelta
+from typing import Any, Dict
+
+from ..models import get_engine, reset_engine, metadata
+from ..services import partitions
+from .run import timed, bench_routes
+from .synth import SynthConfig, populate, user_ids
+
+HOT_ROUTES = ("summary_last30", "most_skipped_30d", "recent")
+
+def _hot(cfg: SynthConfig, repeat: int) -> Dict[str, Any]:
+    from ..services.rollups import rollup_days
+
+    routes = bench_routes(cfg, repeat)
+    out = {k: routes[k] for k in HOT_ROUTES}
+    end = cfg.end_dt()
+    days = [end - timedelta(days=i) for i in range(7, 0, -1)]
+    uid = user_ids(cfg)[0]
+    out["rollup_days_7"] = timed(lambda: rollup_days(uid, days), repeat)
+    return out
+
+def run_one(cfg: SynthConfig, repeat: int, hot_months: int, compress: bool, tmp: str) -> Dict[str, Any]:
+    reset_engine(f"sqlite:///{os.path.join(tmp, f'p{cfg.years}.db')}")
+    eng = get_engine()
+    metadata.drop_all(eng)
+    dataset = populate(eng, cfg)
+    dataset.pop("cursors")
+
+    before = _hot(cfg, repeat)
+    partitions.ARCHIVE_DIR = os.path.join(tmp, f"archive{cfg.years}")
+    archived = partitions.archive_cold(hot_months=hot_months, compress=compress, now=cfg.end_dt())
+    after = _hot(cfg, repeat)
+    reset_engine()
+    return {
+        "years": cfg.years,
+        "plays": dataset["plays"],
+        "archived_months": len(archived),
+        "archived_rows": sum(a["rows"] for a in archived),
+        "archive_bytes": sum(os.path.getsize(a["path"]) for a in archived),
+        "before": before,
+        "after": after,
+    }
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Hot window latency vs history size")
+    p.add_argument("--years", type=float, nargs="+", default=[0.5, 1, 2, 4])
+    p.add_argument("--users", type=int, default=2)
+    p.add_argument("--plays-per-day", type=int, default=40)
+    p.add_argument("--hot-months", type=int, default=2)
+    p.add_argument("--compress", action="store_true")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for years in args.years:
+            cfg = SynthConfig(users=args.users, years=years, plays_per_day=args.plays_per_day)
+            results.append(run_one(cfg, args.repeat, args.hot_months, args.compress, tmp))
+
+    text = json.dumps({"hot_months": args.hot_months, "compress": args.compress, "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    for r in results:
+        cells = "  ".join(
+            f"{k} {r['before'][k]['median_ms']:.2f}->{r['after'][k]['median_ms']:.2f}ms"
+            for k in (*HOT_ROUTES, "rollup_days_7")
+        )
+        print(f"years={r['years']:<4} plays={r['plays']:<8} archived={r['archived_rows']:<8} {cells}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Query plan guard for the hot SQL paths, SQLite only:
+- builds a synthetic database and runs the read routes, a sync, its
+  rollups and global deltas and a live delta through the real code
+- repeats that with plays unarchived, with a few months archived (the
+  UNION ALL source) and with more months archived than can be attached
+  (the temp table source)
+- captures every statement as it executes and runs EXPLAIN QUERY PLAN on
+  the same connection, so attached months and temp tables are in place
+- fails on a full scan of a table that grows and on a temp B-tree that an
+  index should have made unnecessary; temp B-trees grouping or ordering
+  aggregates over an index bounded range are reported, not failed
+- lists indexes on the growing tables that no captured plan used
+Exits non-zero on a failure, run it before merging SQL changes.
+
+Usage: python -m backend.bench.query_plans --users 4 --years 1.5 --out plans.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+
+from ..models import get_engine, get_read_engine, reset_engine, metadata
+from ..services import partitions
+from .fake_spotify import FakeSpotify
+from .run import api_routes, build_similarity
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+# tables that stay a handful of rows whatever the history size
+SMALL_TABLES = {"play_partitions", "user_settings"}
+# full scans that are the point of the statement
+ALLOWED_SCANS = {
+    "user_artist_totals": "similar users compares every user's artist vector",
+    "plays_window": "holds one user's window, see plays_source(user_id=...)",
+}
+# storage layouts: months left hot before archiving the rest, None keeps all hot
+PHASES = (("hot", None), ("union", 8), ("temp", 2))
+PLANNED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+def _normalize(sql: str) -> str:
+    # one entry per statement shape, whatever the IN list or VALUES length
+    sql = " ".join(sql.split())
+    sql = re.sub(r"\?(?:, \?)+", "?", sql)
+    return re.sub(r"\(\?\)(?:, \(\?\))+", "(?)", sql)
+
+def classify(sql: str, plan: List[str]) -> Dict[str, List[str]]:
+    """
+    Split plan lines into failures, allowed scans and bounded temp B-trees.
+    """
+    out: Dict[str, List[str]] = {"fail": [], "allowed": [], "temp": []}
+    subqueries = {line.split()[1] for line in plan if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    grouped = " GROUP BY " in sql
+    for line in plan:
+        if line.startswith("SCAN "):
+            name = line.split()[1]
+            table = name.split(".")[-1]
+            if re.match(r"SCAN (\d+ )?CONSTANT ROW", line) or name in subqueries or table in SMALL_TABLES:
+                continue
+            if table in ALLOWED_SCANS:
+                out["allowed"].append(f"{line} ({ALLOWED_SCANS[table]})")
+            else:
+                out["fail"].append(line)
+        elif line.startswith("USE TEMP B-TREE"):
+            # sorting rows an index could have returned in order
+            if "DISTINCT" == line.split()[-1] or "RIGHT PART OF ORDER BY" in line or ("ORDER BY" in line and not grouped):
+                out["fail"].append(line)
+            else:
+                out["temp"].append(line)
+    return out
+
+class Recorder:
+    def __init__(self):
+        self.label = ""
+        self.phase = ""
+        self.plans: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+        self.errors: List[str] = []
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(PLANNED):
+            return
+        params = parameters[0] if executemany and parameters else parameters
+        try:
+            # a fresh cursor on the same DBAPI connection sees its temp tables and attachments
+            rows = cursor.connection.cursor().execute("EXPLAIN QUERY PLAN " + statement, params or ()).fetchall()
+        except Exception as e:
+            self.errors.append(f"{self.label}: {e!r}: {statement[:120]}")
+            return
+        plan = tuple(r[-1] for r in rows)
+        key = (_normalize(statement), plan)
+        entry = self.plans.get(key)
+        if entry is None:
+            entry = self.plans[key] = {"sql": key[0], "plan": list(plan), "seen_in": []}
+        tag = f"{self.phase}:{self.label}"
+        if tag not in entry["seen_in"]:
+            entry["seen_in"].append(tag)
+
+def _run_routes(rec: Recorder, client, cfg: SynthConfig, uid: str, day: Optional[date]) -> None:
+    paths = dict(api_routes(cfg, day))
+    paths.update({
+        "summary_365d": "/api/summary/last30?window=365d",
+        "summary_approx_730d": "/api/summary/last30?window=730d&approx=1",
+        "most_skipped_all_approx": "/api/most-skipped?window=all&approx=1",
+        "heatmap_tz": "/api/heatmap?tz=America/New_York",
+        "heatmap_tz_stream": "/api/heatmap?tz=America/New_York&start=2000-01-01&stream=1",
+    })
+    for name, path in paths.items():
+        rec.label = name
+        with client.session_transaction() as s:
+            s["user_id"] = uid
+        resp = client.get(path)
+        # streamed bodies run their queries as they are read
+        resp.get_data()
+        if resp.status_code != 200:
+            rec.errors.append(f"{name}: status {resp.status_code}")
+
+def _run_sync(rec: Recorder, fake: FakeSpotify, cfg: SynthConfig, catalog: Catalog, uid: str) -> None:
+    from ..services import live
+    from ..services.aggregates import rollup_global
+    from ..services.ingest import sync_recent_core
+    from ..services.rollups import rollup_days
+
+    stream = Listener(cfg, catalog, uid, live.read_cursor(uid) + timedelta(minutes=5))
+    fake.push(uid, [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+    rec.label = "sync"
+    _counts, days = sync_recent_core(uid, uid)
+    rec.label = "rollup_days"
+    rollup_days(uid, days)
+    rec.label = "rollup_global"
+    rollup_global(uid, days)
+    rec.label = "live_delta"
+    cursor = live.read_cursor(uid)
+    live.build_delta(uid, cursor - timedelta(hours=1), cursor)
+
+def _unused_indexes(plans, tables: Set[str]) -> List[str]:
+    used = set()
+    for entry in plans:
+        for line in entry["plan"]:
+            m = re.search(r"USING (?:COVERING )?INDEX (\w+)", line)
+            if m:
+                used.add(m.group(1))
+    out = []
+    with get_engine().connect() as conn:
+        for t in sorted(tables):
+            for row in conn.exec_driver_sql(f"PRAGMA index_list({t})").fetchall():
+                if row[1] not in used:
+                    out.append(f"{t}.{row[1]}")
+    return out
+
+def run(cfg: SynthConfig, tmp: str) -> Dict[str, Any]:
+    from ..app import create_app
+    from ..services.aggregates import rebuild_global
+    from ..services.sessions import backfill
+
+    reset_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+    eng = get_engine()
+    metadata.drop_all(eng)
+    catalog = Catalog(cfg)
+    populate(eng, cfg, catalog)
+    rebuild_global()
+    backfill()
+    partitions.ARCHIVE_DIR = os.path.join(tmp, "archive")
+    shared_day = build_similarity(cfg, os.path.join(tmp, "similarity"))["shared_day"]
+
+    rec = Recorder()
+    # read routes run on the mode=ro engine, watch both
+    engines = {id(e): e for e in (eng, get_read_engine())}.values()
+    for e in engines:
+        event.listen(e, "before_cursor_execute", rec.before_execute)
+    client = create_app().test_client()
+    uid = user_ids(cfg)[0]
+    archived: Dict[str, int] = {}
+    try:
+        with FakeSpotify() as fake:
+            fake.use()
+            for phase, hot_months in PHASES:
+                rec.phase = phase
+                if hot_months is not None:
+                    rec.label = "archive"
+                    for e in engines:
+                        event.remove(e, "before_cursor_execute", rec.before_execute)
+                    archived[phase] = len(partitions.archive_cold(hot_months=hot_months))
+                    for e in engines:
+                        event.listen(e, "before_cursor_execute", rec.before_execute)
+                _run_routes(rec, client, cfg, uid, shared_day)
+                _run_sync(rec, fake, cfg, catalog, uid)
+    finally:
+        for e in engines:
+            if event.contains(e, "before_cursor_execute", rec.before_execute):
+                event.remove(e, "before_cursor_execute", rec.before_execute)
+
+    statements = []
+    for entry in rec.plans.values():
+        entry.update(classify(entry["sql"], entry["plan"]))
+        statements.append(entry)
+    statements.sort(key=lambda e: (not e["fail"], e["seen_in"][0], e["sql"]))
+    growing = {t.name for t in metadata.sorted_tables if t.name not in SMALL_TABLES}
+    return {
+        "archived_months": archived,
+        "statements": statements,
+        "failures": sum(1 for e in statements if e["fail"]),
+        "temp_btrees": sum(len(e["temp"]) for e in statements),
+        "unused_indexes": _unused_indexes(statements, growing),
+        "errors": rec.errors,
+        "sqlite": __import__("sqlite3").sqlite_version,
+    }
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN guard for the hot statements")
+    p.add_argument("--users", type=int, default=4)
+    p.add_argument("--years", type=float, default=1.5)
+    p.add_argument("--verbose", action="store_true", help="print every plan, not just failures")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(cfg, tmp)
+        reset_engine()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    for e in result["statements"]:
+        if e["fail"] or args.verbose:
+            print(f"{'FAIL' if e['fail'] else 'ok  '} [{', '.join(e['seen_in'][:4])}] {e['sql'][:160]}")
+            for line in e["plan"]:
+                print(f"       {line}")
+    for err in result["errors"]:
+        print(f"error {err}")
+    print(
+        f"statements={len(result['statements'])} failures={result['failures']} "
+        f"bounded_temp_btrees={result['temp_btrees']} archived={result['archived_months']} sqlite={result['sqlite']}"
+    )
+    if result["unused_indexes"]:
+        print(f"unused indexes: {', '.join(result['unused_indexes'])}")
+    sys.exit(1 if result["failures"] or result["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
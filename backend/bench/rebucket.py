@@ -0,0 +1,91 @@
+"""
+Timezone change cost against history size:
+- builds one synthetic database per history length
+- re-buckets one user's daily_totals into several zones from the 15
+  minute base (what PUT /api/settings/timezone does)
+- compares with recomputing every day from plays through rollup_days
+- checks the UTC re-bucket matches the rows populate() wrote
+
+Usage: python -m backend.bench.rebucket --years 1 3 5 --out rebucket.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select
+
+from ..models import get_engine, reset_engine, metadata, daily_totals, user_track_quarter
+from ..services import timezones
+from ..services.rollups import rollup_days
+from .run import timed
+from .synth import SynthConfig, populate, user_ids
+
+ZONES = ("America/Los_Angeles", "Asia/Kolkata", "Australia/Lord_Howe", "UTC")
+
+def _snapshot(uid: str) -> List[tuple]:
+    with get_engine().begin() as conn:
+        return [tuple(r) for r in conn.execute(
+            select(daily_totals.c.day, daily_totals.c.minutes_listened, daily_totals.c.repeats, daily_totals.c.skips,
+                   daily_totals.c.top_track_id)
+            .where(daily_totals.c.user_id == uid).order_by(daily_totals.c.day)
+        )]
+
+def run_one(cfg: SynthConfig, repeat: int, tmp: str) -> Dict[str, Any]:
+    reset_engine(f"sqlite:///{os.path.join(tmp, f'r{cfg.years}.db')}")
+    eng = get_engine()
+    metadata.drop_all(eng)
+    dataset = populate(eng, cfg)
+    uid = user_ids(cfg)[0]
+    with eng.begin() as conn:
+        base_rows = conn.execute(
+            select(func.count()).select_from(user_track_quarter).where(user_track_quarter.c.user_id == uid)
+        ).scalar()
+
+    written = _snapshot(uid)
+    out: Dict[str, Any] = {"years": cfg.years, "plays": dataset["plays"] // cfg.users, "base_rows": base_rows}
+    for tz in ZONES:
+        def go(tz=tz):
+            with eng.begin() as conn:
+                timezones.rebucket(conn, uid, tz)
+        out[f"rebucket_{tz}"] = timed(go, repeat)
+    # ties on top_track_id may break differently, compare the numeric fields
+    out["utc_matches_populate"] = [r[:4] for r in _snapshot(uid)] == [r[:4] for r in written]
+
+    end = cfg.end_dt()
+    n_days = int((end - cfg.start_dt()).days) + 1
+    all_days = [end - timedelta(days=i) for i in range(n_days, -1, -1)]
+    out["recompute_from_plays"] = timed(lambda: rollup_days(uid, all_days), max(1, repeat // 5))
+    reset_engine()
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Timezone re-bucket cost vs history size")
+    p.add_argument("--years", type=float, nargs="+", default=[1, 3, 5])
+    p.add_argument("--users", type=int, default=1)
+    p.add_argument("--plays-per-day", type=int, default=40)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for years in args.years:
+            cfg = SynthConfig(users=args.users, years=years, plays_per_day=args.plays_per_day)
+            results.append(run_one(cfg, args.repeat, tmp))
+
+    text = json.dumps({"zones": list(ZONES), "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    for r in results:
+        cells = "  ".join(f"{tz}={r[f'rebucket_{tz}']['median_ms']:.1f}ms" for tz in ZONES)
+        print(f"years={r['years']:<4} plays={r['plays']:<7} base_rows={r['base_rows']:<7} {cells}  "
+              f"recompute={r['recompute_from_plays']['median_ms']:.1f}ms  utc_ok={r['utc_matches_populate']}")
+
+if __name__ == "__main__":
+    main()
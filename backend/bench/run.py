@@ -0,0 +1,283 @@
+"""
+Benchmark runner:
+- builds a synthetic database in a temp dir
+- times sync_recent_core against the fake Spotify server
+- times rollup_days over the last 30 days
+- builds each user's similarity index, then times every /api/* route but
+  the open ended /api/live event stream through the Flask test client
+- writes results as JSON for comparing commits
+
+Usage: python -m backend.bench.run --users 3 --years 2 --out bench.json
+PostgreSQL: add --throwaway-pg, or --database-url for an existing scratch db
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from ..models import get_engine, reset_engine, metadata
+from ..services.aggregates import rebuild_global
+from ..services.sessions import backfill as sessions_backfill
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+from .fake_spotify import FakeSpotify
+
+def timed(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return summarize(samples)
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    p95 = s[min(len(s) - 1, int(round(0.95 * (len(s) - 1))))]
+    return {
+        "n": len(s),
+        "min_ms": round(s[0], 3),
+        "median_ms": round(statistics.median(s), 3),
+        "mean_ms": round(statistics.fmean(s), 3),
+        "p95_ms": round(p95, 3),
+        "max_ms": round(s[-1], 3),
+    }
+
+def _git_rev() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def bench_sync(cfg: SynthConfig, catalog: Catalog, cursors: Dict[str, datetime], repeat: int) -> Dict[str, Any]:
+    from ..services.ingest import sync_recent_core
+
+    samples: List[float] = []
+    new_plays = 0
+    with FakeSpotify() as fake:
+        fake.use()
+        for uid in user_ids(cfg):
+            start = cursors.get(uid, cfg.end_dt()) + timedelta(minutes=5)
+            stream = Listener(cfg, catalog, uid, start)
+            for _ in range(repeat):
+                fake.push(uid, [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+                t0 = time.perf_counter()
+                counts, _days = sync_recent_core(uid, uid)
+                samples.append((time.perf_counter() - t0) * 1000.0)
+                new_plays += counts["new_plays"]
+        api_calls = fake.requests
+    out = summarize(samples)
+    out.update({"new_plays": new_plays, "api_calls": api_calls})
+    return out
+
+def bench_rollup(cfg: SynthConfig, repeat: int) -> Dict[str, Any]:
+    from ..services.rollups import rollup_days
+
+    end = cfg.end_dt()
+    days = [end - timedelta(days=i) for i in range(30, 0, -1)]
+    users = user_ids(cfg)
+    i = 0
+
+    def one():
+        nonlocal i
+        rollup_days(users[i % len(users)], days)
+        i += 1
+
+    out = timed(one, repeat)
+    out["days_per_call"] = len(days)
+    return out
+
+def build_similarity(cfg: SynthConfig, index_dir: str) -> Dict[str, Any]:
+    """
+    Every user's similarity index under index_dir, the /api/similar/* and
+    /api/revisit routes answer 404 without one. Returns the seconds taken
+    and the latest day every user has plays on.
+    """
+    from ..services import similarity
+
+    similarity.SIMILARITY_DIR = index_dir
+    t0 = time.perf_counter()
+    shared = None
+    for uid in user_ids(cfg):
+        similarity.build(uid)
+        days = {int(d) for d in similarity.load(uid).days}
+        shared = days if shared is None else shared & days
+    day = date(1970, 1, 1) + timedelta(days=max(shared)) if shared else None
+    return {"seconds": time.perf_counter() - t0, "shared_day": day}
+
+def api_routes(cfg: SynthConfig, day: Optional[date] = None) -> Dict[str, str]:
+    """
+    One path per /api/* GET route but /api/live, the similarity ones on
+    the catalog's most popular track and on day (default the last full
+    day, which a user may not have played on).
+    """
+    end = cfg.end_dt()
+    year_ago = (end - timedelta(days=365)).date().isoformat()
+    day = day or (end - timedelta(days=1)).date()
+    return {
+        "recent": "/api/recent",
+        "summary_last30": "/api/summary/last30",
+        "heatmap_30d": "/api/heatmap",
+        "heatmap_1y": f"/api/heatmap?start={year_ago}&end={end.date().isoformat()}",
+        "heatmap_1y_stream": f"/api/heatmap?start={year_ago}&end={end.date().isoformat()}&stream=1",
+        "most_skipped_30d": "/api/most-skipped?window=30d",
+        "most_skipped_365d": "/api/most-skipped?window=365d",
+        "export_last30": "/api/export/last30.csv",
+        "global_top_tracks_30d": "/api/global/top-tracks?window=30d",
+        "global_top_artists_365d": "/api/global/top-artists?window=365d",
+        "similar_users": "/api/similar-users",
+        "sessions_7d": "/api/sessions",
+        "sessions_1y": f"/api/sessions?start={year_ago}&end={end.date().isoformat()}",
+        "streaks": "/api/streaks",
+        "settings_timezone": "/api/settings/timezone",
+        "top_tracks": "/api/top/tracks?range=short_term",
+        "top_movement": "/api/top/artists/movement?range=long_term&window=all&points=4",
+        "similar_tracks": "/api/similar/tracks/trk0000000",
+        "similar_days": f"/api/similar/days/{day.isoformat()}",
+        "revisit": "/api/revisit",
+        "year_in_review": f"/api/year-in-review/{end.year - 1}",
+    }
+
+def bench_routes(cfg: SynthConfig, repeat: int, day: Optional[date] = None) -> Dict[str, Any]:
+    from ..app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    users = user_ids(cfg)
+    results: Dict[str, Any] = {}
+    for name, path in api_routes(cfg, day).items():
+        i = 0
+        status: Dict[int, int] = {}
+        size = 0
+
+        def one():
+            nonlocal i, size
+            with client.session_transaction() as s:
+                s["user_id"] = users[i % len(users)]
+            resp = client.get(path)
+            status[resp.status_code] = status.get(resp.status_code, 0) + 1
+            size = len(resp.data)
+            i += 1
+
+        stats = timed(one, repeat)
+        stats.update({"path": path, "status": {str(k): v for k, v in status.items()}, "bytes": size})
+        results[name] = stats
+    return results
+
+def _db_bytes(eng) -> int:
+    if eng.dialect.name == "sqlite":
+        return os.path.getsize(eng.url.database)
+    if eng.dialect.name == "postgresql":
+        with eng.connect() as conn:
+            return int(conn.exec_driver_sql("SELECT pg_database_size(current_database())").scalar())
+    return -1
+
+def run(cfg: SynthConfig, repeat: int, url: str, importtime: bool = True) -> Dict[str, Any]:
+    reset_engine(url)
+    eng = get_engine()
+    metadata.drop_all(eng)
+    catalog = Catalog(cfg)
+    t0 = time.perf_counter()
+    dataset = populate(eng, cfg, catalog)
+    populate_s = time.perf_counter() - t0
+    cursors = dataset.pop("cursors")
+    t0 = time.perf_counter()
+    rebuild_global()
+    rebuild_global_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    sessions_backfill()
+    sessions_backfill_s = time.perf_counter() - t0
+
+    results: Dict[str, Any] = {}
+    results["rollup_days_30"] = bench_rollup(cfg, repeat)
+    with tempfile.TemporaryDirectory() as index_dir:
+        built = build_similarity(cfg, index_dir)
+        results["routes"] = bench_routes(cfg, repeat, built["shared_day"])
+    # sync last since it appends plays past the end of the generated history
+    results["sync_recent_core"] = bench_sync(cfg, catalog, cursors, repeat)
+    if importtime:
+        from .importtime import run as importtime_run
+        results["importtime"] = importtime_run()
+
+    cfg_out = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in vars(cfg).items()}
+    return {
+        "meta": {
+            "git_rev": _git_rev(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "backend": eng.dialect.name,
+            "config": cfg_out,
+        },
+        "dataset": dict(
+            dataset,
+            populate_s=round(populate_s, 3),
+            rebuild_global_s=round(rebuild_global_s, 3),
+            sessions_backfill_s=round(sessions_backfill_s, 3),
+            similarity_build_s=round(built["seconds"], 3),
+            db_bytes=_db_bytes(eng),
+        ),
+        "results": results,
+    }
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run backend benchmarks on synthetic data")
+    p.add_argument("--users", type=int, default=3)
+    p.add_argument("--years", type=float, default=1.0)
+    p.add_argument("--tracks", type=int, default=5_000)
+    p.add_argument("--artists", type=int, default=800)
+    p.add_argument("--zipf", type=float, default=1.1)
+    p.add_argument("--plays-per-day", type=int, default=40)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--db", default=None, help="sqlite file to build, default is a temp file")
+    p.add_argument("--database-url", default=None, help="throwaway database to use instead, all app tables are dropped")
+    p.add_argument("--throwaway-pg", action="store_true", help="start a temporary PostgreSQL cluster for the run")
+    p.add_argument("--no-importtime", action="store_true", help="skip the entry point import time runs")
+    p.add_argument("--out", default=None, help="write JSON results here")
+    return p.parse_args(argv)
+
+def config_from_args(args: argparse.Namespace) -> SynthConfig:
+    return SynthConfig(
+        users=args.users,
+        years=args.years,
+        catalog_tracks=args.tracks,
+        catalog_artists=args.artists,
+        zipf_s=args.zipf,
+        plays_per_day=args.plays_per_day,
+        seed=args.seed,
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = config_from_args(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.throwaway_pg:
+            from .throwaway_pg import throwaway_pg
+            with throwaway_pg() as url:
+                report = run(cfg, args.repeat, url, importtime=not args.no_importtime)
+                reset_engine()
+        else:
+            url = args.database_url or f"sqlite:///{args.db or os.path.join(tmp, 'bench.db')}"
+            report = run(cfg, args.repeat, url, importtime=not args.no_importtime)
+            reset_engine()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
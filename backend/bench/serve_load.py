@@ -0,0 +1,161 @@
+"""
+Load test for the prefork server:
+- builds one synthetic SQLite database
+- starts python -m backend.serve at each worker count, with and without
+  the shared cache
+- closed loop client processes hit the per user API routes with signed
+  session cookies for a fixed duration
+- reports requests/sec, p50 and p99 per configuration
+
+Usage: python -m backend.bench.serve_load --workers 1 2 4 --clients 16 --seconds 10
+"""
+
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import get_engine, reset_engine, metadata
+from .run import summarize
+from .synth import SynthConfig, populate, user_ids
+
+PATHS = (
+    "/api/summary/last30",
+    "/api/heatmap",
+    "/api/most-skipped?window=30d",
+    "/api/streaks",
+    "/api/sessions",
+    "/api/recent",
+)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def session_cookies(uids: List[str]) -> Dict[str, str]:
+    from ..app import create_app
+
+    app = create_app()
+    ser = app.session_interface.get_signing_serializer(app)
+    return {uid: ser.dumps({"user_id": uid}) for uid in uids}
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            c = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            c.request("GET", "/")
+            if c.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not come up")
+
+def _client(args: Tuple[int, List[str], float, int]) -> Tuple[List[float], int]:
+    port, cookies, seconds, seed = args
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    samples: List[float] = []
+    errors = 0
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        path = rng.choice(PATHS)
+        headers = {"Cookie": f"session={rng.choice(cookies)}"}
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    conn.close()
+    return samples, errors
+
+def load(port: int, cookies: List[str], clients: int, seconds: float) -> Dict[str, Any]:
+    with multiprocessing.Pool(clients) as pool:
+        t0 = time.perf_counter()
+        parts = pool.map(_client, [(port, cookies, seconds, i) for i in range(clients)])
+        wall = time.perf_counter() - t0
+    samples = [s for part, _ in parts for s in part]
+    s = sorted(samples)
+    p99 = s[min(len(s) - 1, int(round(0.99 * (len(s) - 1))))] if s else 0.0
+    return dict(
+        summarize(samples) if samples else {"n": 0},
+        rps=round(len(samples) / wall, 1),
+        p99_ms=round(p99, 3),
+        errors=sum(e for _, e in parts),
+    )
+
+def serve(db_url: str, workers: int, threads: int, cache_path: str, extra_env: Optional[Dict[str, str]] = None):
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=db_url, SHARED_CACHE_PATH=cache_path, **(extra_env or {}))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "backend.serve", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(port)
+    except Exception:
+        proc.kill()
+        raise
+    return proc, port
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Requests/sec and p99 across worker counts")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--threads", type=int, default=1)
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--years", type=float, default=1.0)
+    p.add_argument("--no-cache", action="store_true", help="only run without the shared cache")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = SynthConfig(users=args.users, years=args.years)
+        db_url = f"sqlite:///{os.path.join(tmp, 'serve.db')}"
+        reset_engine(db_url)
+        metadata.drop_all(get_engine())
+        populate(get_engine(), cfg)
+        reset_engine()
+        cookies = list(session_cookies(user_ids(cfg)).values())
+
+        modes = [False] if args.no_cache else [False, True]
+        for workers in args.workers:
+            for cached in modes:
+                cache_path = os.path.join(tmp, f"cache{workers}.db") if cached else ""
+                proc, port = serve(db_url, workers, args.threads, cache_path)
+                try:
+                    r = load(port, cookies, args.clients, args.seconds)
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+                results.append({"workers": workers, "threads": args.threads, "cache": cached, **r})
+                print(f"workers={workers:<3} cache={'on ' if cached else 'off'} rps={r['rps']:<8} "
+                      f"p50={r.get('median_ms', 0):.1f}ms p99={r['p99_ms']:.1f}ms errors={r['errors']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps({"clients": args.clients, "seconds": args.seconds, "results": results}, indent=2) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Similarity index build, query and update cost:
+- builds a synthetic database and indexes every user, reporting build
+  time, pairs, days and bytes on disk
+- times the three lookups warm (arrays mapped) and cold (first load of
+  a freshly published version), and the routes end to end
+- times a naive answer to the same questions: a windowed self join over
+  plays in SQL for similar tracks, artist minutes per day in SQL and a
+  cosine over every day in Python for similar days
+- syncs batches of 50 plays from the fake Spotify and times update()
+  against a full build, then checks the updated index equals a rebuild
+
+Usage: python -m backend.bench.similarity --users 5 --years 2 --out similarity.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from ..models import get_engine, get_read_engine, reset_engine, metadata
+from ..services import similarity
+from ..services.ingest import sync_recent_core
+from ..services.rollups import rollup_days
+from .fake_spotify import FakeSpotify
+from .run import summarize, timed
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+_SQL_SIMILAR_TRACKS = text("""
+    WITH seq AS (
+        SELECT track_id, ROW_NUMBER() OVER (ORDER BY played_at) AS rn FROM plays WHERE user_id = :user_id
+    )
+    SELECT b.track_id, COUNT(*) AS together
+    FROM seq a JOIN seq b ON b.rn BETWEEN a.rn - :w AND a.rn + :w AND b.rn != a.rn
+    WHERE a.track_id = :track_id AND b.track_id != :track_id
+    GROUP BY b.track_id ORDER BY together DESC LIMIT :limit
+""")
+
+_SQL_DAY_ARTISTS = text("""
+    SELECT date(p.played_at) AS day, t.artist_id, SUM(COALESCE(p.elapsed_ms, 0)) AS ms
+    FROM plays p JOIN tracks t ON t.track_id = p.track_id
+    WHERE p.user_id = :user_id GROUP BY day, t.artist_id
+""")
+
+def _naive_similar_days(user_id: str, day: str, limit: int) -> List[Any]:
+    with get_read_engine().connect() as conn:
+        rows = conn.execute(_SQL_DAY_ARTISTS, {"user_id": user_id}).fetchall()
+    vectors: Dict[str, Dict[str, float]] = {}
+    for d, a, ms in rows:
+        vectors.setdefault(d, {})[a] = float(ms)
+    norm = {d: math.sqrt(sum(v * v for v in vec.values())) for d, vec in vectors.items()}
+    me = vectors.get(day, {})
+    sims = []
+    for d, vec in vectors.items():
+        if d != day and norm[d] and norm.get(day):
+            sims.append((sum(v * me.get(a, 0.0) for a, v in vec.items()) / (norm[d] * norm[day]), d))
+    return sorted(sims, reverse=True)[:limit]
+
+def _pairs(idx) -> Dict[Any, int]:
+    import numpy as np
+
+    ids = idx.track_ids
+    rows = np.repeat(np.arange(len(idx.plays)), np.diff(idx.indptr))
+    return {(str(ids[r]), str(ids[c])): int(n) for r, c, n in zip(rows, idx.indices, idx.counts)}
+
+def _same(a, b) -> bool:
+    import numpy as np
+
+    by_id = lambda idx, arr: {str(t): int(v) for t, v in zip(idx.track_ids, arr)}
+    return (
+        _pairs(a) == _pairs(b)
+        and by_id(a, a.plays) == by_id(b, b.plays)
+        and by_id(a, a.last_ms) == by_id(b, b.last_ms)
+        and np.array_equal(a.days, b.days)
+        and np.array_equal(a.day_minutes, b.day_minutes)
+        and a.through_ms == b.through_ms
+    )
+
+def main(argv=None):
+    import numpy as np
+
+    p = argparse.ArgumentParser(description="Similarity index build, query and update cost")
+    p.add_argument("--users", type=int, default=5)
+    p.add_argument("--years", type=float, default=2.0)
+    p.add_argument("--repeat", type=int, default=50)
+    p.add_argument("--batches", type=int, default=5, help="syncs of 50 plays folded in with update()")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years)
+    catalog = Catalog(cfg)
+    uids = user_ids(cfg)
+    result: Dict[str, Any] = {"users": args.users, "years": args.years, "cooc_window": similarity.COOC_WINDOW,
+                              "day_artists": similarity.DAY_ARTISTS}
+
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotify() as fake:
+        fake.use()
+        reset_engine(f"sqlite:///{os.path.join(tmp, 'similarity.db')}")
+        metadata.drop_all(get_engine())
+        cursors = populate(get_engine(), cfg, catalog)["cursors"]
+        similarity.SIMILARITY_DIR = os.path.join(tmp, "index")
+
+        builds, metas = [], []
+        for uid in uids:
+            t0 = time.perf_counter()
+            metas.append(similarity.build(uid))
+            builds.append((time.perf_counter() - t0) * 1000.0)
+        result["build"] = summarize(builds)
+        result["index"] = {k: int(np.mean([m[k] for m in metas])) for k in ("tracks", "pairs", "days", "bytes")}
+
+        uid = uids[0]
+        idx = similarity.load(uid)
+        top_track = str(idx.track_ids[int(np.argmax(idx.plays))])
+        busiest = date(1970, 1, 1) + timedelta(days=int(idx.days[int(np.argmax(idx.day_minutes))]))
+        queries = {
+            "similar_tracks": lambda: similarity.similar_tracks(uid, top_track, 10),
+            "revisit": lambda: similarity.revisit(uid, 20),
+            "similar_days": lambda: similarity.similar_days(uid, busiest, 10),
+        }
+        result["warm"] = {name: timed(fn, args.repeat) for name, fn in queries.items()}
+
+        def cold(fn):
+            similarity._indexes.clear()
+            fn()
+        result["cold"] = {name: timed(lambda: cold(fn), max(args.repeat // 5, 3)) for name, fn in queries.items()}
+
+        params = {"user_id": uid, "track_id": top_track, "w": similarity.COOC_WINDOW - 1, "limit": 10}
+        with get_read_engine().connect() as conn:
+            result["naive"] = {
+                "sql_similar_tracks": timed(lambda: conn.execute(_SQL_SIMILAR_TRACKS, params).fetchall(), 3, warmup=0),
+            }
+        result["naive"]["sql_similar_days"] = timed(lambda: _naive_similar_days(uid, busiest.isoformat(), 10), 3)
+
+        from ..app import create_app
+
+        client = create_app().test_client()
+        with client.session_transaction() as s:
+            s["user_id"] = uid
+        routes = {
+            "similar_tracks": f"/api/similar/tracks/{top_track}",
+            "revisit": "/api/revisit",
+            "similar_days": f"/api/similar/days/{busiest.isoformat()}",
+        }
+        status: Dict[str, int] = {}
+
+        def get(name, path):
+            status[name] = client.get(path).status_code
+        result["routes"] = {name: dict(timed(lambda: get(name, path), args.repeat), status=status.get(name))
+                            for name, path in routes.items()}
+
+        stream = Listener(cfg, catalog, uid, cursors[uid] + timedelta(minutes=5))
+        updates: List[float] = []
+        for _ in range(args.batches):
+            fake.push(uid, [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+            _counts, days = sync_recent_core(uid, uid)
+            rollup_days(uid, days)
+            t0 = time.perf_counter()
+            similarity.update(uid)
+            updates.append((time.perf_counter() - t0) * 1000.0)
+        result["update_50_plays"] = summarize(updates)
+        updated = similarity.load(uid)
+
+        similarity.SIMILARITY_DIR = os.path.join(tmp, "rebuilt")
+        similarity._indexes.clear()
+        t0 = time.perf_counter()
+        similarity.build(uid)
+        result["rebuild_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        result["update_matches_rebuild"] = _same(updated, similarity.load(uid))
+        reset_engine()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    print(json.dumps(result, indent=2))
+    if not result["update_matches_rebuild"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Approximate against exact long window analytics:
+- builds a synthetic history and every month's sketch
+- for each window runs the exact GROUP BY queries and the sketch merge
+- reports latency for both and the observed errors: top list recall,
+  count errors against the per item bounds, distinct track error
+- exits non-zero when any true value falls outside a reported bound, a
+  top list recall is under --min-recall (0.9) or the distinct track
+  error is over --max-distinct-error (5%)
+
+Usage: python -m backend.bench.sketches --years 3 --windows 30 365 all
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from ..models import get_engine, reset_engine, metadata
+from ..services import sketches, statements
+from ..services.partitions import plays_source
+from .run import timed
+from .synth import SynthConfig, populate, user_ids
+
+TOP = 20
+
+def _exact(uid: str, start: datetime, end: datetime) -> Dict[str, Any]:
+    with get_engine().begin() as conn:
+        p = plays_source(conn, start, end, user_id=uid)
+        params = {"user_id": uid, "start": start, "end": end}
+        t = conn.execute(statements.window_totals(p), params).one()
+        rows = conn.execute(statements.track_counts(p), params).fetchall()
+    artist_ms: Dict[str, int] = {}
+    for r in rows:
+        artist_ms[r.artist_id] = artist_ms.get(r.artist_id, 0) + int(r.ms)
+    return {
+        "plays": int(t.plays), "ms": int(t.ms), "skips": int(t.skips), "distinct": int(t.distinct_tracks),
+        "track_ms": {r.track_id: int(r.ms) for r in rows},
+        "track_skips": {r.track_id: int(r.skips) for r in rows},
+        "track_plays": {r.track_id: int(r.plays) for r in rows},
+        "artist_ms": artist_ms,
+    }
+
+def _approx(uid: str, start: Optional[datetime], end: datetime) -> sketches.Sketch:
+    with get_engine().begin() as conn:
+        return sketches.window(conn, uid, start, end)
+
+def _check(ss: sketches.SpaceSaving, truth: Dict[str, int]) -> Dict[str, Any]:
+    top = ss.top(TOP)
+    exact_top = sorted(truth.items(), key=lambda kv: (-kv[1], kv[0]))[:TOP]
+    # ties at the cut make several top lists equally right, compare values
+    cut = exact_top[-1][1] if exact_top else 0
+    listed = {k for k, _, _ in top}
+    must = {k for k, v in exact_top if v > cut}
+    violations = sum(1 for k, c, e in top if not (c - e <= truth.get(k, 0) <= c))
+    violations += sum(1 for k, v in truth.items() if k not in ss.entries and v > ss.floor)
+    return {
+        "recall": round(len(must & listed) / len(must), 3) if must else 1.0,
+        "max_abs_error": max((c - truth.get(k, 0) for k, c, _ in top), default=0),
+        "max_bound": max((e for _, _, e in top), default=0),
+        "floor": ss.floor,
+        "bound_violations": violations,
+    }
+
+def run_window(uid: str, days: Optional[int], end: datetime, repeat: int) -> Dict[str, Any]:
+    start = end - timedelta(days=days) if days else datetime(1970, 1, 1, tzinfo=end.tzinfo)
+    exact = _exact(uid, start, end)
+    sk = _approx(uid, start if days else None, end)
+    cm_bound = sketches.cm_error(sk.plays)
+    cm_errors = [sk.track_counts(t)[0] - n for t, n in exact["track_plays"].items()]
+    out = {
+        "window_days": days,
+        "plays": exact["plays"],
+        "totals_exact": (sk.plays, sk.ms, sk.skips) == (exact["plays"], exact["ms"], exact["skips"]),
+        "distinct_exact": exact["distinct"],
+        "distinct_estimate": sk.distinct_tracks(),
+        "distinct_rel_error": round(abs(sk.distinct_tracks() - exact["distinct"]) / max(exact["distinct"], 1), 4),
+        "top_tracks_ms": _check(sk.track_ms, exact["track_ms"]),
+        "top_tracks_skips": _check(sk.track_skips, exact["track_skips"]),
+        "top_artists_ms": _check(sk.artist_ms, exact["artist_ms"]),
+        "cm_plays_max_error": max(cm_errors, default=0),
+        "cm_plays_bound": round(cm_bound, 1),
+        # Count-Min never underestimates, over the bound is allowed with probability e^-DEPTH per item
+        "cm_plays_over_bound": sum(1 for e in cm_errors if e > cm_bound),
+        "cm_plays_under": sum(1 for e in cm_errors if e < 0),
+    }
+    out["exact"] = timed(lambda: _exact(uid, start, end), repeat)
+    out["approx"] = timed(lambda: _approx(uid, start if days else None, end), repeat)
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Sketch accuracy and latency against exact queries")
+    p.add_argument("--years", type=float, default=3.0)
+    p.add_argument("--users", type=int, default=1)
+    p.add_argument("--plays-per-day", type=int, default=60)
+    p.add_argument("--windows", nargs="+", default=["30", "365", "730", "all"])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--min-recall", type=float, default=0.9, help="fail when a top list recall is lower")
+    p.add_argument("--max-distinct-error", type=float, default=0.05, help="fail when the distinct track error is higher")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years, plays_per_day=args.plays_per_day)
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_engine(f"sqlite:///{os.path.join(tmp, 'sketch.db')}")
+        metadata.drop_all(get_engine())
+        populate(get_engine(), cfg)
+        uid = user_ids(cfg)[0]
+        with get_engine().begin() as conn:
+            months = sketches.rebuild(conn, uid)
+        for w in args.windows:
+            results.append(run_window(uid, None if w == "all" else int(w), cfg.end_dt(), args.repeat))
+        reset_engine()
+
+    text = json.dumps({"years": args.years, "months": months, "capacity": sketches.CAPACITY, "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    bad = 0
+    lists = ("top_tracks_ms", "top_tracks_skips", "top_artists_ms")
+    for r in results:
+        bad += sum(r[k]["bound_violations"] for k in lists) + r["cm_plays_under"]
+        bad += 0 if r["totals_exact"] else 1
+        bad += sum(1 for k in lists if r[k]["recall"] < args.min_recall)
+        bad += 1 if r["distinct_rel_error"] > args.max_distinct_error else 0
+        print(
+            f"window={str(r['window_days'] or 'all'):<5} plays={r['plays']:<7} "
+            f"exact={r['exact']['median_ms']:.1f}ms approx={r['approx']['median_ms']:.1f}ms "
+            f"recall tracks={r['top_tracks_ms']['recall']} skips={r['top_tracks_skips']['recall']} artists={r['top_artists_ms']['recall']} "
+            f"distinct_err={r['distinct_rel_error']:.2%} cm_err={r['cm_plays_max_error']}/{r['cm_plays_bound']}"
+        )
+    if bad:
+        print(f"{bad} values outside their reported bounds or tolerances")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Load test for /api/live:
+- builds a synthetic SQLite database and a fake Spotify with a token endpoint
+- starts python -m backend.serve with gthread workers and a short poll interval
+- opens hundreds of SSE clients spread over a few users
+- pushes one new play per user at a fixed rate and times push -> delta
+- reports delivery, latency p50/p99, Spotify calls against the
+  one-poll-per-client worst case, and worker memory
+
+Usage: python -m backend.bench.sse_load --clients 300 --users 10 --seconds 20
+"""
+
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from ..models import get_engine, reset_engine, metadata
+from .fake_spotify import FakeSpotify
+from .run import summarize
+from .serve_load import _free_port, _wait_ready, session_cookies
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+class Client(threading.Thread):
+    def __init__(self, port: int, user_id: str, cookie: str, stop: threading.Event):
+        super().__init__(daemon=True)
+        self.port, self.user_id, self.cookie, self.stop = port, user_id, cookie, stop
+        self.connected = threading.Event()
+        self.received: List[Tuple[str, float]] = []
+        self.error = None
+
+    def run(self):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            conn.request("GET", "/api/live", headers={"Cookie": f"session={self.cookie}", "Accept": "text/event-stream"})
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise RuntimeError(f"status {resp.status}")
+            event = None
+            while not self.stop.is_set():
+                line = resp.fp.readline()
+                if not line:
+                    break
+                line = line.decode().rstrip("\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "hello":
+                        self.connected.set()
+                    elif event == "delta":
+                        self.received.append((data["cursor"], time.perf_counter()))
+            conn.close()
+        except Exception as e:  # reported in the summary
+            self.error = repr(e)
+            self.connected.set()
+
+def _cursor_key(item: Dict[str, Any]) -> str:
+    # same text the server sends, millisecond precision in UTC
+    return datetime.fromisoformat(item["played_at"].replace("Z", "+00:00")).isoformat()
+
+def _rss_kb(pid: int) -> int:
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(x) for x in f.read().split()]
+    except OSError:
+        return 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="SSE fan out load test")
+    p.add_argument("--clients", type=int, default=300)
+    p.add_argument("--users", type=int, default=10)
+    p.add_argument("--seconds", type=float, default=20.0)
+    p.add_argument("--push-every", type=float, default=2.0, help="seconds between new plays per user")
+    p.add_argument("--poll", type=int, default=1, help="LIVE_POLL_SECONDS for the server")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--shared-cache", action="store_true", help="set SHARED_CACHE_PATH so workers share poll leases")
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotify() as fake:
+        cfg = SynthConfig(users=args.users, years=0.1)
+        catalog = Catalog(cfg)
+        db_url = f"sqlite:///{os.path.join(tmp, 'live.db')}"
+        reset_engine(db_url)
+        metadata.drop_all(get_engine())
+        cursors = populate(get_engine(), cfg, catalog)["cursors"]
+        reset_engine()
+        uids = user_ids(cfg)
+        cookies = session_cookies(uids)
+
+        port = _free_port()
+        env = dict(
+            os.environ, DATABASE_URL=db_url, SPOTIFY_API_BASE=fake.base_url, SPOTIFY_TOKEN_URL=fake.token_url,
+            LIVE_POLL_SECONDS=str(args.poll), LIVE_HEARTBEAT_SECONDS="5",
+            SHARED_CACHE_PATH=os.path.join(tmp, "cache.db") if args.shared_cache else "",
+        )
+        threads = args.clients // args.workers + 32
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "backend.serve", "--bind", f"127.0.0.1:{port}",
+             "--workers", str(args.workers), "--threads", str(threads)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(port)
+            stop = threading.Event()
+            clients = [Client(port, uids[i % len(uids)], cookies[uids[i % len(uids)]], stop) for i in range(args.clients)]
+            t0 = time.perf_counter()
+            for c in clients:
+                c.start()
+            for c in clients:
+                c.connected.wait(timeout=60)
+            connect_s = time.perf_counter() - t0
+            rss_connected = _rss_kb(proc.pid)
+
+            streams = {u: Listener(cfg, catalog, u, cursors[u] + timedelta(minutes=5)) for u in uids}
+            pushed: Dict[Tuple[str, str], float] = {}
+            polls_before = fake.requests
+            deadline = time.perf_counter() + args.seconds
+            while time.perf_counter() < deadline:
+                for u in uids:
+                    item = to_recent_item(catalog, next(streams[u]))
+                    fake.push(u, [item])
+                    pushed[(u, _cursor_key(item))] = time.perf_counter()
+                time.sleep(args.push_every)
+            time.sleep(args.poll + 2)  # let the last round drain
+            polls = fake.requests - polls_before
+            stop.set()
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    latencies = []
+    delivered = 0
+    for c in clients:
+        for cursor, at in c.received:
+            sent = pushed.get((c.user_id, cursor))
+            if sent is not None:
+                latencies.append((at - sent) * 1000.0)
+                delivered += 1
+    # one play per user per round, each client should see every round
+    rounds = len(pushed) // len(uids)
+    errors = [c.error for c in clients if c.error]
+    result = {
+        "clients": args.clients,
+        "users": args.users,
+        "workers": args.workers,
+        "shared_cache": args.shared_cache,
+        "seconds": args.seconds,
+        "connect_s": round(connect_s, 3),
+        "errors": len(errors),
+        "rounds": rounds,
+        "deltas_received": sum(len(c.received) for c in clients),
+        "deltas_matched": delivered,
+        "latency": summarize(latencies) if latencies else {},
+        "p99_ms": round(sorted(latencies)[int(0.99 * (len(latencies) - 1))], 3) if latencies else None,
+        "spotify_get": polls,
+        # what one poller per connected client would have cost
+        "spotify_get_per_client_polling": int(args.clients * args.seconds / args.poll),
+        "server_rss_kb": rss_connected,
+    }
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if errors:
+        print(f"first error: {errors[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Staged ingest: crash recovery, re-run cost and multi user merges:
+- builds a synthetic database and serves new plays from the fake Spotify
+- stages a batch and "crashes" before the merge, then re-runs the sync
+  and checks plays, elapsed and cursor match an uninterrupted run
+- times a sync with new plays against a re-run with nothing new
+- times merging every user's staged batch in one pass against one
+  merge per user
+
+Usage: python -m backend.bench.staging --users 20 --repeat 10
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select
+
+from ..models import get_engine, reset_engine, metadata, plays, user_info, ingest_staging
+from ..services.ingest import fetch_recent, stage, merge_staged, sync_recent_core
+from .fake_spotify import FakeSpotify
+from .run import summarize, timed
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+def _state(uid: str) -> Dict[str, Any]:
+    with get_engine().begin() as conn:
+        rows = conn.execute(
+            select(plays.c.played_at, plays.c.track_id, plays.c.elapsed_ms, plays.c.is_skip)
+            .where(plays.c.user_id == uid).order_by(plays.c.played_at)
+        ).fetchall()
+        cursor = conn.execute(select(user_info.c.last_recent_cursor).where(user_info.c.user_id == uid)).scalar()
+        staged = conn.execute(select(func.count()).select_from(ingest_staging)).scalar()
+    return {"plays": [tuple(r) for r in rows], "cursor": cursor, "staged": staged}
+
+def _db(tmp: str, name: str, cfg: SynthConfig, catalog: Catalog):
+    reset_engine(f"sqlite:///{os.path.join(tmp, name)}")
+    metadata.drop_all(get_engine())
+    return populate(get_engine(), cfg, catalog)["cursors"]
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Staged ingest recovery and merge cost")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--years", type=float, default=0.1)
+    p.add_argument("--repeat", type=int, default=10)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    cfg = SynthConfig(users=args.users, years=args.years)
+    catalog = Catalog(cfg)
+    uids = user_ids(cfg)
+    result: Dict[str, Any] = {"users": args.users}
+
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotify() as fake:
+        fake.use()
+        # the same 50 new plays for the first user in both databases
+        cursors = _db(tmp, "clean.db", cfg, catalog)
+        stream = Listener(cfg, catalog, uids[0], cursors[uids[0]] + timedelta(minutes=5))
+        fake.push(uids[0], [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+        sync_recent_core(uids[0], uids[0])
+        clean = _state(uids[0])
+
+        _db(tmp, "crash.db", cfg, catalog)
+        before = _state(uids[0])
+        stage(fetch_recent(uids[0], uids[0]))  # process dies here, before the merge
+        crashed = _state(uids[0])
+        counts, _ = sync_recent_core(uids[0], uids[0])
+        recovered = _state(uids[0])
+        rerun, _ = sync_recent_core(uids[0], uids[0])
+        result["recovery"] = {
+            "staged_after_crash": crashed["staged"],
+            "cursor_kept_until_merge": crashed["cursor"] == before["cursor"] and crashed["plays"] == before["plays"],
+            "recovered_new_plays": counts["new_plays"],
+            "matches_uninterrupted": recovered == clean,
+            "rerun_new_plays": rerun["new_plays"],
+        }
+
+        # sync with a fresh batch of 50 against a re-run that finds nothing new
+        streams = {u: Listener(cfg, catalog, u, cursors[u] + timedelta(days=1)) for u in uids}
+        fresh: List[float] = []
+        for i in range(args.repeat):
+            uid = uids[i % len(uids)]
+            fake.push(uid, [to_recent_item(catalog, next(streams[uid])) for _ in range(fake.window)])
+            t0 = time.perf_counter()
+            sync_recent_core(uid, uid)
+            fresh.append((time.perf_counter() - t0) * 1000.0)
+        result["sync_new_batch"] = summarize(fresh)
+        result["sync_rerun_noop"] = timed(lambda: sync_recent_core(uids[0], uids[0]), args.repeat)
+
+        # every user stages a batch, then one merge pass against a merge per user
+        def stage_all():
+            for u in uids:
+                fake.push(u, [to_recent_item(catalog, next(streams[u])) for _ in range(fake.window)])
+                stage(fetch_recent(u, u))
+
+        one_pass, per_user = [], []
+        for _ in range(max(1, args.repeat // 5)):
+            stage_all()
+            t0 = time.perf_counter()
+            merge_staged()
+            one_pass.append((time.perf_counter() - t0) * 1000.0)
+            stage_all()
+            t0 = time.perf_counter()
+            for u in uids:
+                merge_staged([u])
+            per_user.append((time.perf_counter() - t0) * 1000.0)
+        result["merge_all_users_one_pass"] = summarize(one_pass)
+        result["merge_one_per_user"] = summarize(per_user)
+        reset_engine()
+
+    text = json.dumps(result, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    r = result["recovery"]
+    print(f"recovery staged={r['staged_after_crash']} recovered_new={r['recovered_new_plays']} "
+          f"cursor_kept={r['cursor_kept_until_merge']} matches={r['matches_uninterrupted']} rerun_new={r['rerun_new_plays']}")
+    print(f"sync new batch {result['sync_new_batch']['median_ms']:.1f}ms  re-run no-op {result['sync_rerun_noop']['median_ms']:.1f}ms")
+    print(f"merge {args.users} users: one pass {result['merge_all_users_one_pass']['median_ms']:.1f}ms  "
+          f"per user {result['merge_one_per_user']['median_ms']:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Replays synthetic listening traces through sync policies:
+- users get a plays per day drawn from a wide log normal, one or two
+  daily peak hours, binge days and days off, listening in sessions
+- a sync sees only the newest 50 plays at that moment, anything older
+  that was never fetched counts as missed
+- policies: every user on every cron tick (the old jobs.sync), fixed
+  intervals, and the adaptive schedule from services/schedule.py through
+  the same replan() and pick(), with and without a request budget per tick,
+  and under the budget ordered by next due time instead of deadline
+- reports missed plays, Spotify requests, the fullest window a sync saw
+  and the time spent planning
+No database or HTTP, the first --warmup days only seed the history.
+
+Usage: python -m backend.bench.sync_schedule --users 40 --days 21 --out schedule.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import math
+import random
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from ..services import schedule
+
+def _poisson(rng: random.Random, lam: float) -> int:
+    n, p, limit = 0, 1.0, math.exp(-lam)
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return n
+        n += 1
+
+def trace(rng: random.Random, start: datetime, days: int) -> List[datetime]:
+    """
+    One user's play times over days, sorted.
+    """
+    per_day = min(rng.lognormvariate(math.log(25), 1.2), 400.0)
+    peaks = [rng.uniform(0, 24) for _ in range(rng.choice((1, 1, 2)))]
+    shape = []
+    for h in range(24):
+        w = 0.05
+        for p in peaks:
+            d = min(abs(h + 0.5 - p), 24 - abs(h + 0.5 - p))
+            w += math.exp(-d * d / 8.0)
+        shape.append(w)
+    norm = sum(shape)
+    sessions_per_day = per_day / 15.0
+    out: List[datetime] = []
+    busy_until = start
+    for day in range(days):
+        r = rng.random()
+        mult = 3.0 if r < 0.08 else (0.2 if r < 0.28 else 1.0)
+        for h in range(24):
+            hour = start + timedelta(days=day, hours=h)
+            for _ in range(_poisson(rng, sessions_per_day * mult * shape[h] / norm)):
+                t = max(hour + timedelta(seconds=rng.uniform(0, 3600)), busy_until)
+                for _ in range(rng.randint(5, 25)):
+                    out.append(t)
+                    # full plays of 2 to 6 minutes, a fifth skipped early
+                    secs = rng.uniform(5, 40) if rng.random() < 0.2 else rng.uniform(120, 360)
+                    t += timedelta(seconds=secs + rng.uniform(0, 3))
+                busy_until = t
+    out.sort()
+    return out
+
+class User:
+    def __init__(self, times: List[datetime], begin: datetime):
+        self.times = times
+        self.cursor = bisect_right(times, begin)
+        self.history = times[:self.cursor]
+        self.last: Optional[datetime] = begin
+        self.row: Optional[Dict[str, Any]] = None
+
+def simulate(traces: List[List[datetime]], begin: datetime, end: datetime, tick: timedelta,
+             policy: str, every: Optional[timedelta] = None, budget: int = 0, key: str = "deadline") -> Dict[str, Any]:
+    users = [User(t, begin) for t in traces]
+    out = {"policy": policy, "syncs": 0, "requests": 0, "plays": 0, "missed": 0, "users_missing": 0,
+           "max_fill": 0, "plan_us_per_sync": 0.0}
+    plan_s = 0.0
+    missed_by_user = [0] * len(users)
+    t = begin
+    while t < end:
+        t += tick
+        if policy == "adaptive":
+            t0 = time.perf_counter()
+            cands = [((u.row[key] if u.row else begin), i) for i, u in enumerate(users)
+                     if u.row is None or u.row["next_due"] <= t]
+            order = schedule.pick(cands, budget)
+            plan_s += time.perf_counter() - t0
+        else:
+            order = [i for i, u in enumerate(users) if t - u.last >= every]
+        for i in order:
+            u = users[i]
+            j = bisect_right(u.times, t)
+            new = j - u.cursor
+            got = min(new, schedule.WINDOW)
+            missed_by_user[i] += new - got
+            u.history.extend(u.times[j - got:j])
+            u.cursor, u.last = j, t
+            out["syncs"] += 1
+            out["requests"] += schedule.SYNC_COST
+            out["max_fill"] = max(out["max_fill"], got)
+            if policy == "adaptive":
+                t0 = time.perf_counter()
+                recent = u.history[bisect_left(u.history, t - timedelta(days=schedule.PROFILE_DAYS)):]
+                u.row = schedule.replan(u.row, got, recent, t)
+                plan_s += time.perf_counter() - t0
+    for i, u in enumerate(users):
+        out["plays"] += bisect_right(u.times, end) - bisect_right(u.times, begin)
+    out["missed"] = sum(missed_by_user)
+    out["users_missing"] = sum(1 for m in missed_by_user if m)
+    out["missed_pct"] = round(100.0 * out["missed"] / max(out["plays"], 1), 3)
+    out["requests_per_user_day"] = round(out["requests"] / len(users) / ((end - begin).total_seconds() / 86_400), 2)
+    out["plan_us_per_sync"] = round(plan_s / max(out["syncs"], 1) * 1e6, 1)
+    return out
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Sync scheduling simulation")
+    p.add_argument("--users", type=int, default=40)
+    p.add_argument("--days", type=int, default=21)
+    p.add_argument("--warmup", type=int, default=28, help="days of history before the replay starts")
+    p.add_argument("--tick", type=int, default=10, help="cron interval in minutes")
+    p.add_argument("--budget", type=int, default=0, help="requests per tick for the budgeted runs, default a tenth of what every-run spends")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    begin = start + timedelta(days=args.warmup)
+    end = begin + timedelta(days=args.days)
+    traces = [trace(rng, start, args.warmup + args.days) for _ in range(args.users)]
+    tick = timedelta(minutes=args.tick)
+    budget = args.budget or max(schedule.SYNC_COST, args.users * schedule.SYNC_COST // 10)
+
+    runs = [
+        simulate(traces, begin, end, tick, "every_run", every=tick),
+        simulate(traces, begin, end, tick, "fixed_60m", every=timedelta(minutes=60)),
+        simulate(traces, begin, end, tick, "fixed_180m", every=timedelta(minutes=180)),
+        simulate(traces, begin, end, tick, "adaptive"),
+    ]
+    for key in ("deadline", "next_due"):
+        budgeted = simulate(traces, begin, end, tick, "adaptive", budget=budget, key=key)
+        budgeted["policy"] = f"budget_{budget}_by_{key}"
+        runs.append(budgeted)
+
+    result = {
+        "users": args.users,
+        "days": args.days,
+        "tick_minutes": args.tick,
+        "plays_per_day": sorted(round(len(t) / (args.warmup + args.days), 1) for t in traces),
+        "target_fill": schedule.TARGET_FILL,
+        "max_interval_hours": schedule.MAX_INTERVAL.total_seconds() / 3600,
+        "runs": runs,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    for r in runs:
+        print(f"{r['policy']:<22} requests={r['requests']:<7} per_user_day={r['requests_per_user_day']:<7} "
+              f"missed={r['missed']} ({r['missed_pct']}%) users_missing={r['users_missing']} "
+              f"max_fill={r['max_fill']} plan_us={r['plan_us_per_sync']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Synthetic listening history for the models.py schema:
+- seeded catalog of artists and tracks
+- Zipf distributed track popularity
+- per user sessions of back to back plays with inferred skips
+- bulk load into plays, daily_totals and the 15 minute base
+"""
+
+from __future__ import annotations
+import random
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import Engine
+
+from ..models import metadata, user_info, artists, tracks, plays, daily_totals, user_track_quarter
+from ..services.ingest import _skip_rule
+from ..services.timezones import _quarter_rows
+from ..services.upsert import bulk_load
+
+CHUNK = 10_000
+
+@dataclass
+class SynthConfig:
+    users: int = 3
+    years: float = 1.0
+    catalog_tracks: int = 5_000
+    catalog_artists: int = 800
+    zipf_s: float = 1.1
+    plays_per_day: int = 40
+    skip_prob: float = 0.2
+    seed: int = 42
+    end: Optional[datetime] = None  # defaults to today UTC midnight
+
+    def end_dt(self) -> datetime:
+        if self.end is not None:
+            return self.end
+        now = datetime.now(timezone.utc)
+        return datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+
+    def start_dt(self) -> datetime:
+        return self.end_dt() - timedelta(days=int(self.years * 365))
+
+class Catalog:
+    """
+    Artists and tracks plus a Zipf sampler over track rank.
+    Track index 0 is the most popular.
+    """
+
+    def __init__(self, cfg: SynthConfig):
+        rng = random.Random(cfg.seed)
+        self.artists = [
+            {"artist_id": f"art{i:06d}", "name": f"Artist {i}", "genres": None}
+            for i in range(cfg.catalog_artists)
+        ]
+        self.tracks = []
+        for i in range(cfg.catalog_tracks):
+            a = self.artists[rng.randrange(cfg.catalog_artists)]
+            self.tracks.append({
+                "track_id": f"trk{i:07d}",
+                "artist_id": a["artist_id"],
+                "title": f"Track {i}",
+                "album_name": f"Album {i // 12}",
+                "duration_ms": rng.randint(120_000, 360_000),
+            })
+        self._artist_name = {a["artist_id"]: a["name"] for a in self.artists}
+        self._cum = list(accumulate(1.0 / (k ** cfg.zipf_s) for k in range(1, cfg.catalog_tracks + 1)))
+
+    def sample(self, rng: random.Random) -> Dict[str, Any]:
+        idx = bisect_left(self._cum, rng.random() * self._cum[-1])
+        return self.tracks[min(idx, len(self.tracks) - 1)]
+
+    def artist_name(self, artist_id: str) -> str:
+        return self._artist_name[artist_id]
+
+def user_ids(cfg: SynthConfig) -> List[str]:
+    return [f"user{i:04d}" for i in range(cfg.users)]
+
+class Listener:
+    """
+    Generates an endless, time ordered play stream for one user.
+    Each play carries the elapsed_ms and is_skip that ingest would infer
+    from the gap to the following play.
+    """
+
+    def __init__(self, cfg: SynthConfig, catalog: Catalog, user_id: str, start: datetime):
+        self.cfg = cfg
+        self.catalog = catalog
+        self.user_id = user_id
+        self.rng = random.Random(f"{cfg.seed}:{user_id}")
+        self.t = start
+        self._session_left = 0
+
+    def _next_gap(self, track: Dict[str, Any]) -> tuple[int, bool]:
+        dur = track["duration_ms"]
+        if self.rng.random() < self.cfg.skip_prob:
+            elapsed = self.rng.randint(5_000, 40_000)
+        else:
+            elapsed = dur
+        return elapsed, _skip_rule(min(elapsed, dur), dur)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        cfg = self.cfg
+        if self._session_left <= 0:
+            # session count tuned so the average day lands near plays_per_day
+            self._session_left = self.rng.randint(5, 25)
+            sessions_per_day = max(cfg.plays_per_day / 15.0, 0.1)
+            idle_s = self.rng.expovariate(sessions_per_day / 86_400.0)
+            self.t += timedelta(seconds=idle_s)
+        track = self.catalog.sample(self.rng)
+        elapsed, is_skip = self._next_gap(track)
+        row = {
+            "user_id": self.user_id,
+            "track_id": track["track_id"],
+            "played_at": self.t,
+            "elapsed_ms": elapsed,
+            "is_skip": is_skip,
+        }
+        self._session_left -= 1
+        self.t += timedelta(milliseconds=elapsed + self.rng.randint(0, 3_000))
+        return row
+
+def to_recent_item(catalog: Catalog, play: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shape a generated play as a Spotify recently-played item.
+    """
+    tr = catalog.tracks[int(play["track_id"][3:])]
+    return {
+        "played_at": play["played_at"].strftime("%Y-%m-%dT%H:%M:%S.") + f"{play['played_at'].microsecond // 1000:03d}Z",
+        "track": {
+            "type": "track",
+            "id": tr["track_id"],
+            "name": tr["title"],
+            "duration_ms": tr["duration_ms"],
+            "album": {"name": tr["album_name"]},
+            "artists": [{"id": tr["artist_id"], "name": catalog.artist_name(tr["artist_id"])}],
+        },
+    }
+
+def to_top_track(catalog: Catalog, track: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shape a catalog track as a Spotify top tracks item.
+    """
+    return {
+        "type": "track",
+        "id": track["track_id"],
+        "name": track["title"],
+        "duration_ms": track["duration_ms"],
+        "album": {"name": track["album_name"]},
+        "artists": [{"id": track["artist_id"], "name": catalog.artist_name(track["artist_id"])}],
+    }
+
+def to_top_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shape a catalog artist as a Spotify top artists item.
+    """
+    return {"type": "artist", "id": artist["artist_id"], "name": artist["name"], "genres": ["synth"]}
+
+def _day(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+
+class _DayAcc:
+    __slots__ = ("ms", "plays", "skips", "track_ms", "artist_ms")
+
+    def __init__(self):
+        self.ms = 0
+        self.plays = 0
+        self.skips = 0
+        self.track_ms: Dict[str, int] = {}
+        self.artist_ms: Dict[str, int] = {}
+
+def _daily_row(user_id: str, day: datetime, acc: _DayAcc) -> Dict[str, Any]:
+    top_track = max(acc.track_ms.items(), key=lambda kv: kv[1])[0] if acc.track_ms else None
+    top_artist = max(acc.artist_ms.items(), key=lambda kv: kv[1])[0] if acc.artist_ms else None
+    return {
+        "user_id": user_id,
+        "day": day,
+        "minutes_listened": acc.ms // 60000,
+        "top_track_id": top_track,
+        "top_artist_id": top_artist,
+        "repeats": acc.plays - len(acc.track_ms),
+        "skips": acc.skips,
+    }
+
+def populate(eng: Engine, cfg: SynthConfig, catalog: Optional[Catalog] = None) -> Dict[str, Any]:
+    """
+    Create tables and load the catalog, users, plays, daily_totals and
+    user_track_quarter.
+    Returns counts plus each user's last played_at so callers can continue
+    the stream (see Listener) from where history stops.
+    """
+    catalog = catalog or Catalog(cfg)
+    metadata.create_all(eng)
+    start, end = cfg.start_dt(), cfg.end_dt()
+    track_artist = {t["track_id"]: t["artist_id"] for t in catalog.tracks}
+
+    with eng.begin() as conn:
+        bulk_load(conn, artists, catalog.artists)
+        bulk_load(conn, tracks, catalog.tracks)
+        bulk_load(conn, user_info, [
+            {"user_id": uid, "display_name": uid, "refresh_token": f"rt-{uid}", "last_recent_cursor": None}
+            for uid in user_ids(cfg)
+        ])
+
+    total_plays = 0
+    total_days = 0
+    cursors: Dict[str, datetime] = {}
+    for uid in user_ids(cfg):
+        buf: List[Dict[str, Any]] = []
+        days: List[Dict[str, Any]] = []
+        quarter: List[tuple] = []
+        acc_day: Optional[datetime] = None
+        acc = _DayAcc()
+        last = None
+        for p in Listener(cfg, catalog, uid, start):
+            if p["played_at"] >= end:
+                break
+            day = _day(p["played_at"])
+            if day != acc_day:
+                if acc_day is not None:
+                    days.append(_daily_row(uid, acc_day, acc))
+                acc_day, acc = day, _DayAcc()
+            acc.ms += p["elapsed_ms"]
+            acc.plays += 1
+            acc.skips += 1 if p["is_skip"] else 0
+            acc.track_ms[p["track_id"]] = acc.track_ms.get(p["track_id"], 0) + p["elapsed_ms"]
+            aid = track_artist[p["track_id"]]
+            acc.artist_ms[aid] = acc.artist_ms.get(aid, 0) + p["elapsed_ms"]
+            buf.append(p)
+            quarter.append((p["played_at"], p["track_id"], p["elapsed_ms"], p["is_skip"]))
+            last = p
+            if len(buf) >= CHUNK:
+                with eng.begin() as conn:
+                    bulk_load(conn, plays, buf)
+                total_plays += len(buf)
+                buf = []
+        if acc_day is not None:
+            days.append(_daily_row(uid, acc_day, acc))
+        with eng.begin() as conn:
+            bulk_load(conn, plays, buf)
+            bulk_load(conn, daily_totals, days)
+            bulk_load(conn, user_track_quarter, _quarter_rows(uid, quarter))
+            if last is not None:
+                conn.execute(
+                    user_info.update().where(user_info.c.user_id == uid).values(last_recent_cursor=last["played_at"])
+                )
+        total_plays += len(buf)
+        total_days += len(days)
+        if last is not None:
+            cursors[uid] = last["played_at"]
+
+    return {
+        "users": cfg.users,
+        "artists": len(catalog.artists),
+        "tracks": len(catalog.tracks),
+        "plays": total_plays,
+        "daily_totals": total_days,
+        "cursors": cursors,
+    }
@@ -0,0 +1,57 @@
+"""
+Throwaway PostgreSQL cluster for benchmarks:
+- initdb into a temp dir, start on a free port with pg_ctl
+- yields a SQLAlchemy URL, stops and deletes the cluster on exit
+Needs the PostgreSQL server binaries on PATH (or PG_BIN) and psycopg.
+PostgreSQL refuses to run as root; as root the server runs as PG_RUN_AS
+(default postgres) through runuser.
+"""
+
+from __future__ import annotations
+import contextlib
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from typing import Iterator
+
+def _bin(name: str) -> str:
+    pg_bin = os.getenv("PG_BIN")
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"{name} not found, install PostgreSQL server binaries or set PG_BIN")
+    return path
+
+def _as_server_user(cmd, tmp: str):
+    if os.geteuid() != 0:
+        return cmd
+    run_as = os.getenv("PG_RUN_AS", "postgres")
+    shutil.chown(tmp, user=run_as)
+    return ["runuser", "-u", run_as, "--"] + cmd
+
+def _run(cmd, tmp: str, check: bool = True) -> None:
+    proc = subprocess.run(_as_server_user(cmd, tmp), capture_output=True, text=True)
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[0])} failed: {(proc.stderr or proc.stdout).strip()}")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextlib.contextmanager
+def throwaway_pg(driver: str = "psycopg") -> Iterator[str]:
+    tmp = tempfile.mkdtemp(prefix="bench-pg-")
+    data = os.path.join(tmp, "data")
+    port = _free_port()
+    user = getpass.getuser()
+    _run([_bin("initdb"), "-D", data, "-U", user, "-A", "trust"], tmp)
+    _run([_bin("pg_ctl"), "-D", data, "-l", os.path.join(tmp, "pg.log"), "-w",
+          "-o", f"-p {port} -k {tmp} -c listen_addresses=127.0.0.1 -c fsync=off", "start"], tmp)
+    try:
+        yield f"postgresql+{driver}://{user}@127.0.0.1:{port}/postgres"
+    finally:
+        _run([_bin("pg_ctl"), "-D", data, "-m", "fast", "stop"], tmp, check=False)
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,179 @@
+"""
+Top tracks and artists sync, storage and movement lookups:
+- builds a synthetic database and serves drifting top lists from the fake
+  Spotify, with a fixed per request latency standing in for the network
+- times fetching the six lists one after another and concurrently
+- replays a run of daily syncs, timing changed and unchanged syncs and
+  checking every stored snapshot rebuilds to the list that was served
+- compares stored bytes with a full list per sync and a full list per change
+- times the list and movement routes against rebuilding by replaying
+  every snapshot from the first
+
+Usage: python -m backend.bench.top_items --users 3 --days 120 --items 100 --out top.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, func, select
+
+from ..models import get_engine, reset_engine, metadata, top_snapshots
+from ..services import top_items
+from .fake_spotify import FakeSpotify
+from .run import summarize, timed
+from .synth import SynthConfig, Catalog, populate, to_top_artist, to_top_track, user_ids
+
+# chance a list changes from one day to the next, long term lists barely move
+DRIFT = {"short_term": 0.9, "medium_term": 0.4, "long_term": 0.1}
+
+def _drift(rng: random.Random, ids: List[str], pool: List[str]) -> List[str]:
+    ids = list(ids)
+    for _ in range(rng.randint(1, 4)):
+        i = rng.randrange(len(ids) - 1)
+        ids[i], ids[i + 1] = ids[i + 1], ids[i]
+    if rng.random() < 0.5:
+        fresh = rng.choice(pool)
+        if fresh not in ids:
+            ids.insert(rng.randrange(len(ids)), fresh)
+            ids.pop()
+    return ids
+
+def _replay_all(conn, user_id: str, kind: str, time_range: str) -> List[str]:
+    # the naive lookup: every snapshot from the first, decoded in order
+    ids: List[str] = []
+    q = (
+        select(top_snapshots.c.keyframe, top_snapshots.c.data)
+        .where(and_(top_snapshots.c.user_id == user_id, top_snapshots.c.kind == kind,
+                    top_snapshots.c.time_range == time_range))
+        .order_by(top_snapshots.c.taken_at)
+    )
+    for r in conn.execute(q):
+        data = json.loads(r.data)
+        ids = data if r.keyframe else top_items.decode(ids, data)
+    return ids
+
+def run(args, tmp: str) -> Dict[str, Any]:
+    from ..app import create_app
+
+    cfg = SynthConfig(users=args.users, years=0.05)
+    reset_engine(f"sqlite:///{os.path.join(tmp, 'top.db')}")
+    metadata.drop_all(get_engine())
+    catalog = Catalog(cfg)
+    populate(get_engine(), cfg, catalog)
+    uids = user_ids(cfg)
+    rng = random.Random(cfg.seed)
+    track_by_id = {t["track_id"]: t for t in catalog.tracks}
+    artist_by_id = {a["artist_id"]: a for a in catalog.artists}
+    pools = {"tracks": list(track_by_id), "artists": list(artist_by_id)}
+    lists = [(k, r) for k in top_items.KINDS for r in top_items.RANGES]
+
+    served: Dict[Tuple[str, str, str], List[str]] = {
+        (u, k, r): rng.sample(pools[k], args.items) for u in uids for k, r in lists
+    }
+    truth: Dict[Tuple[str, str, str], List[Tuple[datetime, List[str]]]] = {key: [] for key in served}
+
+    def serve(fake: FakeSpotify, u: str) -> None:
+        for k, r in lists:
+            ids = served[(u, k, r)]
+            items = [to_top_track(catalog, track_by_id[t]) for t in ids] if k == "tracks" else [to_top_artist(artist_by_id[a]) for a in ids]
+            fake.set_top(u, k, r, items)
+
+    result: Dict[str, Any] = {"users": args.users, "days": args.days, "items": args.items, "latency_ms": args.latency * 1000}
+    with FakeSpotify(latency=args.latency) as fake:
+        fake.use()
+        for u in uids:
+            serve(fake, u)
+        u0 = uids[0]
+        sequential = lambda: {kr: top_items.fetch_top(u0, *kr) for kr in lists}
+        result["fetch_sequential"] = timed(sequential, repeat=5)
+        result["fetch_concurrent"] = timed(lambda: top_items.fetch_all(u0), repeat=5)
+        result["requests_per_sync"] = len(lists) * -(-args.items // top_items.PAGE_LIMIT)
+
+        start = datetime.now(timezone.utc) - timedelta(days=args.days)
+        changed_ms: List[float] = []
+        totals = {"changed": 0, "unchanged": 0, "keyframes": 0, "bytes": 0, "new_tracks": 0, "new_artists": 0}
+        for day in range(args.days):
+            at = start + timedelta(days=day)
+            for u in uids:
+                if day:
+                    for k, r in lists:
+                        if rng.random() < DRIFT[r]:
+                            served[(u, k, r)] = _drift(rng, served[(u, k, r)], pools[k])
+                    serve(fake, u)
+                fetched = top_items.fetch_all(u)
+                t0 = time.perf_counter()
+                counts = top_items.store(u, fetched, taken_at=at)
+                if counts["changed"]:
+                    changed_ms.append((time.perf_counter() - t0) * 1000.0)
+                for key in totals:
+                    totals[key] += counts[key]
+                for k, r in lists:
+                    truth[(u, k, r)].append((at, served[(u, k, r)]))
+        # a sync where no list moved, every list hashes equal and nothing is written
+        same = top_items.fetch_all(u0)
+        result["store_changed"] = summarize(changed_ms) if changed_ms else {}
+        result["store_unchanged"] = timed(lambda: top_items.store(u0, same), repeat=args.repeat)
+        result["totals"] = totals
+
+    mismatches = 0
+    with get_engine().connect() as conn:
+        for (u, k, r), seq in truth.items():
+            for at, ids in seq:
+                snap = top_items.snapshot_at(conn, u, k, r, at)
+                if snap is None or snap.ids != ids:
+                    mismatches += 1
+        stored = conn.execute(select(func.count(), func.sum(func.length(top_snapshots.c.data)))).one()
+    full_list = {key: len(json.dumps(seq[0][1], separators=(",", ":"))) for key, seq in truth.items()}
+    result["mismatches"] = mismatches
+    result["storage"] = {
+        "snapshots": stored[0],
+        "delta_bytes": int(stored[1] or 0),
+        "full_on_change_bytes": sum(full_list[(u, k, r)] for (u, k, r) in truth) // len(truth) * totals["changed"],
+        "full_every_sync_bytes": sum(v * args.days for v in full_list.values()),
+    }
+
+    client = create_app().test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = u0
+    routes = {
+        "top_list": "/api/top/tracks?range=short_term",
+        "movement_28d": "/api/top/tracks/movement?range=short_term&window=28d",
+        "movement_all_12pts": "/api/top/tracks/movement?range=short_term&window=all&points=12",
+    }
+    result["routes"] = {name: timed(lambda p=path: client.get(p), repeat=args.repeat) for name, path in routes.items()}
+    with get_engine().connect() as conn:
+        result["replay_all_snapshots"] = timed(lambda: _replay_all(conn, u0, "tracks", "short_term"), repeat=args.repeat)
+        result["rebuild_latest"] = timed(lambda: top_items.snapshot_at(conn, u0, "tracks", "short_term"), repeat=args.repeat)
+    return result
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Top items sync and movement benchmark")
+    p.add_argument("--users", type=int, default=3)
+    p.add_argument("--days", type=int, default=120)
+    p.add_argument("--items", type=int, default=100, help="ids per list, over 50 takes a second page")
+    p.add_argument("--latency", type=float, default=0.05, help="seconds added to every fake Spotify GET")
+    p.add_argument("--repeat", type=int, default=30)
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(args, tmp)
+        reset_engine()
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(1 if result["mismatches"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Year in review build, cache and batch cost:
+- builds a synthetic database of heavy listeners (--plays-per-day) and
+  reports last calendar year for each
+- times a forced build per user, a stored report whose version still
+  matches, and the route end to end
+- times the naive answer, one query per section and per month over the
+  year's plays (top tracks, artists and albums, twelve month totals,
+  most skipped) plus the daily rows, and checks both agree
+- times generating every user's report with 1 worker and with --workers
+- syncs a batch of 50 plays and checks only the current year's report
+  goes stale
+Exits non-zero when the naive answer or the staleness check disagrees.
+
+Usage: python -m backend.bench.year_review --users 4 --plays-per-day 120 --workers 2 --out year_review.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import desc, func, select
+
+from ..models import get_engine, get_read_engine, reset_engine, metadata, tracks
+from ..services import statements, timezones, year_review
+from ..services.ingest import sync_recent_core
+from ..services.partitions import plays_source
+from ..services.rollups import rollup_days
+from ..jobs.year_review import generate_all
+from .fake_spotify import FakeSpotify
+from .run import summarize, timed
+from .synth import SynthConfig, Catalog, Listener, populate, to_recent_item, user_ids
+
+def _naive(user_id: str, year: int) -> Dict[str, Any]:
+    # what assembling the report from per section queries looks like
+    with get_read_engine().connect() as conn:
+        tz = timezones.user_tz(conn, user_id)
+        start, end = year_review.year_bounds(year, tz)
+        p = plays_source(conn, start, end, user_id=user_id)
+        params = {"user_id": user_id, "start": start, "end": end, "limit": year_review.TOP_N}
+        top_t = conn.execute(statements.top_tracks(p), params).fetchall()
+        top_a = conn.execute(statements.top_artists(p), params).fetchall()
+        top_al = conn.execute(
+            select(tracks.c.album_name, tracks.c.artist_id, func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"))
+            .select_from(p.join(tracks, p.c.track_id == tracks.c.track_id))
+            .where(p.c.user_id == user_id, p.c.played_at >= start, p.c.played_at < end, tracks.c.album_name.is_not(None))
+            .group_by(tracks.c.album_name, tracks.c.artist_id)
+            .order_by(desc("ms"))
+            .limit(year_review.TOP_N)
+        ).fetchall()
+        months = []
+        for m in range(1, 13):
+            lo = timezones.local_day_bounds(date(year, m, 1), tz)[0]
+            hi = timezones.local_day_bounds(date(year + m // 12, m % 12 + 1, 1), tz)[0]
+            months.append(conn.execute(statements.window_totals(p), dict(params, start=lo, end=hi)).one())
+        skipped = conn.execute(statements.most_skipped(p), dict(params, limit=1)).fetchall()
+        totals = conn.execute(statements.window_totals(p), params).one()
+    return {
+        "top_tracks": [int(r.ms // 60000) for r in top_t],
+        "top_artists": [int(r.ms // 60000) for r in top_a],
+        "top_albums": [int(r.ms // 60000) for r in top_al],
+        "month_plays": sum(int(r.plays) for r in months),
+        "most_skipped": (int(skipped[0].skips), int(skipped[0].plays)) if skipped else None,
+        "plays": int(totals.plays),
+        "skips": int(totals.skips or 0),
+    }
+
+def _agrees(report: Dict[str, Any], naive: Dict[str, Any]) -> bool:
+    ms = report["most_skipped"]
+    return (
+        [i["minutes"] for i in report["top_tracks"]] == naive["top_tracks"]
+        and [i["minutes"] for i in report["top_artists"]] == naive["top_artists"]
+        and [i["minutes"] for i in report["top_albums"]] == naive["top_albums"]
+        and report["totals"]["plays"] == naive["plays"] == naive["month_plays"]
+        and report["totals"]["skips"] == naive["skips"]
+        and ((ms["skips"], ms["plays"]) if ms else None) == naive["most_skipped"]
+    )
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Year in review build, cache and batch cost")
+    p.add_argument("--users", type=int, default=4)
+    p.add_argument("--plays-per-day", type=int, default=120)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--workers", type=int, default=max(os.cpu_count() or 1, 2))
+    p.add_argument("--out", default=None)
+    args = p.parse_args(argv)
+
+    # two years back from today always covers the whole of last year
+    cfg = SynthConfig(users=args.users, years=2.0, plays_per_day=args.plays_per_day)
+    catalog = Catalog(cfg)
+    uids = user_ids(cfg)
+    year = cfg.end_dt().year - 1
+    result: Dict[str, Any] = {"users": args.users, "plays_per_day": args.plays_per_day, "year": year}
+
+    with tempfile.TemporaryDirectory() as tmp, FakeSpotify() as fake:
+        fake.use()
+        reset_engine(f"sqlite:///{os.path.join(tmp, 'year_review.db')}")
+        metadata.drop_all(get_engine())
+        cursors = populate(get_engine(), cfg, catalog)["cursors"]
+
+        builds: List[float] = []
+        agree = True
+        naive_ms: List[float] = []
+        for uid in uids:
+            out = timed(lambda: year_review.generate(uid, year, force=True), args.repeat)
+            builds.append(out["median_ms"])
+            report = year_review.generate(uid, year)["report"]
+            t0 = time.perf_counter()
+            naive = _naive(uid, year)
+            naive_ms.append((time.perf_counter() - t0) * 1000.0)
+            agree = agree and _agrees(report, naive)
+        result["plays_per_user"] = report["totals"]["plays"]
+        result["build"] = summarize(builds)
+        result["naive"] = summarize(naive_ms)
+        result["naive_agrees"] = agree
+
+        uid = uids[0]
+        result["stored"] = timed(lambda: year_review.generate(uid, year), args.repeat * 10)
+        from ..app import create_app
+
+        client = create_app().test_client()
+        with client.session_transaction() as s:
+            s["user_id"] = uid
+        result["route"] = timed(lambda: client.get(f"/api/year-in-review/{year}"), args.repeat * 10)
+
+        batch = {}
+        for workers in sorted({1, args.workers}):
+            t0 = time.perf_counter()
+            done = list(generate_all(uids, year, workers, force=True))
+            batch[f"workers_{workers}"] = {
+                "wall_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                "built": sum(1 for r in done if r.get("built")),
+                "errors": sum(1 for r in done if "error" in r),
+            }
+        result["batch"] = batch
+
+        # new plays land in the current year, last year's report stays current
+        this_year = year + 1
+        year_review.generate(uid, this_year)
+        stream = Listener(cfg, catalog, uid, cursors[uid] + timedelta(minutes=5))
+        fake.push(uid, [to_recent_item(catalog, next(stream)) for _ in range(fake.window)])
+        _counts, days = sync_recent_core(uid, uid)
+        rollup_days(uid, days)
+        result["after_sync"] = {
+            "last_year_rebuilt": year_review.generate(uid, year)["built"],
+            "this_year_rebuilt": year_review.generate(uid, this_year)["built"],
+        }
+        reset_engine()
+
+    stale_ok = result["after_sync"] == {"last_year_rebuilt": False, "this_year_rebuilt": True}
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+    print(json.dumps(result, indent=2))
+    if not (result["naive_agrees"] and stale_ok and not any(b["errors"] for b in batch.values())):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
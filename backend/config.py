@@ -0,0 +1,79 @@
+"""
+Settings read once from the environment and .env.
+models imports this, so every entry point loads .env exactly once.
+"""
+
+from __future__ import annotations
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///stats.db")
+# read routes use their own engine: mode=ro on the same SQLite file when
+# empty, or this URL, e.g. a PostgreSQL replica
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", "")
+# journal mode set on every SQLite write connection, empty leaves the file's own
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "wal")
+
+CLIENT_ID = os.getenv("CLIENT_ID", "")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET", "")
+REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://localhost:5000/callback")
+FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev-secret-change-me")
+SPOTIFY_API_BASE = os.getenv("SPOTIFY_API_BASE", "https://api.spotify.com/v1")
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+
+SESSION_GAP_MINUTES = int(os.getenv("SESSION_GAP_MINUTES", "30"))
+PLAYS_ARCHIVE_DIR = os.getenv("PLAYS_ARCHIVE_DIR", "archive")
+PLAYS_HOT_MONTHS = int(os.getenv("PLAYS_HOT_MONTHS", "3"))
+
+WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:5000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))  # 0 means 2 x cores + 1
+# gthread threads per worker, each open /api/live stream holds one, 1 means sync workers
+WEB_THREADS = int(os.getenv("WEB_THREADS", "32"))
+# SQLite file shared by all workers for hot per user aggregates, empty disables
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+SHARED_CACHE_TTL = int(os.getenv("SHARED_CACHE_TTL", "60"))
+
+# /api/* response compression, encodings in order of preference (empty disables) and
+# the smallest body worth compressing, see services/compress.py
+COMPRESS_ENCODINGS = os.getenv("COMPRESS_ENCODINGS", "br,gzip")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+# live push, one Spotify poll per watched user per interval however many clients listen
+LIVE_POLL_SECONDS = int(os.getenv("LIVE_POLL_SECONDS", "30"))
+LIVE_HEARTBEAT_SECONDS = int(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# compiled statement caches: SQLAlchemy's per engine LRU and sqlite3's per connection one
+SQL_QUERY_CACHE_SIZE = int(os.getenv("SQL_QUERY_CACHE_SIZE", "1000"))
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+
+# in process track and artist names for read routes, cleared when it grows past this
+DIMENSION_CACHE_MAX_TRACKS = int(os.getenv("DIMENSION_CACHE_MAX_TRACKS", "200000"))
+
+# per user track co-occurrence and day vector files, see services/similarity.py
+SIMILARITY_DIR = os.getenv("SIMILARITY_DIR", "similarity")
+
+# adaptive sync: fill of the 50 play Recently Played window to sync at,
+# bounds on the interval between syncs and Spotify requests per run (0 unlimited)
+SYNC_TARGET_FILL = float(os.getenv("SYNC_TARGET_FILL", "0.6"))
+SYNC_MIN_INTERVAL_MINUTES = int(os.getenv("SYNC_MIN_INTERVAL_MINUTES", "10"))
+SYNC_MAX_INTERVAL_HOURS = float(os.getenv("SYNC_MAX_INTERVAL_HOURS", "6"))
+SYNC_REQUEST_BUDGET = int(os.getenv("SYNC_REQUEST_BUDGET", "0"))
+
+def pool_options() -> dict:
+    # DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, only when set
+    opts = {}
+    for env, key in (
+        ("DB_POOL_SIZE", "pool_size"),
+        ("DB_MAX_OVERFLOW", "max_overflow"),
+        ("DB_POOL_TIMEOUT", "pool_timeout"),
+        ("DB_POOL_RECYCLE", "pool_recycle"),
+    ):
+        val = os.getenv(env)
+        if val:
+            opts[key] = int(val)
+    return opts
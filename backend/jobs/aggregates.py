@@ -0,0 +1,21 @@
+"""
+Rebuild cross user aggregates from plays.
+Sync keeps them current incrementally, run this after bulk imports
+or when the aggregate tables are new.
+"""
+
+from __future__ import annotations
+import time
+from datetime import datetime, timezone
+
+from ..models import init_db
+from ..services.aggregates import rebuild_global
+
+def main():
+    init_db()
+    t0 = time.perf_counter()
+    res = rebuild_global()
+    print(f"[{datetime.now(timezone.utc).isoformat()}] rebuild_global user_track_days={res['user_track_days']} took={time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
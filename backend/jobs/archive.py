@@ -0,0 +1,25 @@
+"""
+Move cold months of plays into read only per month files.
+Run monthly after rollups are current, e.g.
+python -m backend.jobs.archive --hot-months 3 --compress
+"""
+
+from __future__ import annotations
+import argparse
+from datetime import datetime, timezone
+
+from ..models import init_db
+from ..services.partitions import archive_cold, HOT_MONTHS
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Archive cold months of plays")
+    p.add_argument("--hot-months", type=int, default=HOT_MONTHS, help="closed months to keep in plays")
+    p.add_argument("--compress", action="store_true", help="gzip archived files")
+    args = p.parse_args(argv)
+
+    init_db()
+    for res in archive_cold(hot_months=args.hot_months, compress=args.compress):
+        print(f"[{datetime.now(timezone.utc).isoformat()}] archived month={res['month']} rows={res['rows']} path={res['path']}")
+
+if __name__ == "__main__":
+    main()
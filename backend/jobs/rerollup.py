@@ -0,0 +1,146 @@
+"""
+Re-derive elapsed_ms and is_skip and rebuild every rollup for all users,
+after a change to the skip rule or a fix to anything derived from plays:
+- users are sharded across a process pool, heaviest first, with at most
+  two per worker in flight; workers read and compute in parallel and
+  queue on a shared lock for SQLite's single writer
+- each finished user is appended to a checkpoint file, a rerun skips
+  them (--restart starts over)
+- progress lines report plays/s over the run and an ETA weighted by the
+  plays left
+- the cross user tables are regrouped once at the end
+e.g. python -m backend.jobs.rerollup --workers 4
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, List, Set
+
+from sqlalchemy import func, select
+
+from .. import models
+from ..models import init_db, get_engine, user_info, plays
+from ..services.aggregates import regroup_global
+from ..services.reprocess import PAGE, rerollup_user
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _eta(seconds: float) -> str:
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+_write_lock = None
+
+def _init_worker(url: str, lock) -> None:
+    global _write_lock
+    # spawned workers start from a fresh interpreter, point them at the same database
+    models.reset_engine(url)
+    _write_lock = lock
+
+def _rerollup(user_id: str, page: int):
+    return rerollup_user(user_id, page, _write_lock)
+
+def read_checkpoint(path: str) -> Set[str]:
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["user_id"])
+            except (ValueError, KeyError):
+                continue  # torn last line from a killed run
+    return done
+
+def play_counts(user_ids: List[str]) -> Dict[str, int]:
+    """
+    Hot plays per user, the weight used for ordering and the ETA.
+    """
+    with get_engine().connect() as conn:
+        got = dict(conn.execute(select(plays.c.user_id, func.count()).group_by(plays.c.user_id)).all())
+    return {u: int(got.get(u, 0)) for u in user_ids}
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Re-derive skips and rebuild rollups for every user")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    p.add_argument("--checkpoint", default="rerollup.checkpoint", help="file of finished users, one JSON line each")
+    p.add_argument("--restart", action="store_true", help="ignore and truncate an existing checkpoint")
+    p.add_argument("--page", type=int, default=PAGE, help="plays per keyset page")
+    p.add_argument("--max-tasks-per-child", type=int, default=50, help="recycle workers to return memory")
+    args = p.parse_args(argv)
+
+    init_db()
+    uids = args.users
+    if not uids:
+        with get_engine().connect() as conn:
+            uids = [r[0] for r in conn.execute(select(user_info.c.user_id))]
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    done = read_checkpoint(args.checkpoint)
+    weights = play_counts(uids)
+    # heaviest first so the longest users don't start last
+    todo = sorted((u for u in uids if u not in done), key=lambda u: -weights[u])
+    total_plays = sum(weights[u] for u in todo)
+    print(f"[{_now()}] rerollup users={len(todo)} skipped={len(uids) - len(todo)} plays={total_plays} workers={args.workers}")
+
+    failed: List[str] = []
+    finished = plays_done = 0
+    t0 = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    # SQLite takes one writer at a time, other databases need no lock
+    lock = ctx.Lock() if get_engine().dialect.name == "sqlite" else None
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=ctx,
+        initializer=_init_worker, initargs=(models.DATABASE_URL, lock), max_tasks_per_child=args.max_tasks_per_child,
+    )
+    with pool, open(args.checkpoint, "a") as ckpt:
+        queue = iter(todo)
+        running = {}
+        while True:
+            while len(running) < args.workers * 2:
+                uid = next(queue, None)
+                if uid is None:
+                    break
+                running[pool.submit(_rerollup, uid, args.page)] = uid
+            if not running:
+                break
+            ready, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in ready:
+                uid = running.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    failed.append(uid)
+                    print(f"[{_now()}] rerollup user={uid} failed {e!r}")
+                    continue
+                ckpt.write(json.dumps(dict(res, user_id=uid)) + "\n")
+                ckpt.flush()
+                finished += 1
+                plays_done += weights[uid]
+                elapsed = time.perf_counter() - t0
+                rate = plays_done / elapsed if elapsed else 0.0
+                eta = (total_plays - plays_done) / rate if rate else 0.0
+                print(
+                    f"[{_now()}] rerollup user={uid} plays={res['plays']} changed={res['changed']} days={res['days']} "
+                    f"took={res['seconds']:.2f}s done={finished}/{len(todo)} rate={rate:.0f}/s eta={_eta(eta)}"
+                )
+
+    t1 = time.perf_counter()
+    regroup_global()
+    print(f"[{_now()}] rerollup regroup_global took={time.perf_counter() - t1:.1f}s")
+    print(f"[{_now()}] rerollup finished={finished} failed={len(failed)} took={time.perf_counter() - t0:.1f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+One shot backfill of sessions and streaks from existing plays.
+Ingest keeps them current afterwards.
+"""
+
+from __future__ import annotations
+import time
+from datetime import datetime, timezone
+
+from ..models import init_db
+from ..services.sessions import backfill
+
+def main():
+    init_db()
+    t0 = time.perf_counter()
+    res = backfill()
+    print(f"[{datetime.now(timezone.utc).isoformat()}] sessions backfill users={res['users']} sessions={res['sessions_written']} took={time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Nightly rebuild of the per user similarity index, see
+services/similarity.py. Syncs keep it current in between; a rebuild
+re-picks each user's day vector artists and drops superseded versions.
+python -m backend.jobs.similarity
+"""
+
+from __future__ import annotations
+import argparse
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from ..models import init_db, get_engine, user_info
+from ..services import cache, similarity
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Build the track co-occurrence and day vector index")
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    args = p.parse_args(argv)
+
+    init_db()
+    q = select(user_info.c.user_id)
+    if args.users:
+        q = q.where(user_info.c.user_id.in_(args.users))
+    with get_engine().begin() as conn:
+        uids = [r[0] for r in conn.execute(q)]
+
+    for uid in uids:
+        t0 = time.perf_counter()
+        meta = similarity.build(uid)
+        cache.invalidate(uid)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] similarity user={uid} version={meta['version']} "
+              f"tracks={meta['tracks']} pairs={meta['pairs']} days={meta['days']} bytes={meta['bytes']} "
+              f"took={time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Rebuild every month's sketch from the 15 minute base. Run once after
+upgrading (after jobs.timezones --rebuild-base), e.g.
+python -m backend.jobs.sketches
+"""
+
+from __future__ import annotations
+import argparse
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from ..models import init_db, get_engine, user_info
+from ..services.sketches import rebuild
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Rebuild per month sketches")
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    args = p.parse_args(argv)
+
+    init_db()
+    uids = args.users
+    if not uids:
+        with get_engine().begin() as conn:
+            uids = [r[0] for r in conn.execute(select(user_info.c.user_id))]
+    for uid in uids:
+        with get_engine().begin() as conn:
+            n = rebuild(conn, uid)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] sketches user={uid} months={n}")
+
+if __name__ == "__main__":
+    main()
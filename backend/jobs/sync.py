@@ -1,32 +1,49 @@
 """
-Cron-friendly runner:
-- loops users
+Cron-friendly runner, meant to run every SYNC_MIN_INTERVAL_MINUTES:
+- picks the users services/schedule.py has due, most at risk of
+  overflowing the Recently Played window first, within --budget requests
+  (--all syncs every user like before)
 - mints access token from stored refresh_token
-- runs ingest and rollups
+- fetches and stages every picked user's new plays
+- merges all staged batches in one pass, then runs rollups, global
+  aggregates and the similarity index update per user
+- replans each fetched user from their history and new play count
 """
 
 from __future__ import annotations
-import os
+import argparse
 from datetime import datetime, timezone
 
-from dotenv import load_dotenv
 from sqlalchemy import select
 
-from ..models import get_engine, user_info
+from ..models import init_db, get_engine, user_info
 from ..services.spotify import mint_access_token
-from ..services.ingest import sync_recent_core
+from ..services.ingest import fetch_recent, stage, merge_staged
 from ..services.rollups import rollup_days
+from ..services.aggregates import rollup_global
+from ..services import cache, schedule, similarity
 
-load_dotenv()
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Sync Recently Played for the users that are due")
+    p.add_argument("--all", action="store_true", help="sync every user, ignoring the schedule")
+    p.add_argument("--budget", type=int, default=schedule.REQUEST_BUDGET, help="Spotify requests this run, 0 for no limit")
+    args = p.parse_args(argv)
 
-def main():
+    init_db()
     eng = get_engine()
     with eng.begin() as conn:
-        users = conn.execute(select(user_info.c.user_id, user_info.c.refresh_token)).fetchall()
+        if args.all:
+            users = conn.execute(select(user_info.c.user_id, user_info.c.refresh_token)).fetchall()
+        else:
+            due = schedule.due_users(conn, budget=args.budget)
+            tokens = dict(conn.execute(
+                select(user_info.c.user_id, user_info.c.refresh_token).where(user_info.c.user_id.in_(due))
+            ).all())
+            users = [(uid, tokens[uid]) for uid in due]
+    print(f"[{datetime.now(timezone.utc).isoformat()}] sync users={len(users)} budget={args.budget or 'none'}")
 
-    for u in users:
-        uid = u.user_id
-        rt = u.refresh_token
+    fetched = []
+    for uid, rt in users:
         minted = mint_access_token(rt)
         if not minted:
             print(f"[{datetime.now(timezone.utc).isoformat()}] user={uid} refresh_failed")
@@ -37,9 +54,25 @@ def main():
             with eng.begin() as conn:
                 conn.execute(user_info.update().where(user_info.c.user_id == uid).values(refresh_token=new_rt))
 
-        counts, days = sync_recent_core(uid, at)
+        staged = stage(fetch_recent(uid, at))
+        fetched.append(uid)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] user={uid} staged={staged}")
+
+    # also picks up batches a crashed run staged but never merged
+    merged = merge_staged()
+    for uid, (counts, days) in merged.items():
         roll = rollup_days(uid, days)
+        rollup_global(uid, days)
+        if days:
+            similarity.update(uid)
+            cache.invalidate(uid)
         print(f"[{datetime.now(timezone.utc).isoformat()}] user={uid} new={counts['new_plays']} updated_elapsed={counts['updated_elapsed']} rollup_rows={roll['rows_written']}")
 
+    for uid in fetched:
+        new_plays = merged[uid][0]["new_plays"] if uid in merged else 0
+        with eng.begin() as conn:
+            plan = schedule.record(conn, uid, new_plays)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] user={uid} next_due={plan['next_due'].isoformat()} rate={plan['rate']}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,38 @@
+"""
+Rebuild the 15 minute base and re-bucket daily_totals into each user's
+timezone. Run once after upgrading, or with --users after repairs, e.g.
+python -m backend.jobs.timezones --rebuild-base
+"""
+
+from __future__ import annotations
+import argparse
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from ..models import init_db, get_engine, user_info
+from ..services.timezones import rebuild_base, rebucket, user_tz
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Re-bucket daily_totals into user timezones")
+    p.add_argument("--rebuild-base", action="store_true", help="recompute user_track_quarter from plays first")
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    args = p.parse_args(argv)
+
+    init_db()
+    if args.rebuild_base:
+        res = rebuild_base(args.users)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] base users={res['users']} rows={res['rows']}")
+
+    uids = args.users
+    if not uids:
+        with get_engine().begin() as conn:
+            uids = [r[0] for r in conn.execute(select(user_info.c.user_id))]
+    for uid in uids:
+        with get_engine().begin() as conn:
+            tz = user_tz(conn, uid)
+            n = rebucket(conn, uid, tz)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] rebucket user={uid} tz={tz} days={n}")
+
+if __name__ == "__main__":
+    main()
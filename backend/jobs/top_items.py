@@ -0,0 +1,53 @@
+"""
+Cron runner for top tracks and artists, daily is plenty since Spotify
+recomputes the lists about once a day:
+- loops users
+- mints access token from stored refresh_token
+- fetches the six lists concurrently and stores the ones that changed
+python -m backend.jobs.top_items
+"""
+
+from __future__ import annotations
+import argparse
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from ..models import init_db, get_engine, user_info
+from ..services.spotify import mint_access_token
+from ..services.top_items import sync_top
+from ..services import cache
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Sync Spotify top tracks and artists")
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    args = p.parse_args(argv)
+
+    init_db()
+    eng = get_engine()
+    q = select(user_info.c.user_id, user_info.c.refresh_token)
+    if args.users:
+        q = q.where(user_info.c.user_id.in_(args.users))
+    with eng.begin() as conn:
+        users = conn.execute(q).fetchall()
+
+    for u in users:
+        uid = u.user_id
+        minted = mint_access_token(u.refresh_token)
+        if not minted:
+            print(f"[{datetime.now(timezone.utc).isoformat()}] top user={uid} refresh_failed")
+            continue
+        new_rt = minted.get("refresh_token")
+        if new_rt:
+            with eng.begin() as conn:
+                conn.execute(user_info.update().where(user_info.c.user_id == uid).values(refresh_token=new_rt))
+
+        counts = sync_top(uid, minted["access_token"])
+        if counts["changed"]:
+            cache.invalidate(uid)
+        print(f"[{datetime.now(timezone.utc).isoformat()}] top user={uid} changed={counts['changed']} "
+              f"unchanged={counts['unchanged']} keyframes={counts['keyframes']} new_tracks={counts['new_tracks']} "
+              f"new_artists={counts['new_artists']} bytes={counts['bytes']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Year in review for every user, see services/year_review.py:
+- users are spread over a spawn process pool, workers read and build in
+  parallel and queue on a shared lock for SQLite's single writer;
+  --workers 1 runs in this process
+- a stored report whose data version still matches is left alone,
+  --force rebuilds it
+- prints one line per user and the build time spread at the end
+e.g. python -m backend.jobs.year_review --year 2025 --workers 4
+"""
+
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import select
+
+from .. import models
+from ..models import init_db, get_engine, user_info
+from ..services import cache, year_review
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+_write_lock = None
+
+def _init_worker(url: str, lock) -> None:
+    global _write_lock
+    # spawned workers start from a fresh interpreter, point them at the same database
+    models.reset_engine(url)
+    _write_lock = lock
+
+def _generate(user_id: str, year: int, force: bool) -> Dict[str, Any]:
+    out = year_review.generate(user_id, year, force, _write_lock)
+    # the report itself stays in year_reports, only the numbers come back
+    return {"user_id": user_id, "built": out["built"], "seconds": out["seconds"],
+            "plays": out["report"]["totals"]["plays"]}
+
+def generate_all(user_ids: List[str], year: int, workers: int, force: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yields each user's result as it finishes.
+    """
+    if workers <= 1:
+        for uid in user_ids:
+            yield _generate(uid, year, force)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    # SQLite takes one writer at a time, other databases need no lock
+    lock = ctx.Lock() if get_engine().dialect.name == "sqlite" else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(models.DATABASE_URL, lock)) as pool:
+        futures = {pool.submit(_generate, uid, year, force): uid for uid in user_ids}
+        for fut in as_completed(futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield {"user_id": futures[fut], "error": repr(e)}
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Build year in review reports for every user")
+    p.add_argument("--year", type=int, default=datetime.now(timezone.utc).year - 1)
+    p.add_argument("--users", nargs="*", default=None, help="limit to these user ids")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--force", action="store_true", help="rebuild reports whose data version still matches")
+    args = p.parse_args(argv)
+
+    init_db()
+    q = select(user_info.c.user_id)
+    if args.users:
+        q = q.where(user_info.c.user_id.in_(args.users))
+    with get_engine().connect() as conn:
+        uids = [r[0] for r in conn.execute(q)]
+    print(f"[{_now()}] year_review year={args.year} users={len(uids)} workers={args.workers} force={args.force}")
+
+    t0 = time.perf_counter()
+    built: List[float] = []
+    failed = 0
+    for res in generate_all(uids, args.year, args.workers, args.force):
+        if "error" in res:
+            failed += 1
+            print(f"[{_now()}] year_review user={res['user_id']} failed {res['error']}")
+            continue
+        if res["built"]:
+            built.append(res["seconds"])
+            cache.invalidate(res["user_id"])
+        print(f"[{_now()}] year_review user={res['user_id']} plays={res['plays']} built={res['built']} "
+              f"took={res['seconds']:.3f}s")
+
+    spread = (f" build_median={statistics.median(built):.3f}s build_max={max(built):.3f}s" if built else "")
+    print(f"[{_now()}] year_review built={len(built)} current={len(uids) - len(built) - failed} failed={failed}"
+          f"{spread} took={time.perf_counter() - t0:.1f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,16 @@ from datetime import datetime, timezone
 from typing import Optional
 
 from sqlalchemy import (
-    MetaData, Table, Column, String, Text, Integer, DateTime, Boolean,
-    ForeignKey, Index, UniqueConstraint, create_engine
+    MetaData, Table, Column, String, Text, Integer, BigInteger, Float, DateTime, Boolean, LargeBinary,
+    ForeignKey, Index, UniqueConstraint, create_engine, event
 )
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.sql import func
-from dotenv import load_dotenv
 
-load_dotenv()
+from . import config
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///stats.db")
+DATABASE_URL = config.DATABASE_URL
+READ_DATABASE_URL = config.READ_DATABASE_URL
 
 # Single metadata and engine for the app
 metadata = MetaData()
@@ -27,6 +27,12 @@ metadata = MetaData()
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
+# SQLite hands DateTime columns back naive, values are always stored as UTC
+def as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
 # user_info table
 user_info = Table(
     "user_info",
@@ -85,13 +91,32 @@ plays = Table(
     Index("ix_user_track", "user_id", "track_id"),
 )
 
+# raw Recently Played items land here first, one append-only write per
+# fetch; services/ingest.py merges them into artists, tracks and plays and
+# advances the cursor in one transaction, then deletes them
+ingest_staging = Table(
+    "ingest_staging",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", String, ForeignKey("user_info.user_id"), nullable=False),
+    Column("played_at", DateTime(timezone=True), nullable=False),
+    Column("track_id", String, nullable=False),
+    Column("track_title", String, nullable=True),
+    Column("album_name", String, nullable=True),
+    Column("duration_ms", Integer, nullable=False, default=0),
+    Column("artist_id", String, nullable=True),
+    Column("artist_name", String, nullable=True),
+    Column("staged_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+    UniqueConstraint("user_id", "played_at", name="uq_staging_user_played_at"),
+)
+
 # daily_totals table
 # Store day as UTC midnight DateTime for "timezone-aware everywhere"
 daily_totals = Table(
     "daily_totals",
     metadata,
     Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
-    Column("day", DateTime(timezone=True), primary_key=True),  # UTC midnight for the day
+    Column("day", DateTime(timezone=True), primary_key=True),  # the user's local date, stored as midnight UTC
     Column("minutes_listened", Integer, nullable=False, default=0),
     Column("top_track_id", String, ForeignKey("tracks.track_id"), nullable=True),
     Column("top_artist_id", String, ForeignKey("artists.artist_id"), nullable=True),
@@ -99,18 +124,244 @@ daily_totals = Table(
     Column("skips", Integer, nullable=False, default=0),
 )
 
+# per user preferences, timezone is an IANA name used for local days
+user_settings = Table(
+    "user_settings",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("timezone", String, nullable=False, default="UTC"),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()),
+)
+
+# 15 minute per track base aggregate, maintained by services/timezones.py
+# every zone's local days are whole buckets, so daily_totals re-buckets from
+# here without reading plays
+user_track_quarter = Table(
+    "user_track_quarter",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("bucket", Integer, primary_key=True),  # unix seconds // 900
+    Column("track_id", String, ForeignKey("tracks.track_id"), primary_key=True),
+    Column("plays", Integer, nullable=False, default=0),
+    Column("ms", Integer, nullable=False, default=0),
+    Column("skips", Integer, nullable=False, default=0),
+)
+
+# mergeable per month summaries for approximate long windows, rebuilt from
+# user_track_quarter by services/sketches.py; month is the UTC first of month
+user_month_sketches = Table(
+    "user_month_sketches",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("month", DateTime(timezone=True), primary_key=True),
+    Column("data", LargeBinary, nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()),
+)
+
+# Cross user aggregates, maintained by services/aggregates.py
+# user_track_daily holds each user's contribution so global rows can be
+# adjusted by delta when a user's day is re-aggregated; ms sums across
+# users or all time outgrow a 32 bit integer, hence BigInteger
+user_track_daily = Table(
+    "user_track_daily",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("day", DateTime(timezone=True), primary_key=True),
+    Column("track_id", String, ForeignKey("tracks.track_id"), primary_key=True),
+    Column("plays", Integer, nullable=False, default=0),
+    Column("ms", BigInteger, nullable=False, default=0),
+)
+
+global_track_daily = Table(
+    "global_track_daily",
+    metadata,
+    Column("day", DateTime(timezone=True), primary_key=True),
+    Column("track_id", String, ForeignKey("tracks.track_id"), primary_key=True),
+    Column("plays", Integer, nullable=False, default=0),
+    Column("ms", BigInteger, nullable=False, default=0),
+)
+
+global_artist_daily = Table(
+    "global_artist_daily",
+    metadata,
+    Column("day", DateTime(timezone=True), primary_key=True),
+    Column("artist_id", String, ForeignKey("artists.artist_id"), primary_key=True),
+    Column("plays", Integer, nullable=False, default=0),
+    Column("ms", BigInteger, nullable=False, default=0),
+)
+
+# all time per user artist vector used for similarity
+user_artist_totals = Table(
+    "user_artist_totals",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("artist_id", String, ForeignKey("artists.artist_id"), primary_key=True),
+    Column("plays", Integer, nullable=False, default=0),
+    Column("ms", BigInteger, nullable=False, default=0),
+)
+
+# listening sessions, maintained at ingest by services/sessions.py
+# end_at is the last play's played_at plus its elapsed_ms
+sessions = Table(
+    "sessions",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", String, ForeignKey("user_info.user_id"), nullable=False),
+    Column("start_at", DateTime(timezone=True), nullable=False),
+    Column("end_at", DateTime(timezone=True), nullable=False),
+    Column("plays", Integer, nullable=False),
+    Column("ms", Integer, nullable=False),
+    Column("top_artist_id", String, ForeignKey("artists.artist_id"), nullable=True),
+    UniqueConstraint("user_id", "start_at", name="uq_session_user_start"),
+)
+
+# daily listening streak state, days are UTC midnight
+user_streaks = Table(
+    "user_streaks",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("current_start", DateTime(timezone=True), nullable=True),
+    Column("current_end", DateTime(timezone=True), nullable=True),
+    Column("current_days", Integer, nullable=False, default=0),
+    Column("longest_start", DateTime(timezone=True), nullable=True),
+    Column("longest_end", DateTime(timezone=True), nullable=True),
+    Column("longest_days", Integer, nullable=False, default=0),
+)
+
+# when the cron sync should next fetch each user, kept by services/schedule.py;
+# deadline is when the Recently Played window is projected to overflow,
+# rate the recent plays per hour estimate
+sync_schedule = Table(
+    "sync_schedule",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("next_due", DateTime(timezone=True), nullable=False),
+    Column("deadline", DateTime(timezone=True), nullable=False),
+    Column("last_sync_at", DateTime(timezone=True), nullable=True),
+    Column("last_new_plays", Integer, nullable=False, default=0),
+    Column("rate", Float, nullable=False, default=0.0),
+    Column("overflows", Integer, nullable=False, default=0),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()),
+)
+
+# Spotify top tracks and artists per time range, written by
+# services/top_items.py only when a list changed; data is the ordered id
+# list as JSON on keyframes and copy/insert ops against the previous
+# snapshot otherwise
+top_snapshots = Table(
+    "top_snapshots",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", String, ForeignKey("user_info.user_id"), nullable=False),
+    Column("kind", String, nullable=False),  # tracks or artists
+    Column("time_range", String, nullable=False),  # short_term, medium_term or long_term
+    Column("taken_at", DateTime(timezone=True), nullable=False),
+    Column("hash", String, nullable=False),  # sha1 of the ordered ids
+    Column("keyframe", Boolean, nullable=False, default=False),
+    Column("items", Integer, nullable=False),
+    Column("data", Text, nullable=False),
+    UniqueConstraint("user_id", "kind", "time_range", "taken_at", name="uq_top_snapshot"),
+)
+
+# catalog of cold months moved out of plays by services/partitions.py
+play_partitions = Table(
+    "play_partitions",
+    metadata,
+    Column("month", DateTime(timezone=True), primary_key=True),  # UTC first of month
+    Column("path", Text, nullable=False),
+    Column("rows", Integer, nullable=False),
+    Column("compressed", Boolean, nullable=False, default=False),
+    Column("archived_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+# year in review per user and local calendar year, written by
+# services/year_review.py; version fingerprints the data it was built
+# from and data is the report as JSON
+year_reports = Table(
+    "year_reports",
+    metadata,
+    Column("user_id", String, ForeignKey("user_info.user_id"), primary_key=True),
+    Column("year", Integer, primary_key=True),
+    Column("version", String, nullable=False),
+    Column("data", Text, nullable=False),
+    Column("build_ms", Float, nullable=False, default=0.0),
+    Column("built_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
 _engine: Optional[Engine] = None
+_engine_pid: Optional[int] = None
+_read_engine: Optional[Engine] = None
+_read_engine_pid: Optional[int] = None
+
+def _sqlite_file(url: str) -> Optional[str]:
+    # absolute path of a file backed SQLite URL, None for memory and other dialects
+    u = make_url(url)
+    if u.get_backend_name() != "sqlite" or not u.database or u.database == ":memory:" or u.database.startswith("file:"):
+        return None
+    return os.path.abspath(u.database)
+
+def _create(url: str, **connect_args) -> Engine:
+    if url.startswith("sqlite"):
+        # SQLite needs check_same_thread=False for multi thread dev use
+        connect_args.update(check_same_thread=False, cached_statements=config.SQLITE_CACHED_STATEMENTS)
+    return create_engine(
+        url, future=True, pool_pre_ping=True, connect_args=connect_args,
+        query_cache_size=config.SQL_QUERY_CACHE_SIZE, **config.pool_options(),
+    )
 
 def get_engine() -> Engine:
-    global _engine
+    global _engine, _engine_pid
+    if _engine is not None and _engine_pid != os.getpid():
+        # inherited across fork, leave the parent's connections alone
+        _engine.dispose(close=False)
+        _engine = None
     if _engine is None:
-        # SQLite needs check_same_thread=False for multi thread dev use
-        connect_args = {}
-        if DATABASE_URL.startswith("sqlite"):
-            connect_args = {"check_same_thread": False}
-        _engine = create_engine(DATABASE_URL, future=True, pool_pre_ping=True, connect_args=connect_args)
+        _engine = _create(DATABASE_URL)
+        if _sqlite_file(DATABASE_URL) and config.SQLITE_JOURNAL_MODE:
+            # WAL lets the read engine's connections run while ingest writes
+            @event.listens_for(_engine, "connect")
+            def _journal_mode(dbapi_conn, _record):
+                dbapi_conn.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        _engine_pid = os.getpid()
     return _engine
 
+def get_read_engine() -> Engine:
+    """
+    Engine for routes that only read. On a SQLite file it opens the same
+    file with mode=ro, so a stray write fails instead of taking the write
+    lock; READ_DATABASE_URL points it anywhere else, a PostgreSQL replica
+    say. The write engine otherwise, e.g. for :memory:.
+    """
+    global _read_engine, _read_engine_pid
+    if _read_engine is not None and _read_engine_pid != os.getpid():
+        _read_engine.dispose(close=False)
+        _read_engine = None
+    if _read_engine is None:
+        path = _sqlite_file(DATABASE_URL)
+        if READ_DATABASE_URL:
+            _read_engine = _create(READ_DATABASE_URL)
+        elif path:
+            _read_engine = _create(f"sqlite:///file:{path}?mode=ro&uri=true")
+        else:
+            return get_engine()
+        _read_engine_pid = os.getpid()
+    return _read_engine
+
+def reset_engine(url: Optional[str] = None) -> None:
+    """
+    Drop the cached engines, optionally pointing at a different database.
+    Used by tooling that runs against a throwaway database, whose reads
+    then go through a mode=ro engine on the same file.
+    """
+    global _engine, _read_engine, DATABASE_URL, READ_DATABASE_URL
+    for eng in (_engine, _read_engine):
+        if eng is not None:
+            eng.dispose()
+    _engine = _read_engine = None
+    if url:
+        DATABASE_URL = url
+        READ_DATABASE_URL = ""
+
 def init_db() -> None:
     engine = get_engine()
     metadata.create_all(engine)
@@ -5,7 +5,8 @@ from sqlalchemy import select, and_
 import csv
 from io import StringIO
 
-from ..models import get_engine, daily_totals, tracks, artists
+from ..models import get_read_engine, daily_totals
+from ..services.dimensions import dimensions
 
 bp = Blueprint("export", __name__)
 
@@ -19,27 +20,25 @@ def export_last30():
     start = now - timedelta(days=30)
     start_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
 
-    eng = get_engine()
-    with eng.begin() as conn:
+    eng = get_read_engine()
+    with eng.connect() as conn:
         q = (
             select(
                 daily_totals.c.day,
                 daily_totals.c.minutes_listened,
                 daily_totals.c.repeats,
                 daily_totals.c.skips,
-                tracks.c.title,
-                artists.c.name,
-            )
-            .select_from(
-                daily_totals
-                .outerjoin(tracks, daily_totals.c.top_track_id == tracks.c.track_id)
-                .outerjoin(artists, daily_totals.c.top_artist_id == artists.c.artist_id)
+                daily_totals.c.top_track_id,
+                daily_totals.c.top_artist_id,
             )
             .where(and_(daily_totals.c.user_id == user_id, daily_totals.c.day >= start_day, daily_totals.c.day <= now))
             .order_by(daily_totals.c.day)
         )
         rows = conn.execute(q).mappings().all()
 
+    titles = dimensions().tracks(r["top_track_id"] for r in rows)
+    names = dimensions().artists(r["top_artist_id"] for r in rows)
+
     buf = StringIO()
     writer = csv.writer(buf)
     writer.writerow(["day", "minutes_listened", "repeats", "skips", "top_track_title", "top_artist_name"])
@@ -49,8 +48,8 @@ def export_last30():
             r["minutes_listened"],
             r["repeats"],
             r["skips"],
-            r.get("title") or "",
-            r.get("name") or "",
+            titles[r["top_track_id"]][0] if r["top_track_id"] in titles else "",
+            names.get(r["top_artist_id"]) or "",
         ])
 
     csv_data = buf.getvalue()
@@ -1,9 +1,15 @@
 from __future__ import annotations
-from datetime import datetime, timezone, timedelta
-from flask import Blueprint, jsonify, request, session
-from sqlalchemy import select, and_, asc
+import json
+from datetime import date, datetime, timezone, timedelta
+from typing import Iterator, Optional, Tuple
 
-from ..models import get_engine, daily_totals, tracks, artists
+from flask import Blueprint, Response, jsonify, request, session
+from sqlalchemy import select, and_, asc, func
+
+from ..models import get_read_engine, daily_totals
+from ..services import timezones
+from ..services.dimensions import dimensions
+from ..services.cache import cached_json
 
 bp = Blueprint("heatmap", __name__)
 
@@ -12,7 +18,94 @@ def _parse_day(s: str) -> datetime:
     dt = datetime.strptime(s, "%Y-%m-%d")
     return datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
 
+def _labels(rows):
+    # titles and names for the rows' top ids, resolved in memory
+    dims = dimensions()
+    titles = {t: info[0] for t, info in dims.tracks(r["top_track_id"] for r in rows).items()}
+    return titles, dims.artists(r["top_artist_id"] for r in rows)
+
+def _local_items(conn, user_id: str, tz: str, first, last):
+    days = timezones.local_daily(conn, user_id, tz, first, last)
+    titles, names = _labels(days.values())
+    return [
+        {
+            "day": datetime(d.year, d.month, d.day).isoformat(),
+            "minutes_listened": v["minutes_listened"],
+            "repeats": v["repeats"],
+            "skips": v["skips"],
+            "top_track_id": v["top_track_id"],
+            "top_artist_id": v["top_artist_id"],
+            "top_track_title": titles.get(v["top_track_id"]),
+            "top_artist_name": names.get(v["top_artist_id"]),
+        }
+        for d, v in sorted(days.items())
+    ]
+
+def _stored_items(conn, user_id: str, start: datetime, end_day: datetime):
+    q = (
+        select(
+            daily_totals.c.day,
+            daily_totals.c.minutes_listened,
+            daily_totals.c.repeats,
+            daily_totals.c.skips,
+            daily_totals.c.top_track_id,
+            daily_totals.c.top_artist_id,
+        )
+        .where(and_(daily_totals.c.user_id == user_id, daily_totals.c.day >= start, daily_totals.c.day <= end_day))
+        .order_by(asc(daily_totals.c.day))
+    )
+    rows = conn.execute(q).mappings().all()
+
+    titles, names = _labels(rows)
+    data = []
+    for r in rows:
+        data.append({
+            "day": r["day"].isoformat(),
+            "minutes_listened": r["minutes_listened"],
+            "repeats": r["repeats"],
+            "skips": r["skips"],
+            "top_track_id": r["top_track_id"],
+            "top_artist_id": r["top_artist_id"],
+            "top_track_title": titles.get(r["top_track_id"]),
+            "top_artist_name": names.get(r["top_artist_id"]),
+        })
+    return data
+
+def _months(first: date, last: date) -> Iterator[Tuple[date, date]]:
+    # calendar months clipped to [first, last]
+    d = first
+    while d <= last:
+        nxt = date(d.year + d.month // 12, d.month % 12 + 1, 1)
+        yield d, min(last, nxt - timedelta(days=1))
+        d = nxt
+
+def _month_chunks(user_id: str, tz: Optional[str], first: date, last: date) -> Iterator[str]:
+    # one NDJSON line per month, each read on its own so the first goes out
+    # before the later months are queried, then a closing line with totals.
+    # One connection for the whole stream, not a pool checkout per month.
+    months = days = 0
+    with get_read_engine().connect() as conn:
+        # an open ended range would be a query per empty month, clip it to the
+        # stored days, a day wider for a zone other than the stored one
+        lo_day, hi_day = conn.execute(
+            select(func.min(daily_totals.c.day), func.max(daily_totals.c.day)).where(daily_totals.c.user_id == user_id)
+        ).one()
+        if lo_day is not None:
+            first = max(first, lo_day.date() - timedelta(days=1))
+            last = min(last, hi_day.date() + timedelta(days=1))
+        for lo, hi in _months(first, last) if lo_day is not None else ():
+            if tz:
+                items = _local_items(conn, user_id, tz, lo, hi)
+            else:
+                items = _stored_items(conn, user_id, datetime(lo.year, lo.month, lo.day, tzinfo=timezone.utc),
+                                      datetime(hi.year, hi.month, hi.day, tzinfo=timezone.utc))
+            months += 1
+            days += len(items)
+            yield json.dumps({"month": lo.strftime("%Y-%m"), "items": items}, separators=(",", ":")) + "\n"
+    yield json.dumps({"done": True, "months": months, "days": days}) + "\n"
+
 @bp.get("/api/heatmap")
+@cached_json()
 def heatmap():
     user_id = session.get("user_id")
     if not user_id:
@@ -26,40 +119,22 @@ def heatmap():
     start = _parse_day(start_param) if start_param else datetime(start_default.year, start_default.month, start_default.day, tzinfo=timezone.utc)
     end_day = _parse_day(end_param) if end_param else datetime(end_default.year, end_default.month, end_default.day, tzinfo=timezone.utc)
 
-    eng = get_engine()
-    with eng.begin() as conn:
-        q = (
-            select(
-                daily_totals.c.day,
-                daily_totals.c.minutes_listened,
-                daily_totals.c.repeats,
-                daily_totals.c.skips,
-                daily_totals.c.top_track_id,
-                daily_totals.c.top_artist_id,
-                tracks.c.title,
-                artists.c.name,
-            )
-            .select_from(
-                daily_totals
-                .outerjoin(tracks, daily_totals.c.top_track_id == tracks.c.track_id)
-                .outerjoin(artists, daily_totals.c.top_artist_id == artists.c.artist_id)
-            )
-            .where(and_(daily_totals.c.user_id == user_id, daily_totals.c.day >= start, daily_totals.c.day <= end_day))
-            .order_by(asc(daily_totals.c.day))
-        )
-        rows = conn.execute(q).mappings().all()
+    # ?tz= buckets the 15 minute base on the fly instead of reading daily_totals
+    tz = request.args.get("tz")
+    if tz:
+        try:
+            timezones.zone(tz)
+        except ValueError:
+            return jsonify({"error": "invalid_timezone"}), 400
 
-    data = []
-    for r in rows:
-        data.append({
-            "day": r["day"].isoformat(),
-            "minutes_listened": r["minutes_listened"],
-            "repeats": r["repeats"],
-            "skips": r["skips"],
-            "top_track_id": r["top_track_id"],
-            "top_artist_id": r["top_artist_id"],
-            "top_track_title": r["title"],
-            "top_artist_name": r["name"],
-        })
+    # ?stream=1 sends NDJSON, one line per month, for long ranges
+    if request.args.get("stream") == "1":
+        return Response(_month_chunks(user_id, tz, start.date(), end_day.date()), mimetype="application/x-ndjson",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    return jsonify({"items": data})
+    with get_read_engine().connect() as conn:
+        if tz:
+            items = _local_items(conn, user_id, tz, start.date(), end_day.date())
+        else:
+            items = _stored_items(conn, user_id, start, end_day)
+    return jsonify({"items": items})
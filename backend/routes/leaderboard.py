@@ -0,0 +1,92 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy import select
+
+from ..models import get_read_engine, tracks, artists
+from ..services.aggregates import global_top, similar_users
+from ..services.cache import cached_json
+from .params import parse_window
+
+bp = Blueprint("leaderboard", __name__)
+
+def _limit(default: int = 10) -> int:
+    try:
+        return max(1, min(int(request.args.get("limit", default)), 100))
+    except ValueError:
+        return default
+
+def _window_start(now: datetime, days: Optional[int]) -> Optional[datetime]:
+    # whole UTC days ending today, None (window=all) for no lower bound
+    if days is None:
+        return None
+    return datetime(now.year, now.month, now.day, tzinfo=timezone.utc) - timedelta(days=days - 1)
+
+@bp.get("/api/global/top-tracks")
+def global_top_tracks():
+    if not session.get("user_id"):
+        return jsonify({"error": "unauthorized"}), 401
+
+    days = parse_window(request.args.get("window", "30d"))
+    now = datetime.now(timezone.utc)
+    start = _window_start(now, days)
+
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        top = global_top(conn, "tracks", start, now, _limit())
+        meta = {
+            r.track_id: r
+            for r in conn.execute(
+                select(tracks.c.track_id, tracks.c.title, artists.c.name.label("artist"))
+                .select_from(tracks.join(artists, tracks.c.artist_id == artists.c.artist_id))
+                .where(tracks.c.track_id.in_([t["id"] for t in top]))
+            )
+        }
+
+    items = []
+    for t in top:
+        m = meta.get(t["id"])
+        items.append({
+            "track_id": t["id"],
+            "title": m.title if m else None,
+            "artist": m.artist if m else None,
+            "plays": t["plays"],
+            "minutes": t["minutes"],
+        })
+    return jsonify({"window_days": days, "items": items})
+
+@bp.get("/api/global/top-artists")
+def global_top_artists():
+    if not session.get("user_id"):
+        return jsonify({"error": "unauthorized"}), 401
+
+    days = parse_window(request.args.get("window", "30d"))
+    now = datetime.now(timezone.utc)
+    start = _window_start(now, days)
+
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        top = global_top(conn, "artists", start, now, _limit())
+        names = dict(conn.execute(
+            select(artists.c.artist_id, artists.c.name).where(artists.c.artist_id.in_([a["id"] for a in top]))
+        ).fetchall())
+
+    items = [
+        {"artist_id": a["id"], "name": names.get(a["id"]), "plays": a["plays"], "minutes": a["minutes"]}
+        for a in top
+    ]
+    return jsonify({"window_days": days, "items": items})
+
+@bp.get("/api/similar-users")
+@cached_json()
+def similar():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        items = similar_users(conn, user_id, _limit())
+    return jsonify({"items": items})
@@ -0,0 +1,50 @@
+from __future__ import annotations
+import json
+import queue
+
+from flask import Blueprint, Response, current_app, jsonify, session
+
+from .. import config
+from ..services import live
+
+bp = Blueprint("live", __name__)
+
+def _event(name: str, data) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@bp.get("/api/live")
+def live_stream():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    if not current_app.config.get("LIVE_STREAMS", True):
+        # a sync worker serves one request at a time, a stream would hold it until the tab closes
+        return jsonify({"error": "live_needs_threads"}), 503
+
+    sched = live.scheduler()
+    q = sched.hub.subscribe(user_id)
+    sched.watch(user_id)
+
+    def stream():
+        try:
+            cursor = sched.last_sent(user_id)
+            yield f"retry: {config.LIVE_HEARTBEAT_SECONDS * 1000}\n"
+            yield _event("hello", {"cursor": cursor.isoformat() if cursor else None})
+            while True:
+                try:
+                    ev = q.get(timeout=config.LIVE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # comment line keeps proxies from timing the stream out
+                    yield ": ping\n\n"
+                    continue
+                if ev is None:
+                    return
+                yield _event(ev["event"], ev["data"])
+        finally:
+            sched.hub.unsubscribe(user_id, q)
+            sched.unwatch(user_id)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
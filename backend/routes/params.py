@@ -0,0 +1,20 @@
+"""
+Query parameters shared by the route modules.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+def parse_window(w: str, default: int = 30) -> Optional[int]:
+    """
+    Days in a ?window= value: "30d", "7d", "90d" or a bare number, at
+    least 1. None for "all", callers drop the lower bound or refuse it.
+    Anything unparseable is default.
+    """
+    w = w.strip().lower()
+    if w == "all":
+        return None
+    try:
+        return max(int(w.replace("d", "")), 1)
+    except ValueError:
+        return default
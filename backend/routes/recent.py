@@ -3,7 +3,8 @@ from flask import Blueprint, jsonify, session
 from datetime import timezone
 
 from sqlalchemy import select, desc
-from ..models import get_engine, plays, tracks, artists
+from ..models import get_read_engine, plays, as_utc
+from ..services.dimensions import dimensions
 
 bp = Blueprint("recent", __name__)
 
@@ -13,33 +14,31 @@ def recent():
     if not user_id:
         return jsonify({"error": "unauthorized"}), 401
 
-    eng = get_engine()
-    with eng.begin() as conn:
+    eng = get_read_engine()
+    with eng.connect() as conn:
         q = (
             select(
                 plays.c.played_at,
                 plays.c.elapsed_ms,
                 plays.c.is_skip,
-                tracks.c.title,
-                tracks.c.album_name,
-                artists.c.name.label("artist"),
+                plays.c.track_id,
             )
-            .select_from(plays.join(tracks, plays.c.track_id == tracks.c.track_id).join(artists, tracks.c.artist_id == artists.c.artist_id))
             .where(plays.c.user_id == user_id)
             .order_by(desc(plays.c.played_at))
             .limit(20)
         )
         rows = conn.execute(q).mappings().all()
 
-    data = [
-        {
-            "played_at": r["played_at"].isoformat(),
+    info = dimensions().track_labels(r["track_id"] for r in rows)
+    data = []
+    for r in rows:
+        title, album, artist = info.get(r["track_id"], (None, None, None))
+        data.append({
+            "played_at": as_utc(r["played_at"]).isoformat(),
             "elapsed_ms": r["elapsed_ms"],
             "is_skip": r["is_skip"],
-            "title": r["title"],
-            "artist": r["artist"],
-            "album": r["album_name"],
-        }
-        for r in rows
-    ]
+            "title": title,
+            "artist": artist,
+            "album": album,
+        })
     return jsonify({"items": data})
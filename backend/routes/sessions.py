@@ -0,0 +1,89 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy import select, and_, asc
+
+from ..models import get_read_engine, sessions, user_streaks, artists, as_utc
+from ..services import timezones
+from ..services.cache import cached_json
+from .heatmap import _parse_day
+
+bp = Blueprint("sessions", __name__)
+
+@bp.get("/api/sessions")
+@cached_json()
+def list_sessions():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    now = datetime.now(timezone.utc)
+    start_param = request.args.get("start")
+    end_param = request.args.get("end")
+    start = _parse_day(start_param) if start_param else datetime(now.year, now.month, now.day, tzinfo=timezone.utc) - timedelta(days=7)
+    # end is inclusive of the whole day
+    end = _parse_day(end_param) + timedelta(days=1) if end_param else now
+
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        q = (
+            select(
+                sessions.c.start_at,
+                sessions.c.end_at,
+                sessions.c.plays,
+                sessions.c.ms,
+                sessions.c.top_artist_id,
+                artists.c.name,
+            )
+            .select_from(sessions.outerjoin(artists, sessions.c.top_artist_id == artists.c.artist_id))
+            .where(and_(sessions.c.user_id == user_id, sessions.c.start_at >= start, sessions.c.start_at < end))
+            .order_by(asc(sessions.c.start_at))
+        )
+        rows = conn.execute(q).mappings().all()
+
+    items = [
+        {
+            "start": as_utc(r["start_at"]).isoformat(),
+            "end": as_utc(r["end_at"]).isoformat(),
+            "plays": r["plays"],
+            "minutes": int(r["ms"] // 60000),
+            "top_artist_id": r["top_artist_id"],
+            "top_artist_name": r["name"],
+        }
+        for r in rows
+    ]
+    return jsonify({"items": items})
+
+@bp.get("/api/streaks")
+@cached_json()
+def streaks():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        row = conn.execute(select(user_streaks).where(user_streaks.c.user_id == user_id)).mappings().fetchone()
+        tz = timezones.user_tz(conn, user_id)
+
+    if not row or row["current_end"] is None:
+        return jsonify({"current": None, "longest": None})
+
+    # streak days are local dates, stored at midnight UTC like daily_totals
+    today = datetime.now(timezones.zone(tz)).date()
+    current_end = as_utc(row["current_end"]).date()
+    # a streak is still alive until a full day passes with no plays
+    active = (today - current_end).days <= 1
+    return jsonify({
+        "current": {
+            "start": as_utc(row["current_start"]).date().isoformat(),
+            "end": current_end.isoformat(),
+            "days": row["current_days"] if active else 0,
+            "active": active,
+        },
+        "longest": {
+            "start": as_utc(row["longest_start"]).date().isoformat(),
+            "end": as_utc(row["longest_end"]).date().isoformat(),
+            "days": row["longest_days"],
+        },
+    })
@@ -0,0 +1,34 @@
+from __future__ import annotations
+from flask import Blueprint, jsonify, request, session
+
+from ..models import get_read_engine
+from ..services import cache, timezones
+
+bp = Blueprint("settings", __name__)
+
+@bp.get("/api/settings/timezone")
+def get_timezone():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    with get_read_engine().connect() as conn:
+        tz = timezones.user_tz(conn, user_id)
+    return jsonify({"timezone": tz})
+
+@bp.put("/api/settings/timezone")
+def put_timezone():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    body = request.get_json(silent=True) or {}
+    tz = body.get("timezone")
+    if not isinstance(tz, str):
+        return jsonify({"error": "missing_timezone"}), 400
+    try:
+        days = timezones.set_timezone(user_id, tz)
+    except ValueError:
+        return jsonify({"error": "invalid_timezone"}), 400
+    cache.invalidate(user_id)
+    return jsonify({"timezone": tz, "days": days})
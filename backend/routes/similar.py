@@ -0,0 +1,81 @@
+from __future__ import annotations
+from datetime import date
+from typing import Any, Dict, List
+
+from flask import Blueprint, jsonify, request, session
+
+from ..services import similarity
+from ..services.cache import cached_json
+from ..services.dimensions import dimensions
+
+bp = Blueprint("similar", __name__)
+
+def _limit(default: int = 10) -> int:
+    try:
+        return max(1, min(int(request.args.get("limit", default)), 100))
+    except ValueError:
+        return default
+
+def _with_labels(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    labels = dimensions().track_labels(i["id"] for i in items)
+    out = []
+    for i in items:
+        title, album, artist = labels.get(i["id"], (None, None, None))
+        out.append(dict(i, title=title, album=album, artist=artist))
+    return out
+
+@bp.get("/api/similar/tracks/<track_id>")
+@cached_json()
+def similar_tracks(track_id: str):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    if similarity.load(user_id) is None:
+        return jsonify({"error": "not_indexed"}), 404
+
+    items = similarity.similar_tracks(user_id, track_id, _limit())
+    if items is None:
+        return jsonify({"error": "unknown_track"}), 404
+    return jsonify({"track_id": track_id, "items": _with_labels(items)})
+
+@bp.get("/api/revisit")
+@cached_json()
+def revisit():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    out = similarity.revisit(user_id, _limit(20))
+    if out is None:
+        return jsonify({"error": "not_indexed"}), 404
+    return jsonify({
+        "as_of": out["as_of"].isoformat() if out["as_of"] else None,
+        "quiet_days": similarity.REVISIT_QUIET_DAYS,
+        "seeds": out["seeds"],
+        "items": _with_labels(out["items"]),
+    })
+
+@bp.get("/api/similar/days/<day>")
+@cached_json()
+def similar_days(day: str):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        d = date.fromisoformat(day)
+    except ValueError:
+        return jsonify({"error": "invalid_day"}), 400
+    if similarity.load(user_id) is None:
+        return jsonify({"error": "not_indexed"}), 404
+
+    items = similarity.similar_days(user_id, d, _limit())
+    if items is None:
+        return jsonify({"error": "unknown_day"}), 404
+    names = dimensions().artists(a for i in items for a in i["top_artists"])
+    return jsonify({
+        "day": d.isoformat(),
+        "items": [
+            dict(i, day=i["day"].isoformat(), top_artists=[{"id": a, "name": names.get(a)} for a in i["top_artists"]])
+            for i in items
+        ],
+    })
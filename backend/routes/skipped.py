@@ -1,60 +1,80 @@
 from __future__ import annotations
 from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
 from flask import Blueprint, jsonify, request, session
-from sqlalchemy import select, func, and_, desc
 
-from ..models import get_engine, plays, tracks, artists
+from ..models import get_read_engine
+from ..services import sketches, statements
+from ..services.dimensions import dimensions
+from ..services.partitions import plays_source
+from ..services.cache import cached_json
+from .params import parse_window
 
 bp = Blueprint("skipped", __name__)
 
-def _parse_window(w: str) -> int:
-    # supports "30d", "7d", "90d"
-    try:
-        days = int(w.strip().lower().replace("d", ""))
-        return max(days, 1)
-    except Exception:
-        return 30
+def _approx(user_id: str, start: Optional[datetime], end: datetime, days: Optional[int]) -> Dict[str, Any]:
+    # merged monthly sketches, see services/sketches.py for the bounds
+    with get_read_engine().connect() as conn:
+        sk = sketches.window(conn, user_id, start, end)
+        top = sk.track_skips.top(20)
+    info = dimensions().track_labels(t for t, _, _ in top)
+
+    items = []
+    for track_id, skips, err in top:
+        plays_count, ms = sk.track_counts(track_id)
+        title, _album, artist = info.get(track_id, (None, None, None))
+        items.append({
+            "track_id": track_id,
+            "title": title,
+            "artist": artist,
+            "plays": plays_count,
+            "skips": skips,
+            "skips_error": err,
+            "skip_rate": round(min(skips / plays_count, 1.0), 3) if plays_count else 0.0,
+            "minutes": int(ms // 60000),
+        })
+    return {
+        "window_days": days,
+        "approximate": {"skips_floor": sk.track_skips.floor, "plays_error": int(sketches.cm_error(sk.plays))},
+        "items": items,
+    }
 
 @bp.get("/api/most-skipped")
+@cached_json()
 def most_skipped():
     user_id = session.get("user_id")
     if not user_id:
         return jsonify({"error": "unauthorized"}), 401
 
     w = request.args.get("window", "30d")
-    days = _parse_window(w)
+    days = parse_window(w)
     now = datetime.now(timezone.utc)
-    start = now - timedelta(days=days)
+    start = now - timedelta(days=days) if days else None
+    if request.args.get("approx") in ("1", "true"):
+        return jsonify(_approx(user_id, start, now, days))
+    if start is None:
+        # as on the summary, an exact all time list would group every play
+        return jsonify({"error": "window_all_needs_approx"}), 400
 
-    eng = get_engine()
-    with eng.begin() as conn:
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        p = plays_source(conn, start, now, user_id=user_id)
         # per track counts and skip rate
-        q = (
-            select(
-                tracks.c.track_id,
-                tracks.c.title,
-                artists.c.name.label("artist"),
-                func.count().label("plays"),
-                func.sum(func.case((plays.c.is_skip.is_(True), 1), else_=0)).label("skips"),
-                func.coalesce(func.sum(plays.c.elapsed_ms), 0).label("ms"),
-            )
-            .select_from(plays.join(tracks, plays.c.track_id == tracks.c.track_id).join(artists, tracks.c.artist_id == artists.c.artist_id))
-            .where(and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now))
-            .group_by(tracks.c.track_id, tracks.c.title, artists.c.name)
-            .order_by(desc("skips"), desc("plays"))
-            .limit(20)
-        )
-        rows = conn.execute(q).fetchall()
+        rows = conn.execute(
+            statements.most_skipped(p), {"user_id": user_id, "start": start, "end": now, "limit": 20}
+        ).fetchall()
 
+    info = dimensions().track_labels(r.track_id for r in rows)
     items = []
     for r in rows:
+        title, _album, artist = info.get(r.track_id, (None, None, None))
         plays_count = int(r.plays or 0)
         skips = int(r.skips or 0)
         rate = float(skips / plays_count) if plays_count else 0.0
         items.append({
             "track_id": r.track_id,
-            "title": r.title,
-            "artist": r.artist,
+            "title": title,
+            "artist": artist,
             "plays": plays_count,
             "skips": skips,
             "skip_rate": round(rate, 3),
@@ -1,74 +1,92 @@
 from __future__ import annotations
 from datetime import datetime, timedelta, timezone
-from flask import Blueprint, jsonify, session
-from sqlalchemy import select, func, and_, desc
+from typing import Optional
+from flask import Blueprint, jsonify, request, session
 
-from ..models import get_engine, plays, tracks, artists
+from ..models import get_read_engine
+from ..services import sketches, statements
+from ..services.dimensions import dimensions
+from ..services.partitions import plays_source
+from ..services.cache import cached_json
+from .params import parse_window
 
 bp = Blueprint("summary", __name__)
 
+def _approx(user_id: str, start: Optional[datetime], end: datetime):
+    # totals stay exact, distinct tracks and the top lists come from sketches
+    with get_read_engine().connect() as conn:
+        sk = sketches.window(conn, user_id, start, end)
+        top_t = sk.track_ms.top(5)
+        top_a = sk.artist_ms.top(5)
+    info = dimensions().tracks(t for t, _, _ in top_t)
+    names = dimensions().artists(a for a, _, _ in top_a)
+
+    return {
+        "window": {"start": start.isoformat() if start else None, "end": end.isoformat()},
+        "totals": {
+            "minutes_listened": int(sk.ms // 60000),
+            "plays": sk.plays,
+            "skips": sk.skips,
+            "repeats": max(sk.plays - sk.distinct_tracks(), 0),
+        },
+        "top_tracks": [
+            {"track_id": t, "title": info[t][0] if t in info else None, "minutes": int(ms // 60000), "minutes_error": int(err // 60000)}
+            for t, ms, err in top_t
+        ],
+        "top_artists": [
+            {"artist_id": a, "name": names.get(a), "minutes": int(ms // 60000), "minutes_error": int(err // 60000)}
+            for a, ms, err in top_a
+        ],
+        "approximate": {"distinct_tracks_rse": round(1.04 / (sketches.REGISTERS ** 0.5), 4)},
+    }
+
 @bp.get("/api/summary/last30")
+@cached_json()
 def summary_last30():
     user_id = session.get("user_id")
     if not user_id:
         return jsonify({"error": "unauthorized"}), 401
 
+    # ?window= as for most skipped, "all" only with approx
+    days = parse_window(request.args.get("window", "30d"))
     now = datetime.now(timezone.utc)
-    start = now - timedelta(days=30)
-
-    eng = get_engine()
-    with eng.begin() as conn:
-        # totals
-        s_ms = select(func.coalesce(func.sum(plays.c.elapsed_ms), 0)).where(
-            and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now)
-        )
-        total_ms = conn.execute(s_ms).scalar_one()
-        total_minutes = int(total_ms // 60000)
+    if request.args.get("approx") in ("1", "true"):
+        return jsonify(_approx(user_id, now - timedelta(days=days) if days else None, now))
+    if days is None:
+        # exact all time totals would group every play, sketches answer that
+        return jsonify({"error": "window_all_needs_approx"}), 400
+    start = now - timedelta(days=days)
 
-        s_plays = select(func.count()).where(
-            and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now)
-        )
-        total_plays = conn.execute(s_plays).scalar_one()
+    params = {"user_id": user_id, "start": start, "end": now}
+    eng = get_read_engine()
+    with eng.connect() as conn:
+        p = plays_source(conn, start, now, user_id=user_id)
+        # totals, repeats = plays minus distinct tracks
+        t = conn.execute(statements.window_totals(p), params).one()
+        total_minutes = int(t.ms // 60000)
+        total_plays = t.plays
+        skips = t.skips
+        repeats = int(t.plays - t.distinct_tracks)
 
-        s_skips = select(func.count()).where(
-            and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now, plays.c.is_skip.is_(True))
-        )
-        skips = conn.execute(s_skips).scalar_one()
+        track_rows = conn.execute(statements.top_tracks(p), dict(params, limit=5)).fetchall()
+        artist_rows = conn.execute(statements.top_artists(p), dict(params, limit=5)).fetchall()
 
-        s_repeats = (
-            select(func.count(), func.count(func.distinct(plays.c.track_id)))
-            .where(and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now))
-        )
-        tp, dt = conn.execute(s_repeats).fetchone()
-        repeats = int(tp - dt)
+    # titles and names resolve in memory
+    dims = dimensions()
+    titles = dims.tracks(r.track_id for r in track_rows)
+    names = dims.artists(r.artist_id for r in artist_rows)
 
-        # top tracks by minutes
-        s_top_tracks = (
-            select(tracks.c.track_id, tracks.c.title, func.coalesce(func.sum(plays.c.elapsed_ms), 0).label("ms"))
-            .select_from(plays.join(tracks, plays.c.track_id == tracks.c.track_id))
-            .where(and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now))
-            .group_by(tracks.c.track_id, tracks.c.title)
-            .order_by(desc("ms"))
-            .limit(5)
-        )
-        top_tracks = [
-            {"track_id": r.track_id, "title": r.title, "minutes": int(r.ms // 60000)}
-            for r in conn.execute(s_top_tracks).fetchall()
-        ]
+    # top tracks by minutes
+    top_tracks = [
+        {"track_id": r.track_id, "title": titles[r.track_id][0] if r.track_id in titles else None, "minutes": int(r.ms // 60000)}
+        for r in track_rows
+    ]
 
-        # top artists by minutes
-        s_top_artists = (
-            select(artists.c.artist_id, artists.c.name, func.coalesce(func.sum(plays.c.elapsed_ms), 0).label("ms"))
-            .select_from(plays.join(tracks, plays.c.track_id == tracks.c.track_id).join(artists, tracks.c.artist_id == artists.c.artist_id))
-            .where(and_(plays.c.user_id == user_id, plays.c.played_at >= start, plays.c.played_at < now))
-            .group_by(artists.c.artist_id, artists.c.name)
-            .order_by(desc("ms"))
-            .limit(5)
-        )
-        top_artists = [
-            {"artist_id": r.artist_id, "name": r.name, "minutes": int(r.ms // 60000)}
-            for r in conn.execute(s_top_artists).fetchall()
-        ]
+    # top artists by minutes
+    top_artists = [
+        {"artist_id": r.artist_id, "name": names.get(r.artist_id), "minutes": int(r.ms // 60000)}
+        for r in artist_rows
+    ]
 
     return jsonify({
         "window": {"start": start.isoformat(), "end": now.isoformat()},
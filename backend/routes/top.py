@@ -0,0 +1,78 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable
+
+from flask import Blueprint, jsonify, request, session
+
+from ..models import get_read_engine
+from ..services import top_items
+from ..services.cache import cached_json
+from ..services.dimensions import dimensions
+from .params import parse_window
+
+bp = Blueprint("top", __name__)
+
+MAX_POINTS = 12
+
+def _args(kind: str):
+    time_range = request.args.get("range", "medium_term")
+    if kind not in top_items.KINDS:
+        return None, (jsonify({"error": "invalid_kind"}), 400)
+    if time_range not in top_items.RANGES:
+        return None, (jsonify({"error": "invalid_range"}), 400)
+    return time_range, None
+
+def _labels(kind: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    if kind == "artists":
+        return {a: {"name": name} for a, name in dimensions().artists(ids).items()}
+    return {t: {"name": title, "artist": artist} for t, (title, _album, artist) in dimensions().track_labels(ids).items()}
+
+@bp.get("/api/top/<kind>")
+@cached_json()
+def top_list(kind: str):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    time_range, err = _args(kind)
+    if err:
+        return err
+
+    with get_read_engine().connect() as conn:
+        snap = top_items.snapshot_at(conn, user_id, kind, time_range)
+    if snap is None:
+        return jsonify({"kind": kind, "range": time_range, "as_of": None, "items": []})
+    labels = _labels(kind, snap.ids)
+    items = [dict({"rank": i + 1, "id": t}, **labels.get(t, {})) for i, t in enumerate(snap.ids)]
+    return jsonify({"kind": kind, "range": time_range, "as_of": snap.taken_at.isoformat(), "items": items})
+
+@bp.get("/api/top/<kind>/movement")
+@cached_json()
+def top_movement(kind: str):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    time_range, err = _args(kind)
+    if err:
+        return err
+    # window=all compares against the first snapshot
+    days = parse_window(request.args.get("window", "28d"))
+    try:
+        points = max(1, min(int(request.args.get("points", 1)), MAX_POINTS))
+    except ValueError:
+        points = 1
+
+    since = datetime.now(timezone.utc) - timedelta(days=days) if days else None
+    out = top_items.movement(user_id, kind, time_range, since, points)
+    if out is None:
+        return jsonify({"kind": kind, "range": time_range, "as_of": None, "compared_to": None,
+                        "points": [], "items": [], "dropped": []})
+    labels = _labels(kind, [i["id"] for i in out["items"]] + [d["id"] for d in out["dropped"]])
+    return jsonify({
+        "kind": kind,
+        "range": time_range,
+        "as_of": out["as_of"].isoformat(),
+        "compared_to": out["compared_to"].isoformat(),
+        "points": [p.isoformat() for p in out["points"]],
+        "items": [dict(i, **labels.get(i["id"], {})) for i in out["items"]],
+        "dropped": [dict(d, **labels.get(d["id"], {})) for d in out["dropped"]],
+    })
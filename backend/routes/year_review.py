@@ -0,0 +1,22 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+
+from flask import Blueprint, jsonify, session
+
+from ..services import year_review
+from ..services.cache import cached_json
+
+bp = Blueprint("year_review", __name__)
+
+@bp.get("/api/year-in-review/<int:year>")
+@cached_json()
+def year_in_review(year: int):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    if not 2000 <= year <= datetime.now(timezone.utc).year:
+        return jsonify({"error": "invalid_year"}), 400
+
+    # the stored report while its data version holds, rebuilt otherwise
+    out = year_review.generate(user_id, year)
+    return jsonify(dict(out["report"], version=out["version"]))
@@ -0,0 +1,66 @@
+"""
+Production serving entry point:
+- gunicorn prefork server running create_app() in WEB_WORKERS processes
+- the app is imported once in the master, each worker builds its own engine
+  on first use: get_engine() sees the new pid and drops the inherited one
+  without closing the master's connections
+- gthread workers with WEB_THREADS threads, an /api/live stream holds a
+  thread for as long as the tab stays open; --threads 1 gives sync workers
+  and /api/live answers 503 there instead of pinning whole workers
+- optional SHARED_CACHE_PATH cache shared by the workers
+
+Usage: python -m backend.serve --workers 4 --bind 0.0.0.0:5000
+The dev server stays on python -m backend.app.
+"""
+
+from __future__ import annotations
+import argparse
+import multiprocessing
+from typing import Any, Dict, Optional
+
+from gunicorn.app.base import BaseApplication
+
+from . import config
+from .app import create_app
+
+def default_workers() -> int:
+    return multiprocessing.cpu_count() * 2 + 1
+
+class StatsServer(BaseApplication):
+    def __init__(self, app, options: Optional[Dict[str, Any]] = None):
+        self.application = app
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+
+    def load(self):
+        return self.application
+
+def options(bind: str, workers: int, threads: int) -> Dict[str, Any]:
+    return {
+        "bind": bind,
+        "workers": workers or default_workers(),
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "preload_app": True,
+        "accesslog": None,
+        "timeout": 60,
+    }
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Serve the backend with a prefork server")
+    p.add_argument("--bind", default=config.WEB_BIND)
+    p.add_argument("--workers", type=int, default=config.WEB_WORKERS, help="0 means 2 x cores + 1")
+    p.add_argument("--threads", type=int, default=config.WEB_THREADS)
+    args = p.parse_args(argv)
+    opts = options(args.bind, args.workers, args.threads)
+    app = create_app()
+    app.config["LIVE_STREAMS"] = opts["worker_class"] != "sync"
+    StatsServer(app, opts).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Cross user aggregates:
+- per user per day track contributions in user_track_daily
+- global per day track and artist plays and ms, adjusted by delta
+- per user artist vectors for similarity
+- full rebuild from plays for the periodic job
+- cosine similarity over artist ms with numpy
+"""
+
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, func, and_, delete, insert
+
+from ..models import (
+    get_engine, tracks, user_info, as_utc,
+    user_track_daily, global_track_daily, global_artist_daily, user_artist_totals,
+)
+from .rollups import _day_bounds
+from .upsert import increment, bulk_load
+from .partitions import plays_source
+
+def rollup_global(user_id: str, days: Iterable[datetime]) -> Dict[str, int]:
+    """
+    Re-aggregate a user's days and push the difference into the global tables.
+    Safe to call repeatedly for the same days.
+    """
+    days = sorted(days)
+    if not days:
+        return {"days_changed": 0}
+    eng = get_engine()
+    changed = 0
+    with eng.begin() as conn:
+        # resolve storage once, before any write opens the transaction
+        p = plays_source(conn, _day_bounds(days[0])[0], _day_bounds(days[-1])[1], user_id=user_id)
+        for day in days:
+            start, end = _day_bounds(day)
+            new = {
+                r.track_id: (int(r.n), int(r.ms))
+                for r in conn.execute(
+                    select(p.c.track_id, func.count().label("n"), func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"))
+                    .where(and_(p.c.user_id == user_id, p.c.played_at >= start, p.c.played_at < end))
+                    .group_by(p.c.track_id)
+                )
+            }
+            old = {
+                r.track_id: (int(r.plays), int(r.ms))
+                for r in conn.execute(
+                    select(user_track_daily.c.track_id, user_track_daily.c.plays, user_track_daily.c.ms)
+                    .where(and_(user_track_daily.c.user_id == user_id, user_track_daily.c.day == start))
+                )
+            }
+            if new == old:
+                continue
+
+            track_deltas: Dict[str, Tuple[int, int]] = {}
+            for tid in new.keys() | old.keys():
+                n1, ms1 = new.get(tid, (0, 0))
+                n0, ms0 = old.get(tid, (0, 0))
+                if (n1 - n0, ms1 - ms0) != (0, 0):
+                    track_deltas[tid] = (n1 - n0, ms1 - ms0)
+            if not track_deltas:
+                continue
+
+            artist_of = dict(conn.execute(
+                select(tracks.c.track_id, tracks.c.artist_id).where(tracks.c.track_id.in_(list(track_deltas)))
+            ).fetchall())
+            artist_deltas: Dict[str, List[int]] = {}
+            for tid, (dn, dms) in track_deltas.items():
+                aid = artist_of.get(tid)
+                if aid is None:
+                    continue
+                acc = artist_deltas.setdefault(aid, [0, 0])
+                acc[0] += dn
+                acc[1] += dms
+
+            increment(conn, global_track_daily, [
+                {"day": start, "track_id": tid, "plays": dn, "ms": dms} for tid, (dn, dms) in track_deltas.items()
+            ], ["day", "track_id"], ["plays", "ms"])
+            if artist_deltas:
+                increment(conn, global_artist_daily, [
+                    {"day": start, "artist_id": aid, "plays": dn, "ms": dms} for aid, (dn, dms) in artist_deltas.items()
+                ], ["day", "artist_id"], ["plays", "ms"])
+                increment(conn, user_artist_totals, [
+                    {"user_id": user_id, "artist_id": aid, "plays": dn, "ms": dms} for aid, (dn, dms) in artist_deltas.items()
+                ], ["user_id", "artist_id"], ["plays", "ms"])
+
+            conn.execute(delete(user_track_daily).where(and_(user_track_daily.c.user_id == user_id, user_track_daily.c.day == start)))
+            if new:
+                bulk_load(conn, user_track_daily, [
+                    {"user_id": user_id, "day": start, "track_id": tid, "plays": n, "ms": ms} for tid, (n, ms) in new.items()
+                ])
+            conn.execute(delete(global_track_daily).where(and_(global_track_daily.c.day == start, global_track_daily.c.plays <= 0)))
+            conn.execute(delete(global_artist_daily).where(and_(global_artist_daily.c.day == start, global_artist_daily.c.plays <= 0)))
+            changed += 1
+
+        conn.execute(delete(user_artist_totals).where(and_(user_artist_totals.c.user_id == user_id, user_artist_totals.c.plays <= 0)))
+
+    return {"days_changed": changed}
+
+def rebuild_global(batch: int = 10_000) -> Dict[str, int]:
+    """
+    Recompute every aggregate from plays.
+    Streams plays in (user, played_at) order and flushes on day boundaries,
+    so memory stays bounded by the batch size.
+    """
+    eng = get_engine()
+    written = 0
+    # one transaction so readers never see the tables half built
+    with eng.begin() as conn:
+        p = plays_source(conn)
+        for t in (user_track_daily, global_track_daily, global_artist_daily, user_artist_totals):
+            conn.execute(delete(t))
+
+        # on the statement, Connection.execution_options would stream every later statement too
+        result = conn.execute(
+            select(p.c.user_id, p.c.track_id, p.c.played_at, p.c.elapsed_ms)
+            .order_by(p.c.user_id, p.c.played_at)
+            .execution_options(yield_per=batch)
+        )
+        acc: Dict[Tuple[str, datetime, str], List[int]] = {}
+        current = None
+        for r in result:
+            pa = as_utc(r.played_at)
+            user_day = (r.user_id, datetime(pa.year, pa.month, pa.day, tzinfo=timezone.utc))
+            if user_day != current and len(acc) >= batch:
+                written += _flush_user_days(conn, acc)
+                acc = {}
+            current = user_day
+            key = (user_day[0], user_day[1], r.track_id)
+            v = acc.setdefault(key, [0, 0])
+            v[0] += 1
+            v[1] += int(r.elapsed_ms or 0)
+        written += _flush_user_days(conn, acc)
+        _regroup(conn)
+
+    return {"user_track_days": written}
+
+def regroup_global() -> None:
+    """
+    Recompute the global and per user artist tables from user_track_daily,
+    for when that table was rebuilt user by user.
+    """
+    with get_engine().begin() as conn:
+        for t in (global_track_daily, global_artist_daily, user_artist_totals):
+            conn.execute(delete(t))
+        _regroup(conn)
+
+def _regroup(conn) -> None:
+    utd = user_track_daily
+    conn.execute(insert(global_track_daily).from_select(
+        ["day", "track_id", "plays", "ms"],
+        select(utd.c.day, utd.c.track_id, func.sum(utd.c.plays), func.sum(utd.c.ms)).group_by(utd.c.day, utd.c.track_id),
+    ))
+    joined = utd.join(tracks, utd.c.track_id == tracks.c.track_id)
+    conn.execute(insert(global_artist_daily).from_select(
+        ["day", "artist_id", "plays", "ms"],
+        select(utd.c.day, tracks.c.artist_id, func.sum(utd.c.plays), func.sum(utd.c.ms))
+        .select_from(joined).group_by(utd.c.day, tracks.c.artist_id),
+    ))
+    conn.execute(insert(user_artist_totals).from_select(
+        ["user_id", "artist_id", "plays", "ms"],
+        select(utd.c.user_id, tracks.c.artist_id, func.sum(utd.c.plays), func.sum(utd.c.ms))
+        .select_from(joined).group_by(utd.c.user_id, tracks.c.artist_id),
+    ))
+
+def _flush_user_days(conn, acc: Dict[Tuple[str, datetime, str], List[int]]) -> int:
+    if not acc:
+        return 0
+    bulk_load(conn, user_track_daily, [
+        {"user_id": u, "day": d, "track_id": t, "plays": v[0], "ms": v[1]} for (u, d, t), v in acc.items()
+    ])
+    return len(acc)
+
+def global_top(conn, kind: str, start: Optional[datetime], end: datetime, limit: int) -> List[Dict[str, Any]]:
+    """
+    Top tracks or artists across all users by ms in [start, end), start
+    None for all time.
+    """
+    if kind == "tracks":
+        t, key = global_track_daily, global_track_daily.c.track_id
+    else:
+        t, key = global_artist_daily, global_artist_daily.c.artist_id
+    window = t.c.day < end if start is None else and_(t.c.day >= start, t.c.day < end)
+    q = (
+        select(key.label("id"), func.sum(t.c.plays).label("plays"), func.sum(t.c.ms).label("ms"))
+        .where(window)
+        .group_by(key)
+        .order_by(func.sum(t.c.ms).desc())
+        .limit(limit)
+    )
+    return [{"id": r.id, "plays": int(r.plays), "minutes": int(r.ms // 60000)} for r in conn.execute(q)]
+
+def similar_users(conn, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Cosine similarity between user_id and every other user over all time
+    artist ms. One pass over user_artist_totals, no per pair queries.
+    """
+    import numpy as np
+
+    rows = conn.execute(
+        select(user_artist_totals.c.user_id, user_artist_totals.c.artist_id, user_artist_totals.c.ms)
+        .where(user_artist_totals.c.ms > 0)
+    ).fetchall()
+    if not rows:
+        return []
+
+    uids, u_idx = np.unique(np.array([r[0] for r in rows], dtype=object), return_inverse=True)
+    _aids, a_idx = np.unique(np.array([r[1] for r in rows], dtype=object), return_inverse=True)
+    ms = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+
+    hit = np.flatnonzero(uids == user_id)
+    if hit.size == 0:
+        return []
+    me = int(hit[0])
+
+    n_users = len(uids)
+    norms = np.sqrt(np.bincount(u_idx, weights=ms * ms, minlength=n_users))
+    mine = u_idx == me
+    target = np.zeros(len(_aids), dtype=np.float64)
+    target[a_idx[mine]] = ms[mine]
+
+    hits = target[a_idx]
+    dots = np.bincount(u_idx, weights=ms * hits, minlength=n_users)
+    shared = np.bincount(u_idx, weights=(hits > 0).astype(np.float64), minlength=n_users)
+    denom = norms * norms[me]
+    sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+    sims[me] = -1.0
+
+    k = min(limit, n_users - 1)
+    if k <= 0:
+        return []
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.argsort(-sims[top])]
+
+    names = dict(conn.execute(
+        select(user_info.c.user_id, user_info.c.display_name).where(user_info.c.user_id.in_([uids[i] for i in top]))
+    ).fetchall())
+    return [
+        {
+            "user_id": uids[i],
+            "display_name": names.get(uids[i]),
+            "similarity": round(float(sims[i]), 4),
+            "shared_artists": int(shared[i]),
+        }
+        for i in top
+        if sims[i] > 0
+    ]
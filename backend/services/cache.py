@@ -0,0 +1,113 @@
+"""
+Cross process cache for hot per user aggregates:
+- one SQLite file (SHARED_CACHE_PATH) shared by every serving worker
+- entries are JSON keyed by user and request path, with a TTL
+- syncs call invalidate(user_id) so any process sees fresh data next read
+- lease() lets one process own a periodic job across workers
+Disabled when SHARED_CACHE_PATH is empty, every call is then a no-op.
+"""
+
+from __future__ import annotations
+import functools
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Optional
+
+from .. import config
+
+CACHE_PATH = config.SHARED_CACHE_PATH
+DEFAULT_TTL = config.SHARED_CACHE_TTL
+
+_conn: Optional[sqlite3.Connection] = None
+_conn_pid: Optional[int] = None
+
+def enabled() -> bool:
+    return bool(CACHE_PATH)
+
+def _db() -> sqlite3.Connection:
+    global _conn, _conn_pid
+    # one connection per process, never reuse one inherited across fork
+    if _conn is None or _conn_pid != os.getpid():
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " user_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, key)) WITHOUT ROWID"
+        )
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+def get(user_id: str, key: str) -> Optional[Any]:
+    if not enabled():
+        return None
+    row = _db().execute(
+        "SELECT value FROM cache WHERE user_id = ? AND key = ? AND expires_at > ?", (user_id, key, time.time())
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def put(user_id: str, key: str, value: Any, ttl: Optional[int] = None) -> None:
+    if not enabled():
+        return
+    _db().execute(
+        "INSERT OR REPLACE INTO cache (user_id, key, value, expires_at) VALUES (?, ?, ?, ?)",
+        (user_id, key, json.dumps(value), time.time() + (ttl or DEFAULT_TTL)),
+    )
+
+def invalidate(user_id: str) -> None:
+    if not enabled():
+        return
+    _db().execute("DELETE FROM cache WHERE user_id = ?", (user_id,))
+
+def purge_expired() -> int:
+    if not enabled():
+        return 0
+    return _db().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+def lease(name: str, ttl: float) -> bool:
+    """
+    Take or renew a named lease for this process. True when this process
+    holds it for the next ttl seconds. Always True with the cache disabled,
+    a single process has nobody to share with.
+    """
+    if not enabled():
+        return True
+    now = time.time()
+    pid = os.getpid()
+    cur = _db().execute(
+        "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+        "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+        (name, pid, now + ttl, now),
+    )
+    return cur.rowcount > 0
+
+def cached_json(ttl: Optional[int] = None) -> Callable:
+    """
+    Route decorator: serve the JSON body from the cache for the session
+    user and full request path, store successful responses.
+    """
+    def wrap(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def inner(*args, **kwargs):
+            from flask import jsonify, request, session
+
+            user_id = session.get("user_id")
+            if not enabled() or not user_id:
+                return view(*args, **kwargs)
+            key = request.full_path
+            hit = get(user_id, key)
+            if hit is not None:
+                return jsonify(hit)
+            resp = view(*args, **kwargs)
+            if getattr(resp, "status_code", None) == 200 and resp.is_json:
+                put(user_id, key, resp.get_json(), ttl)
+            return resp
+        return inner
+    return wrap
@@ -0,0 +1,95 @@
+"""
+Response compression for /api/*:
+- picks br or gzip from Accept-Encoding, in COMPRESS_ENCODINGS order, br
+  only when the optional brotli package is installed
+- whole bodies under COMPRESS_MIN_BYTES go out as they are
+- streamed NDJSON is compressed chunk by chunk with a flush after each,
+  so the client can decode every chunk as it arrives
+- Server-Sent Events, CSV downloads and bodies that already carry a
+  Content-Encoding are left alone
+"""
+
+from __future__ import annotations
+import functools
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+from .. import config
+
+ENCODINGS = [e.strip() for e in config.COMPRESS_ENCODINGS.split(",") if e.strip()]
+MIN_BYTES = config.COMPRESS_MIN_BYTES
+GZIP_LEVEL = config.COMPRESS_GZIP_LEVEL
+BROTLI_QUALITY = config.COMPRESS_BROTLI_QUALITY
+
+COMPRESSIBLE = {"application/json", "text/plain"}
+STREAMED = {"application/x-ndjson"}
+
+@functools.lru_cache(maxsize=1)
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def available() -> List[str]:
+    return [e for e in ENCODINGS if e == "gzip" or (e == "br" and _brotli() is not None)]
+
+def negotiate(accept) -> Optional[str]:
+    """
+    The first available encoding the client takes with the highest q, None
+    for identity. accept is werkzeug's request.accept_encodings.
+    """
+    best, best_q = None, 0.0
+    for enc in available():
+        q = accept[enc]
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return c.compress(body) + c.flush()
+
+def compress_stream(chunks: Iterable, encoding: str) -> Iterator[bytes]:
+    if encoding == "br":
+        c = _brotli().Compressor(quality=BROTLI_QUALITY)
+        feed, flush, finish = c.process, c.flush, c.finish
+    else:
+        z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        feed, flush, finish = z.compress, lambda: z.flush(zlib.Z_SYNC_FLUSH), z.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        out = feed(chunk) + flush()
+        if out:
+            yield out
+    yield finish()
+
+def after_request(resp):
+    from flask import request
+
+    if not ENCODINGS or not request.path.startswith("/api/"):
+        return resp
+    streamed = resp.mimetype in STREAMED
+    if not streamed and resp.mimetype not in COMPRESSIBLE:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if resp.status_code != 200 or resp.direct_passthrough or "Content-Encoding" in resp.headers:
+        return resp
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return resp
+
+    if streamed:
+        resp.response = compress_stream(resp.response, encoding)
+        resp.headers.pop("Content-Length", None)
+    else:
+        body = resp.get_data()
+        if len(body) < MIN_BYTES:
+            return resp
+        resp.set_data(compress(body, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    return resp
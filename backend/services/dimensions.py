@@ -0,0 +1,156 @@
+"""
+In process cache of the track and artist dimension rows:
+- track_id -> (title, album, artist_id) and artist_id -> name
+- ids, album names and artist ids are interned, so a repeated album or
+  artist costs one string however many tracks point at it
+- misses load from the database in one IN query per lookup, ingest
+  primes tracks it has just merged
+- rows are never updated once written, so workers need no invalidation;
+  the cache is cleared when it grows past DIMENSION_CACHE_MAX_TRACKS
+Read routes query only the fact tables and resolve names here.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, select
+
+from .. import config
+from ..models import get_read_engine, tracks, artists
+
+MAX_TRACKS = config.DIMENSION_CACHE_MAX_TRACKS
+# ids per IN query, under SQLite's bound parameter limit
+LOAD_CHUNK = 900
+
+_track_rows = select(tracks.c.track_id, tracks.c.title, tracks.c.album_name, tracks.c.artist_id).where(
+    tracks.c.track_id.in_(bindparam("ids", expanding=True))
+)
+_artist_rows = select(artists.c.artist_id, artists.c.name).where(artists.c.artist_id.in_(bindparam("ids", expanding=True)))
+
+def intern(s: Optional[str]) -> Optional[str]:
+    """
+    s interned, None passed through. Ingest interns ids and names with it
+    so its records share strings with this cache.
+    """
+    return sys.intern(s) if s is not None else None
+
+class Dimensions:
+    def __init__(self, max_tracks: int = MAX_TRACKS):
+        self.max_tracks = max_tracks
+        self._lock = threading.Lock()
+        self._tracks: Dict[str, Tuple[str, Optional[str], Optional[str]]] = {}
+        self._artists: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _load(self, table_rows, ids: list) -> list:
+        out = []
+        with get_read_engine().connect() as conn:
+            for i in range(0, len(ids), LOAD_CHUNK):
+                out.extend(conn.execute(table_rows, {"ids": ids[i:i + LOAD_CHUNK]}).all())
+        self.loads += 1
+        return out
+
+    def put_tracks(self, rows: Iterable[Tuple[str, str, Optional[str], Optional[str]]]) -> None:
+        """
+        (track_id, title, album, artist_id) rows, existing entries win.
+        """
+        with self._lock:
+            if len(self._tracks) > self.max_tracks:
+                self._tracks.clear()
+            for track_id, title, album, artist_id in rows:
+                if track_id not in self._tracks:
+                    self._tracks[sys.intern(track_id)] = (title, intern(album), intern(artist_id))
+
+    def put_artists(self, rows: Iterable[Tuple[str, str]]) -> None:
+        with self._lock:
+            for artist_id, name in rows:
+                if artist_id not in self._artists:
+                    self._artists[sys.intern(artist_id)] = intern(name)
+
+    def tracks(self, ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str], Optional[str]]]:
+        """
+        {track_id: (title, album, artist_id)} for the ids that exist.
+        """
+        ids = {i for i in ids if i}
+        with self._lock:
+            missing = [i for i in ids if i not in self._tracks]
+            self.hits += len(ids) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            self.put_tracks(self._load(_track_rows, missing))
+        with self._lock:
+            return {i: self._tracks[i] for i in ids if i in self._tracks}
+
+    def artists(self, ids: Iterable[str]) -> Dict[str, str]:
+        ids = {i for i in ids if i}
+        with self._lock:
+            missing = [i for i in ids if i not in self._artists]
+            self.hits += len(ids) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            self.put_artists(self._load(_artist_rows, missing))
+        with self._lock:
+            return {i: self._artists[i] for i in ids if i in self._artists}
+
+    def track_labels(self, ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str], Optional[str]]]:
+        """
+        {track_id: (title, album, artist name)}.
+        """
+        info = self.tracks(ids)
+        names = self.artists(a for _, _, a in info.values())
+        return {t: (title, album, names.get(a)) for t, (title, album, a) in info.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tracks.clear()
+            self._artists.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Entry counts, hit rates and the deep size of the cached structures,
+        each distinct string counted once.
+        """
+        with self._lock:
+            seen = set()
+            size = sys.getsizeof(self._tracks) + sys.getsizeof(self._artists)
+
+            def add(obj) -> int:
+                if obj is None or id(obj) in seen:
+                    return 0
+                seen.add(id(obj))
+                return sys.getsizeof(obj)
+
+            for k, v in self._tracks.items():
+                size += add(k) + add(v) + sum(add(x) for x in v)
+            for k, v in self._artists.items():
+                size += add(k) + add(v)
+            return {
+                "tracks": len(self._tracks),
+                "artists": len(self._artists),
+                "bytes": size,
+                "bytes_per_track": round(size / len(self._tracks), 1) if self._tracks else 0.0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+            }
+
+_dims: Optional[Dimensions] = None
+_pid: Optional[int] = None
+
+def dimensions() -> Dimensions:
+    """
+    Process wide cache. A forked worker keeps the parent's entries, they
+    never change, but gets its own lock.
+    """
+    global _dims, _pid
+    if _dims is None:
+        _dims = Dimensions()
+    elif _pid != os.getpid():
+        _dims._lock = threading.Lock()
+    _pid = os.getpid()
+    return _dims
@@ -1,33 +1,63 @@
 """
 Ingestion of Recently Played into tables:
-- pulls pages since last cursor
-- upserts artists and tracks
-- inserts plays
-- computes elapsed_ms and is_skip for all but newest
-- fixes previous newest from last run using the first new play
+- pulls pages since last cursor, turning each page into compact
+  StagedPlay records with interned ids as it arrives
+- stages the records in ingest_staging in one append-only write
+- merges staged items for one or many users in a single transaction:
+  upserts artists and tracks, inserts plays, computes elapsed_ms and
+  is_skip for all but newest, fixes previous newest from last run using
+  the first new play, advances the cursor and clears the staged rows
+- primes the in process name cache with the merged tracks and artists
+- extends sessions and the daily streak from the first new play
+A crash before the merge commits leaves the items staged and the cursor
+where it was; the next run re-stages them as no-ops and merges once.
 """
 
 from __future__ import annotations
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Any, Set
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Any, Set
 
-from sqlalchemy import select, update, insert, and_, func
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import and_, delete, func, select
 
+from . import statements
+from .dimensions import dimensions, intern
 from .spotify import sget
-from ..models import get_engine, user_info, artists, tracks, plays
+from .upsert import insert_ignore_many
+from ..models import get_engine, user_info, artists, tracks, plays, ingest_staging, as_utc
 
 RECENT_ENDPOINT = "me/player/recently-played"
 MAX_LIMIT = 50
+# records turned into parameter dicts at a time while staging
+STAGE_CHUNK = 2_000
+
+class StagedPlay(NamedTuple):
+    """
+    One Recently Played item as an ingest_staging row. Ids and names are
+    interned, so a track played a thousand times keeps one copy of each.
+    """
+    user_id: str
+    played_at: datetime
+    track_id: str
+    track_title: Optional[str]
+    album_name: Optional[str]
+    duration_ms: int
+    artist_id: Optional[str]
+    artist_name: Optional[str]
+
+_played_at = itemgetter(1)
+_NO_ARTIST = ({},)
 
 def _parse_dt(iso_str: str) -> datetime:
-    # Spotify returns ISO with Z, python can parse with fromisoformat after replace
-    # Example: 2024-01-02T03:04:05.678Z
-    if iso_str.endswith("Z"):
-        iso_str = iso_str.replace("Z", "+00:00")
+    # Spotify returns ISO with Z, e.g. 2024-01-02T03:04:05.678Z, which
+    # fromisoformat reads as UTC directly since 3.11; in C it beats slicing
+    # the string into epoch ms in Python (bench/ingest_records.py), and
+    # played_at is stored as a datetime anyway
     dt = datetime.fromisoformat(iso_str)
+    if dt.tzinfo is timezone.utc:
+        return dt
     if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
+        return dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
 
 def _to_millis(dt: datetime) -> int:
@@ -40,19 +70,46 @@ def _skip_rule(elapsed_ms: int, duration_ms: int) -> bool:
         return True
     return False
 
-def sync_recent_core(user_id: str, access_token: str) -> Tuple[Dict[str, int], List[datetime]]:
+def _day(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+
+def _empty_counts() -> Dict[str, int]:
+    return {"new_plays": 0, "new_artists": 0, "new_tracks": 0, "updated_elapsed": 0, "sessions_written": 0}
+
+def normalize(user_id: str, items: List[Dict[str, Any]]) -> List[StagedPlay]:
     """
-    Core ingestion used by routes and cron.
-    Returns (counts, touched_days)
+    Recently Played items of one page as StagedPlay records, tracks only.
+    """
+    out = []
+    for it in items:
+        tr = it.get("track") or {}
+        if tr.get("type") != "track":
+            continue  # skip episodes
+        artist = (tr.get("artists") or _NO_ARTIST)[0]
+        out.append(StagedPlay(
+            user_id,
+            _parse_dt(it["played_at"]),
+            intern(tr["id"]),
+            intern(tr.get("name")),
+            intern((tr.get("album") or {}).get("name")),
+            int(tr.get("duration_ms") or 0),
+            intern(artist.get("id")),
+            intern(artist.get("name")),
+        ))
+    return out
+
+def fetch_recent(user_id: str, access_token: str) -> List[StagedPlay]:
+    """
+    Recently Played since the stored cursor in ascending played_at. Each
+    page is normalized as it arrives, so the raw JSON of one page at a
+    time is alive.
     """
     eng = get_engine()
 
     # Get cursor
     with eng.begin() as conn:
-        row = conn.execute(
-            select(user_info.c.last_recent_cursor).where(user_info.c.user_id == user_id)
-        ).fetchone()
-        cursor_dt = row[0] if row else None
+        row = conn.execute(statements.recent_cursor(), {"user_id": user_id}).fetchone()
+        cursor_dt = as_utc(row[0]) if row and row[0] else None
 
     params = {"limit": MAX_LIMIT}
     if cursor_dt:
@@ -60,164 +117,151 @@ def sync_recent_core(user_id: str, access_token: str) -> Tuple[Dict[str, int], L
 
     # Fetch first page
     data = sget(RECENT_ENDPOINT, access_token, params=params)
-    items = data.get("items", [])
+    records = normalize(user_id, data.get("items", []))
 
     # Follow 'next' while present and items are newer than cursor
     next_url = data.get("next")
-    all_items = items[:]
     while next_url:
         page = sget(next_url, access_token, params=None)
         page_items = page.get("items", [])
         if not page_items:
             break
         # Items are in reverse chronological by Spotify. We still collect all.
-        all_items.extend(page_items)
+        records.extend(normalize(user_id, page_items))
         next_url = page.get("next")
 
-    if not all_items:
-        return ({"new_plays": 0, "new_artists": 0, "new_tracks": 0, "updated_elapsed": 0}, [])
+    records.sort(key=_played_at)
+    return records
 
-    # Normalize and filter to tracks only
-    normalized = []
-    for it in all_items:
-        tr = it.get("track") or {}
-        if tr.get("type") != "track":
-            continue  # skip episodes
-        played_at = _parse_dt(it["played_at"])
-        normalized.append({
-            "played_at": played_at,
-            "track_id": tr["id"],
-            "track_title": tr.get("name"),
-            "album_name": (tr.get("album") or {}).get("name"),
-            "duration_ms": int(tr.get("duration_ms") or 0),
-            "artist_id": (tr.get("artists") or [{}])[0].get("id"),
-            "artist_name": (tr.get("artists") or [{}])[0].get("name"),
-        })
-
-    if not normalized:
-        return ({"new_plays": 0, "new_artists": 0, "new_tracks": 0, "updated_elapsed": 0}, [])
-
-    # Sort ascending by played_at
-    normalized.sort(key=lambda x: x["played_at"])
-
-    # Upserts for artists and tracks
-    new_artists = 0
-    new_tracks = 0
-    with eng.begin() as conn:
-        # artists
-        for a in { (n["artist_id"], n["artist_name"]) for n in normalized if n["artist_id"] }:
-            stmt = sqlite_insert(artists).values(
-                artist_id=a[0], name=a[1], genres=None
-            ).on_conflict_do_nothing(index_elements=["artist_id"])
-            res = conn.execute(stmt)
-            new_artists += res.rowcount or 0
-
-        # tracks
-        for t in { (n["track_id"], n["artist_id"], n["track_title"], n["album_name"], n["duration_ms"]) for n in normalized }:
-            stmt = sqlite_insert(tracks).values(
-                track_id=t[0], artist_id=t[1], title=t[2], album_name=t[3], duration_ms=t[4]
-            ).on_conflict_do_nothing(index_elements=["track_id"])
-            res = conn.execute(stmt)
-            new_tracks += res.rowcount or 0
-
-    # Insert plays with unique guard
-    new_plays = 0
-    with eng.begin() as conn:
-        for n in normalized:
-            stmt = sqlite_insert(plays).values(
-                user_id=user_id,
-                track_id=n["track_id"],
-                played_at=n["played_at"],
-                elapsed_ms=None,  # compute below
-                is_skip=None,
-            ).on_conflict_do_nothing(
-                index_elements=["user_id", "played_at"]
-            )
-            res = conn.execute(stmt)
-            new_plays += res.rowcount or 0
+def stage(items: List[StagedPlay]) -> int:
+    """
+    Append fetched items to ingest_staging in one write. Items already
+    staged for the same user and played_at are ignored.
+    """
+    if not items:
+        return 0
+    staged = 0
+    with get_engine().begin() as conn:
+        for i in range(0, len(items), STAGE_CHUNK):
+            rows = [r._asdict() for r in items[i:i + STAGE_CHUNK]]
+            staged += insert_ignore_many(conn, ingest_staging, rows, ["user_id", "played_at"])
+    return staged
 
+def _elapsed(user_id: str, rows: List[Tuple[datetime, int]]) -> List[Dict[str, Any]]:
     # Compute elapsed for pairs inside this batch regardless of duplicates
     # Update the earlier row's elapsed_ms and is_skip
-    updated_elapsed = 0
+    params = []
+    for (played_at, duration_ms), (next_at, _) in zip(rows, rows[1:]):
+        gap_ms = max(int((next_at - played_at).total_seconds() * 1000), 0)
+        elapsed_ms = min(gap_ms, duration_ms)
+        params.append({
+            "b_user_id": user_id, "b_played_at": played_at,
+            "b_elapsed_ms": elapsed_ms, "b_is_skip": _skip_rule(elapsed_ms, duration_ms),
+        })
+    return params
+
+def merge_staged(user_ids: Optional[Sequence[str]] = None) -> Dict[str, Tuple[Dict[str, int], List[datetime]]]:
+    """
+    Apply everything staged for user_ids (default every user) in one
+    transaction: set based inserts into artists, tracks and plays for all
+    users at once, elapsed fixes, forward only cursors, then delete the
+    merged rows. Sessions and streaks are extended per user afterwards.
+    Returns {user_id: (counts, touched_days)}.
+    """
+    eng = get_engine()
+    merged: Dict[str, Tuple[Dict[str, int], Set[datetime], datetime]] = {}
     with eng.begin() as conn:
-        for i in range(len(normalized) - 1):
-            curr = normalized[i]
-            nxt = normalized[i + 1]
-            gap_ms = int((nxt["played_at"] - curr["played_at"]).total_seconds() * 1000)
-            gap_ms = max(gap_ms, 0)
-            elapsed_ms = min(gap_ms, curr["duration_ms"])
-            is_skip = _skip_rule(elapsed_ms, curr["duration_ms"])
-            upd = (
-                update(plays)
-                .where(
-                    and_(
-                        plays.c.user_id == user_id,
-                        plays.c.played_at == curr["played_at"]
-                    )
-                )
-                .values(elapsed_ms=elapsed_ms, is_skip=is_skip)
-            )
-            res = conn.execute(upd)
-            updated_elapsed += res.rowcount or 0
+        q = select(ingest_staging.c.user_id, func.max(ingest_staging.c.id)).group_by(ingest_staging.c.user_id)
+        if user_ids is not None:
+            q = q.where(ingest_staging.c.user_id.in_(list(user_ids)))
+        tops = conn.execute(q).all()
+        if not tops:
+            return {}
+        # rows staged by another run after this point have higher ids and stay
+        params = {"top_id": max(t[1] for t in tops), "user_ids": [t[0] for t in tops]}
 
-    # Fix previous newest from earlier run if present
-    touched_days: Set[datetime] = set()
-    for n in normalized:
-        day = datetime(n["played_at"].year, n["played_at"].month, n["played_at"].day, tzinfo=timezone.utc)
-        touched_days.add(day)
+        new = {r.user_id: r for r in conn.execute(statements.staged_new_counts(), params)}
+        # (played_at, duration_ms) ascending per user
+        by_user: Dict[str, List[Tuple[datetime, int]]] = {}
+        # dimension rows as staged, primed into the name cache after commit
+        dim_tracks: Dict[str, Tuple[str, Optional[str], Optional[str], Optional[str]]] = {}
+        dim_artists: Dict[str, Optional[str]] = {}
+        for r in conn.execute(statements.staged_rows(), params):
+            by_user.setdefault(r.user_id, []).append((as_utc(r.played_at), r.duration_ms))
+            dim_tracks[r.track_id] = (r.track_id, r.track_title, r.album_name, r.artist_id)
+            if r.artist_id:
+                dim_artists[r.artist_id] = r.artist_name
+        for target in ("artists", "tracks", "plays"):
+            conn.execute(statements.staged_merge(conn, target), params)
 
-    with eng.begin() as conn:
-        first_new_time = normalized[0]["played_at"]
-        prev_latest = conn.execute(
-            select(plays.c.id, plays.c.played_at, plays.c.track_id)
-            .where(
-                and_(
-                    plays.c.user_id == user_id,
-                    plays.c.played_at < first_new_time
-                )
-            )
-            .order_by(plays.c.played_at.desc())
-            .limit(1)
-        ).fetchone()
+        cursors = dict(conn.execute(
+            select(user_info.c.user_id, user_info.c.last_recent_cursor).where(user_info.c.user_id.in_(list(by_user)))
+        ).all())
+        elapsed_params: List[Dict[str, Any]] = []
+        cursor_params: List[Dict[str, Any]] = []
+        for uid, rows in by_user.items():
+            counts = _empty_counts()
+            counts.update(new_plays=int(new[uid].new_plays), new_artists=new[uid].new_artists, new_tracks=new[uid].new_tracks)
+            pairs = _elapsed(uid, rows)
+            elapsed_params.extend(pairs)
+            counts["updated_elapsed"] = len(pairs)
+            touched_days: Set[datetime] = {_day(at) for at, _ in rows}
 
-        if prev_latest:
+            # Fix previous newest from earlier run if present
+            first_new_time = rows[0][0]
+            prev_latest = conn.execute(statements.play_before(), {"user_id": uid, "before": first_new_time}).fetchone()
             # Only update if elapsed_ms is null
-            prev_row = conn.execute(
-                select(plays.c.id, plays.c.elapsed_ms)
-                .where(plays.c.id == prev_latest.id)
-            ).fetchone()
-            if prev_row and prev_row.elapsed_ms is None:
-                tr = conn.execute(
-                    select(tracks.c.duration_ms).where(tracks.c.track_id == prev_latest.track_id)
-                ).fetchone()
-                duration_ms = int(tr.duration_ms) if tr else 0
-                gap_ms = int((first_new_time - prev_latest.played_at).total_seconds() * 1000)
-                gap_ms = max(gap_ms, 0)
+            if prev_latest and prev_latest.elapsed_ms is None:
+                prev_played_at = as_utc(prev_latest.played_at)
+                duration_ms = int(prev_latest.duration_ms or 0)
+                gap_ms = max(int((first_new_time - prev_played_at).total_seconds() * 1000), 0)
                 elapsed_ms = min(gap_ms, duration_ms)
                 is_skip = _skip_rule(elapsed_ms, duration_ms) if duration_ms else None
                 res = conn.execute(
-                    update(plays)
-                    .where(plays.c.id == prev_latest.id)
-                    .values(elapsed_ms=elapsed_ms, is_skip=is_skip)
+                    statements.set_elapsed_by_id(),
+                    {"b_id": prev_latest.id, "b_elapsed_ms": elapsed_ms, "b_is_skip": is_skip},
                 )
-                updated_elapsed += res.rowcount or 0
-                prev_day = datetime(prev_latest.played_at.year, prev_latest.played_at.month, prev_latest.played_at.day, tzinfo=timezone.utc)
-                touched_days.add(prev_day)
+                counts["updated_elapsed"] += res.rowcount or 0
+                touched_days.add(_day(prev_played_at))
 
-    # Update cursor to newest played_at written
-    newest = normalized[-1]["played_at"]
-    with eng.begin() as conn:
-        conn.execute(
-            update(user_info)
-            .where(user_info.c.user_id == user_id)
-            .values(last_recent_cursor=newest)
-        )
-
-    counts = {
-        "new_plays": new_plays,
-        "new_artists": new_artists,
-        "new_tracks": new_tracks,
-        "updated_elapsed": updated_elapsed,
-    }
-
-    return counts, sorted(touched_days)
+            # Cursor only moves forward, in the same transaction as the plays
+            newest = rows[-1][0]
+            cursor = cursors.get(uid)
+            if cursor is None or as_utc(cursor) < newest:
+                cursor_params.append({"b_user_id": uid, "cursor": newest})
+            merged[uid] = (counts, touched_days, first_new_time)
+
+        if elapsed_params:
+            conn.execute(statements.set_elapsed_at(), elapsed_params)
+        if cursor_params:
+            conn.execute(statements.set_recent_cursor(), cursor_params)
+        conn.execute(delete(ingest_staging).where(and_(
+            ingest_staging.c.id <= params["top_id"], ingest_staging.c.user_id.in_(params["user_ids"]),
+        )))
+
+    dims = dimensions()
+    dims.put_tracks(dim_tracks.values())
+    dims.put_artists(dim_artists.items())
+
+    out: Dict[str, Tuple[Dict[str, int], List[datetime]]] = {}
+    for uid, (counts, days, first_played_at) in merged.items():
+        # Sessions and streaks only move when plays or their elapsed changed
+        if counts["new_plays"] or counts["updated_elapsed"]:
+            # numpy backed, only imported when there is something to sessionize
+            from .sessions import update_sessions, update_streak
+
+            # separate transactions so each can attach archived months before writing
+            with eng.begin() as conn:
+                counts["sessions_written"] = update_sessions(conn, uid, first_played_at)
+            with eng.begin() as conn:
+                update_streak(conn, uid, [at for at, _ in by_user[uid]])
+        out[uid] = (counts, sorted(days))
+    return out
+
+def sync_recent_core(user_id: str, access_token: str) -> Tuple[Dict[str, int], List[datetime]]:
+    """
+    Core ingestion used by routes and cron: fetch, stage, merge.
+    Returns (counts, touched_days)
+    """
+    stage(fetch_recent(user_id, access_token))
+    return merge_staged([user_id]).get(user_id, (_empty_counts(), []))
@@ -0,0 +1,281 @@
+"""
+Live deltas for connected clients:
+- Hub fans events out to every subscriber queue of a user
+- one PollScheduler thread per process polls Spotify once per watched
+  user every LIVE_POLL_SECONDS, however many clients that user has open
+- with the shared cache on, a per user lease keeps workers from polling
+  the same user twice; every worker still publishes from the database
+- a delta is the plays since the last published cursor, the daily_totals
+  rows of the days they touch and the 30 day summary totals
+"""
+
+from __future__ import annotations
+import heapq
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import and_, select, update
+
+from .. import config
+from ..models import get_engine, user_info, plays, daily_totals, as_utc
+from . import cache, schedule, statements, timezones
+from .dimensions import dimensions
+from .partitions import plays_source
+
+POLL_SECONDS = config.LIVE_POLL_SECONDS
+# new events queue per client, a client this far behind is dropped
+MAX_QUEUED = 100
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict[str, Set[queue.Queue]] = {}
+
+    def subscribe(self, user_id: str) -> queue.Queue:
+        q: queue.Queue = queue.Queue(MAX_QUEUED)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id: str, q: queue.Queue) -> None:
+        with self._lock:
+            subs = self._subs.get(user_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subs[user_id]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._subs.get(user_id, ()))
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> int:
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        delivered = 0
+        for q in subs:
+            try:
+                q.put_nowait(event)
+                delivered += 1
+            except queue.Full:
+                # slow reader, the stream sees None and closes so the client reconnects
+                self.unsubscribe(user_id, q)
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+        return delivered
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return as_utc(dt).isoformat() if dt else None
+
+def _day(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+
+def read_cursor(user_id: str) -> Optional[datetime]:
+    with get_engine().begin() as conn:
+        row = conn.execute(statements.recent_cursor(), {"user_id": user_id}).fetchone()
+    return as_utc(row[0]) if row and row[0] else None
+
+def build_delta(user_id: str, since: Optional[datetime], cursor: datetime) -> Dict[str, Any]:
+    """
+    Plays with played_at >= since (the previous newest is resent because
+    the sync fills in its elapsed_ms), their days' daily_totals rows and
+    the 30 day totals.
+    """
+    lo = since or (cursor - timedelta(days=1))
+    with get_engine().begin() as conn:
+        rows = conn.execute(
+            select(plays.c.played_at, plays.c.elapsed_ms, plays.c.is_skip, plays.c.track_id)
+            .where(and_(plays.c.user_id == user_id, plays.c.played_at >= lo))
+            .order_by(plays.c.played_at)
+        ).fetchall()
+        # daily_totals rows are keyed by the user's local date
+        z = timezones.zone(timezones.user_tz(conn, user_id))
+        days = sorted({_day(as_utc(r.played_at).astimezone(z)) for r in rows})
+        totals = []
+        if days:
+            totals = conn.execute(
+                select(daily_totals).where(and_(daily_totals.c.user_id == user_id, daily_totals.c.day.in_(days)))
+                .order_by(daily_totals.c.day)
+            ).mappings().all()
+
+        now = datetime.now(timezone.utc)
+        start = now - timedelta(days=30)
+        p = plays_source(conn, start, now, user_id=user_id)
+        t = conn.execute(statements.window_totals(p), {"user_id": user_id, "start": start, "end": now}).one()
+
+    info = dimensions().track_labels(r.track_id for r in rows)
+    new_plays = []
+    for r in rows:
+        title, _album, artist = info.get(r.track_id, (None, None, None))
+        new_plays.append({"played_at": _iso(r.played_at), "elapsed_ms": r.elapsed_ms, "is_skip": r.is_skip,
+                          "track_id": r.track_id, "title": title, "artist": artist})
+    return {
+        "cursor": _iso(cursor),
+        "plays": new_plays,
+        "daily_totals": [
+            {"day": as_utc(r["day"]).date().isoformat(), "minutes_listened": r["minutes_listened"],
+             "top_track_id": r["top_track_id"], "top_artist_id": r["top_artist_id"],
+             "repeats": r["repeats"], "skips": r["skips"]}
+            for r in totals
+        ],
+        "summary": {
+            "minutes_listened": int(t.ms // 60000),
+            "plays": int(t.plays),
+            "skips": int(t.skips),
+            "repeats": int(t.plays - t.distinct_tracks),
+        },
+    }
+
+class PollScheduler:
+    """
+    Keeps a due-time heap of watched users. Each tick syncs the users that
+    are due (when this process holds their lease) and publishes a delta to
+    the hub whenever the stored cursor moved past the last one sent.
+    """
+
+    def __init__(self, hub: Hub, interval: float = POLL_SECONDS):
+        self.hub = hub
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watchers: Dict[str, int] = {}
+        self._due: List[tuple] = []
+        self._scheduled: Set[str] = set()
+        self._sent: Dict[str, Optional[datetime]] = {}
+        self._tokens: Dict[str, tuple] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.polls = 0
+
+    def watch(self, user_id: str) -> None:
+        with self._lock:
+            n = self._watchers.get(user_id, 0)
+            self._watchers[user_id] = n + 1
+            if n == 0:
+                self._sent[user_id] = read_cursor(user_id)
+            if user_id not in self._scheduled:
+                self._scheduled.add(user_id)
+                heapq.heappush(self._due, (time.monotonic(), user_id))
+            self._ensure_thread()
+        self._wake.set()
+
+    def unwatch(self, user_id: str) -> None:
+        with self._lock:
+            n = self._watchers.get(user_id, 0) - 1
+            if n <= 0:
+                self._watchers.pop(user_id, None)
+                self._sent.pop(user_id, None)
+            else:
+                self._watchers[user_id] = n
+
+    def last_sent(self, user_id: str) -> Optional[datetime]:
+        with self._lock:
+            return self._sent.get(user_id)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="live-poll", daemon=True)
+            self._thread.start()
+
+    def _token(self, user_id: str) -> Optional[str]:
+        from .spotify import mint_access_token
+
+        held = self._tokens.get(user_id)
+        if held and held[1] > time.time() + 60:
+            return held[0]
+        with get_engine().begin() as conn:
+            row = conn.execute(select(user_info.c.refresh_token).where(user_info.c.user_id == user_id)).fetchone()
+        if not row:
+            return None
+        minted = mint_access_token(row[0])
+        if not minted:
+            return None
+        if minted.get("refresh_token"):
+            with get_engine().begin() as conn:
+                conn.execute(update(user_info).where(user_info.c.user_id == user_id).values(refresh_token=minted["refresh_token"]))
+        self._tokens[user_id] = (minted["access_token"], time.time() + minted["expires_in"])
+        return minted["access_token"]
+
+    def sync(self, user_id: str) -> None:
+        from .aggregates import rollup_global
+        from .ingest import sync_recent_core
+        from .rollups import rollup_days
+        from . import similarity
+
+        token = self._token(user_id)
+        if not token:
+            return
+        self.polls += 1
+        counts, days = sync_recent_core(user_id, token)
+        rollup_days(user_id, days)
+        rollup_global(user_id, days)
+        if days:
+            similarity.update(user_id)
+            cache.invalidate(user_id)
+        if counts["new_plays"]:
+            # push the cron sync back, an empty poll every interval is not worth a write
+            with get_engine().begin() as conn:
+                schedule.record(conn, user_id, counts["new_plays"])
+
+    def publish_if_moved(self, user_id: str) -> int:
+        with self._lock:
+            if user_id not in self._watchers:
+                return 0
+        cursor = read_cursor(user_id)
+        with self._lock:
+            if user_id not in self._watchers:
+                return 0
+            since = self._sent.get(user_id)
+            if cursor is None or (since is not None and cursor <= since):
+                return 0
+            self._sent[user_id] = cursor
+        return self.hub.publish(user_id, {"event": "delta", "data": build_delta(user_id, since, cursor)})
+
+    def tick(self) -> float:
+        """
+        Run everything due, return seconds until the next user is due.
+        """
+        while True:
+            with self._lock:
+                if not self._due:
+                    return self.interval
+                due_at, user_id = self._due[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    return wait
+                heapq.heappop(self._due)
+                if user_id not in self._watchers:
+                    self._scheduled.discard(user_id)
+                    continue
+                heapq.heappush(self._due, (time.monotonic() + self.interval, user_id))
+            try:
+                if cache.lease(f"live:{user_id}", self.interval * 2):
+                    self.sync(user_id)
+                self.publish_if_moved(user_id)
+            except Exception as e:
+                print(f"[{datetime.now(timezone.utc).isoformat()}] live user={user_id} poll_failed {e!r}")
+
+    def _run(self) -> None:
+        while True:
+            wait = self.tick()
+            self._wake.wait(timeout=max(wait, 0.05))
+            self._wake.clear()
+
+_hub: Optional[Hub] = None
+_scheduler: Optional[PollScheduler] = None
+_pid: Optional[int] = None
+
+def scheduler() -> PollScheduler:
+    """
+    Process wide scheduler, created on first use so it starts after fork.
+    """
+    global _hub, _scheduler, _pid
+    if _scheduler is None or _pid != os.getpid():
+        _hub = Hub()
+        _scheduler = PollScheduler(_hub)
+        _pid = os.getpid()
+    return _scheduler
@@ -0,0 +1,267 @@
+"""
+Monthly partitions for plays on SQLite:
+- plays keeps the hot months and takes every write
+- archive_cold() moves closed months older than PLAYS_HOT_MONTHS into
+  read only per month SQLite files, optionally gzipped
+- plays_source() returns plays, or plays unioned with only the archived
+  months that overlap the requested range, attached read only
+- past MAX_ATTACHED months the range is copied into a temp table instead,
+  only the asking user's rows when plays_source() is given user_id
+Other dialects always read plays directly.
+"""
+
+from __future__ import annotations
+import functools
+import gzip
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Index, Integer, MetaData, String, Table,
+    and_, bindparam, column, create_engine, delete, func, insert, select, table, union_all,
+)
+
+from .. import config
+from ..models import get_engine, plays, play_partitions, as_utc, now_utc
+
+ARCHIVE_DIR = config.PLAYS_ARCHIVE_DIR
+HOT_MONTHS = config.PLAYS_HOT_MONTHS
+# SQLite allows 10 attached databases by default, keep headroom
+MAX_ATTACHED = 8
+
+PLAY_COLS = ["id", "user_id", "track_id", "played_at", "elapsed_ms", "is_skip"]
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + (dt.month // 12), dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+def prev_month(dt: datetime) -> datetime:
+    return datetime(dt.year - (dt.month == 1), (dt.month - 2) % 12 + 1, 1, tzinfo=timezone.utc)
+
+def _schema_name(month: datetime) -> str:
+    return f"p_{month.year:04d}_{month.month:02d}"
+
+@functools.lru_cache(maxsize=64)
+def _plays_clause(schema: str, name: str = "plays"):
+    # lightweight handle on a plays shaped table in another schema, one per
+    # name so statements built on it stay cacheable (see statements.py)
+    return table(
+        name,
+        column("id", Integer),
+        column("user_id", String),
+        column("track_id", String),
+        column("played_at", DateTime(timezone=True)),
+        column("elapsed_ms", Integer),
+        column("is_skip", Boolean),
+        schema=schema,
+    )
+
+def _archive_schema() -> MetaData:
+    md = MetaData()
+    Table(
+        "plays",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", String, nullable=False),
+        Column("track_id", String, nullable=False),
+        Column("played_at", DateTime(timezone=True), nullable=False),
+        Column("elapsed_ms", Integer, nullable=True),
+        Column("is_skip", Boolean, nullable=True),
+        Index("ix_user_played_at", "user_id", "played_at"),
+    )
+    return md
+
+def _readable_path(row) -> str:
+    if not row.compressed:
+        return row.path
+    cache_dir = os.path.join(os.path.dirname(row.path), ".cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    raw = os.path.join(cache_dir, os.path.basename(row.path)[:-len(".gz")])
+    if not os.path.exists(raw) or os.path.getmtime(raw) < os.path.getmtime(row.path):
+        tmp = raw + ".tmp"
+        with gzip.open(row.path, "rb") as src, open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, raw)
+    return raw
+
+def _attached(conn) -> Dict[str, str]:
+    return {r[1]: r[2] for r in conn.exec_driver_sql("PRAGMA database_list").fetchall()}
+
+def _attach(conn, rows) -> List[str]:
+    wanted = {_schema_name(as_utc(r.month)): r for r in rows}
+    current = _attached(conn)
+    for name in current:
+        if name.startswith("p_") and name not in wanted:
+            conn.exec_driver_sql(f"DETACH DATABASE {name}")
+    for name, r in wanted.items():
+        if name not in current:
+            path = os.path.abspath(_readable_path(r))
+            conn.exec_driver_sql(f"ATTACH DATABASE 'file:{path}?mode=ro' AS {name}")
+    return list(wanted)
+
+@functools.lru_cache(maxsize=None)
+def _catalog_query(bounded: bool):
+    q = select(play_partitions).order_by(play_partitions.c.month)
+    if bounded:
+        q = q.where(play_partitions.c.month < bindparam("end"))
+    return q
+
+def _overlapping(conn, start: Optional[datetime], end: Optional[datetime]):
+    if end is not None:
+        rows = conn.execute(_catalog_query(True), {"end": end}).fetchall()
+    else:
+        rows = conn.execute(_catalog_query(False)).fetchall()
+    if start is not None:
+        lo = month_start(as_utc(start))
+        rows = [r for r in rows if as_utc(r.month) >= lo]
+    return rows
+
+@functools.lru_cache(maxsize=128)
+def _union_source(names: tuple):
+    # the same attached months always give back the same subquery object
+    parts = [select(*[plays.c[c] for c in PLAY_COLS])]
+    for name in names:
+        t = _plays_clause(name)
+        parts.append(select(*[t.c[c] for c in PLAY_COLS]))
+    return union_all(*parts).subquery("plays")
+
+def plays_source(conn, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None):
+    """
+    Selectable with the plays columns covering [start, end).
+    Callers still filter on played_at, this only decides which storage to read.
+    Per user callers pass user_id so the wide window fallback copies only
+    that user's rows; other users' plays may then be missing from it.
+    """
+    if conn.dialect.name != "sqlite":
+        return plays
+    rows = _overlapping(conn, start, end)
+    if not rows:
+        return plays
+
+    if len(rows) <= MAX_ATTACHED:
+        return _union_source(tuple(_attach(conn, rows)))
+
+    # more months than can be attached at once, stage them in a temp table
+    conn.exec_driver_sql("CREATE TEMP TABLE IF NOT EXISTS plays_window AS SELECT * FROM main.plays WHERE 0")
+    conn.exec_driver_sql("DELETE FROM temp.plays_window")
+    staged = _plays_clause("temp", "plays_window")
+    window = []
+    if user_id is not None:
+        window.append(plays.c.user_id == user_id)
+    if start is not None:
+        window.append(plays.c.played_at >= start)
+    if end is not None:
+        window.append(plays.c.played_at < end)
+    conn.execute(insert(staged).from_select(PLAY_COLS, select(*[plays.c[c] for c in PLAY_COLS]).where(*window)))
+    # read archives over their own connections, DETACH is refused once
+    # the insert above has opened a transaction
+    cols = ", ".join(PLAY_COLS)
+    where, args = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    for r in rows:
+        src = sqlite3.connect(f"file:{os.path.abspath(_readable_path(r))}?mode=ro", uri=True)
+        try:
+            cur = src.execute(f"SELECT {cols} FROM plays {where}", args)
+            while True:
+                batch = cur.fetchmany(10_000)
+                if not batch:
+                    break
+                conn.exec_driver_sql(f"INSERT INTO temp.plays_window ({cols}) VALUES (?, ?, ?, ?, ?, ?)", batch)
+        finally:
+            src.close()
+    return staged
+
+def archive_month(month: datetime, compress: bool = False, archive_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Move one closed month out of plays into its own read only file.
+    The file is fully written before the catalog row and the delete
+    commit together, so a crash leaves plays untouched.
+    """
+    month = month_start(month)
+    end = next_month(month)
+    archive_dir = os.path.abspath(archive_dir or ARCHIVE_DIR)
+    os.makedirs(archive_dir, exist_ok=True)
+    name = _schema_name(month)
+    path = os.path.join(archive_dir, f"plays_{month.year:04d}_{month.month:02d}.db")
+
+    eng = get_engine()
+    with eng.begin() as conn:
+        if conn.execute(select(play_partitions.c.month).where(play_partitions.c.month == month)).first():
+            raise ValueError(f"{month.date().isoformat()} is already archived")
+
+    # leftovers from a run that died before registering the month
+    for stale in (path, path + ".gz"):
+        if os.path.exists(stale):
+            os.chmod(stale, 0o644)
+            os.remove(stale)
+
+    arc = create_engine(f"sqlite:///{path}")
+    _archive_schema().create_all(arc)
+    arc.dispose()
+
+    in_month = and_(plays.c.played_at >= month, plays.c.played_at < end)
+    with eng.connect() as conn:
+        conn.exec_driver_sql(f"ATTACH DATABASE '{path}' AS w_{name}")
+        res = conn.execute(insert(_plays_clause(f"w_{name}")).from_select(
+            PLAY_COLS, select(*[plays.c[c] for c in PLAY_COLS]).where(in_month).order_by(plays.c.played_at)
+        ))
+        copied = res.rowcount or 0
+        conn.commit()
+        conn.exec_driver_sql(f"DETACH DATABASE w_{name}")
+        conn.commit()
+
+    vac = create_engine(f"sqlite:///{path}")
+    with vac.connect() as c:
+        c.exec_driver_sql("VACUUM")
+    vac.dispose()
+
+    final = path
+    if compress:
+        final = path + ".gz"
+        with open(path, "rb") as src, gzip.open(final, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    os.chmod(final, 0o444)
+
+    with eng.begin() as conn:
+        conn.execute(insert(play_partitions).values(
+            month=month, path=final, rows=copied, compressed=compress, archived_at=now_utc(),
+        ))
+        conn.execute(delete(plays).where(in_month))
+
+    return {"month": month.date().isoformat(), "rows": copied, "path": final}
+
+def _is_archived(month: datetime) -> bool:
+    with get_engine().begin() as conn:
+        return conn.execute(select(play_partitions.c.month).where(play_partitions.c.month == month)).first() is not None
+
+def archive_cold(hot_months: int = HOT_MONTHS, compress: bool = False, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Archive every month with plays that ended more than hot_months ago.
+    Months already archived are skipped.
+    """
+    cutoff = month_start(now or now_utc())
+    for _ in range(hot_months):
+        cutoff = prev_month(cutoff)
+
+    eng = get_engine()
+    with eng.begin() as conn:
+        oldest = conn.execute(select(func.min(plays.c.played_at)).where(plays.c.played_at < cutoff)).scalar()
+    if oldest is None:
+        return []
+
+    out = []
+    m = month_start(as_utc(oldest))
+    while m < cutoff:
+        with eng.begin() as conn:
+            has_rows = conn.execute(
+                select(plays.c.id).where(and_(plays.c.played_at >= m, plays.c.played_at < next_month(m))).limit(1)
+            ).first()
+        if has_rows and not _is_archived(m):
+            out.append(archive_month(m, compress=compress))
+        m = next_month(m)
+    return out
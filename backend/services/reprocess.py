@@ -0,0 +1,130 @@
+"""
+Full history re-derivation for one user, used by jobs.rerollup after a
+change to _skip_rule or a fix to anything derived from plays:
+- elapsed_ms and is_skip recomputed from the play sequence, hot plays
+  only since archived months are read only
+- the 15 minute base and user_track_daily rebuilt from plays a UTC month
+  at a time, then daily_totals, month sketches, sessions and the streak
+- plays are read in keyset pages and months, so memory is bounded by a
+  page or one month of plays and its base rows
+- rederive_plays reads and does the per play work outside write_lock,
+  only its short write transactions take it; rebuild_rollups holds it for
+  the whole rebuild since it loads month by month. SQLite has one writer,
+  parallel workers share a lock so they queue instead of failing with
+  database is locked
+The cross user tables are regrouped once every user is done, see
+aggregates.regroup_global().
+"""
+
+from __future__ import annotations
+import contextlib
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, select
+
+from ..models import get_engine, plays, play_partitions, user_track_daily, user_track_quarter, user_month_sketches, as_utc
+from . import cache, sketches, statements
+from .ingest import _day, _elapsed
+from .partitions import month_start, next_month, plays_source
+from .sessions import backfill_user
+from .timezones import _quarter_rows, rebucket
+from .upsert import bulk_load
+
+PAGE = 5_000
+# before any stored play, the first keyset page starts after this
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def rederive_plays(user_id: str, page: int = PAGE, write_lock=None) -> Dict[str, int]:
+    """
+    Recompute elapsed_ms and is_skip for every hot play but the newest,
+    writing only the rows whose values changed, one transaction per page.
+    """
+    eng = get_engine()
+    lock = write_lock or contextlib.nullcontext()
+    out = {"plays": 0, "changed": 0}
+    after = _EPOCH
+    carry: List[Any] = []
+    while True:
+        with eng.connect() as conn:
+            rows = conn.execute(statements.play_sequence(), {"user_id": user_id, "after": after, "limit": page}).fetchall()
+        if not rows:
+            break
+        out["plays"] += len(rows)
+        after = rows[-1].played_at
+        # the last row of a page pairs with the first of the next
+        seq = carry + rows
+        pairs = _elapsed(user_id, [(as_utc(r.played_at), int(r.duration_ms or 0)) for r in seq])
+        changed = [
+            b for r, b in zip(seq, pairs)
+            if r.elapsed_ms != b["b_elapsed_ms"] or r.is_skip is None or bool(r.is_skip) != b["b_is_skip"]
+        ]
+        if changed:
+            with lock, eng.begin() as conn:
+                conn.execute(statements.set_elapsed_at(), changed)
+            out["changed"] += len(changed)
+        carry = [rows[-1]]
+    return out
+
+def _months(conn, user_id: str) -> List[datetime]:
+    lo, hi = conn.execute(select(func.min(plays.c.played_at), func.max(plays.c.played_at)).where(plays.c.user_id == user_id)).one()
+    # archived months are walked whole, without attaching them all to find the span
+    a_lo, a_hi = conn.execute(select(func.min(play_partitions.c.month), func.max(play_partitions.c.month))).one()
+    bounds = [as_utc(x) for x in (lo, hi, a_lo, a_hi) if x is not None]
+    out = []
+    if bounds:
+        month, last = month_start(min(bounds)), max(bounds)
+        while month <= last:
+            out.append(month)
+            month = next_month(month)
+    return out
+
+def _track_days(user_id: str, rows) -> List[Dict[str, Any]]:
+    acc: Dict[Tuple[datetime, str], List[int]] = {}
+    for played_at, track_id, elapsed_ms, _ in rows:
+        a = acc.setdefault((_day(as_utc(played_at)), track_id), [0, 0])
+        a[0] += 1
+        a[1] += int(elapsed_ms or 0)
+    return [{"user_id": user_id, "day": d, "track_id": t, "plays": a[0], "ms": a[1]} for (d, t), a in acc.items()]
+
+def rebuild_rollups(user_id: str, write_lock=None) -> Dict[str, int]:
+    """
+    Replace the user's base, user_track_daily, daily_totals and sketches.
+    One transaction under write_lock: the old rows go first, then each
+    month's rows are loaded as soon as they are read.
+    """
+    eng = get_engine()
+    out = {"quarters": 0, "track_days": 0}
+    with write_lock or contextlib.nullcontext(), eng.begin() as conn:
+        for t in (user_track_quarter, user_track_daily, user_month_sketches):
+            conn.execute(delete(t).where(t.c.user_id == user_id))
+        # plays are read over a second connection, ATTACH is refused inside the write transaction
+        with eng.connect() as src:
+            for month in _months(src, user_id):
+                end = next_month(month)
+                p = plays_source(src, month, end, user_id=user_id)
+                rows = src.execute(
+                    select(p.c.played_at, p.c.track_id, p.c.elapsed_ms, p.c.is_skip)
+                    .where(and_(p.c.user_id == user_id, p.c.played_at >= month, p.c.played_at < end))
+                ).fetchall()
+                # a quarter and a UTC day never straddle months, each month's rows are final
+                out["quarters"] += bulk_load(conn, user_track_quarter, _quarter_rows(user_id, rows))
+                out["track_days"] += bulk_load(conn, user_track_daily, _track_days(user_id, rows))
+        out["days"] = rebucket(conn, user_id)
+        out["months"] = sketches.rebuild(conn, user_id)
+    return out
+
+def rerollup_user(user_id: str, page: int = PAGE, write_lock=None) -> Dict[str, Any]:
+    """
+    Everything above for one user. Each stage commits on its own and the
+    whole is safe to run again for the same user.
+    """
+    t0 = time.perf_counter()
+    res: Dict[str, Any] = dict(rederive_plays(user_id, page, write_lock))
+    res.update(rebuild_rollups(user_id, write_lock))
+    with write_lock or contextlib.nullcontext(), get_engine().begin() as conn:
+        res["sessions"] = backfill_user(conn, user_id)
+    cache.invalidate(user_id)
+    res["seconds"] = round(time.perf_counter() - t0, 3)
+    return res
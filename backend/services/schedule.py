@@ -0,0 +1,155 @@
+"""
+Adaptive per user sync schedule for the cron job:
+- Recently Played only keeps the newest WINDOW plays, so a user has to be
+  synced before more than that pile up, while syncing an idle user is a
+  wasted request
+- after each sync the last PROFILE_DAYS of plays give a per UTC hour of
+  day profile (the busiest day by default) and a decayed recent rate
+- the next sync is due when the expected plays since this one reach
+  TARGET_FILL of the window, the deadline is when they would fill it;
+  a sync that came back with a full window halves the next interval
+- a run pops due users off a heap ordered by deadline until the request
+  budget is spent, the rest stay due and go first next run
+replan() and pick() take no database so bench/sync_schedule.py replays
+synthetic traces through the same code.
+"""
+
+from __future__ import annotations
+import heapq
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from .. import config
+from ..models import user_info, sync_schedule, as_utc, now_utc
+from .partitions import plays_source
+from .upsert import upsert
+
+WINDOW = 50  # Spotify keeps the newest 50 plays
+TARGET_FILL = config.SYNC_TARGET_FILL
+MIN_INTERVAL = timedelta(minutes=config.SYNC_MIN_INTERVAL_MINUTES)
+MAX_INTERVAL = timedelta(hours=config.SYNC_MAX_INTERVAL_HOURS)
+REQUEST_BUDGET = config.SYNC_REQUEST_BUDGET
+# token mint plus one Recently Played page
+SYNC_COST = 2
+PROFILE_DAYS = 28
+PROFILE_QUANTILE = 1.0  # the busiest day, 0.95 saves a fifth of the requests but lets a few plays go
+RATE_TAU_HOURS = 3.0
+STEP = timedelta(minutes=5)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def hourly_profile(history: Iterable[datetime], now: datetime) -> List[float]:
+    """
+    Plays per UTC hour of day at PROFILE_QUANTILE over the last
+    PROFILE_DAYS days, a day without plays in that hour counts as zero.
+    Never below the average hour, people do listen at odd times.
+    """
+    start = now - timedelta(days=PROFILE_DAYS)
+    counts: Dict[Tuple[int, int], int] = {}
+    for t in history:
+        if start <= t < now:
+            key = (t.toordinal(), t.hour)
+            counts[key] = counts.get(key, 0) + 1
+    per_hour: List[List[int]] = [[] for _ in range(24)]
+    for (_day, hour), n in counts.items():
+        per_hour[hour].append(n)
+    # no hour is expected to be quieter than the user's average hour
+    floor = sum(counts.values()) / (PROFILE_DAYS * 24.0)
+    out = []
+    for vals in per_hour:
+        vals = [0] * max(PROFILE_DAYS - len(vals), 0) + sorted(vals)
+        out.append(max(float(vals[int(PROFILE_QUANTILE * (len(vals) - 1) + 0.5)]), floor))
+    return out
+
+def recent_rate(history: Iterable[datetime], now: datetime) -> float:
+    """
+    Plays per hour with each play weighted down by exp(-age / tau), so a
+    session in progress counts fully and one hours ago barely.
+    """
+    total = 0.0
+    for t in history:
+        age = (now - t).total_seconds() / 3600.0
+        if 0 <= age < RATE_TAU_HOURS * 6:
+            total += math.exp(-age / RATE_TAU_HOURS)
+    return total / RATE_TAU_HOURS
+
+def replan(prev: Optional[Mapping[str, Any]], new_plays: int, history: Sequence[datetime], now: datetime) -> Dict[str, Any]:
+    """
+    Schedule row after a sync at now that fetched new_plays, history
+    being the user's plays of the last PROFILE_DAYS.
+    """
+    profile = hourly_profile(history, now)
+    rate = recent_rate(history, now)
+    step_h = STEP.total_seconds() / 3600.0
+    horizon = now + MAX_INTERVAL * 2
+    due = deadline = None
+    expected = 0.0
+    t = now
+    while t < horizon:
+        # the profile for this hour or the current session winding down, whichever is more
+        h = (t - now).total_seconds() / 3600.0
+        expected += max(profile[t.hour], rate * math.exp(-h / RATE_TAU_HOURS)) * step_h
+        t += STEP
+        if due is None and expected >= TARGET_FILL * WINDOW:
+            due = t
+        if expected >= WINDOW:
+            deadline = t
+            break
+    due = min(max(due or now + MAX_INTERVAL, now + MIN_INTERVAL), now + MAX_INTERVAL)
+
+    overflowed = new_plays >= WINDOW
+    last = as_utc(prev["last_sync_at"]) if prev and prev["last_sync_at"] else None
+    if overflowed and last is not None:
+        # plays were probably lost, whatever the estimate says come back sooner
+        due = min(due, now + max((now - last) / 2, MIN_INTERVAL))
+    deadline = max(deadline or horizon, due)
+    return {
+        "next_due": due,
+        "deadline": due if overflowed else deadline,
+        "last_sync_at": now,
+        "last_new_plays": new_plays,
+        "rate": round(rate, 3),
+        "overflows": (prev["overflows"] if prev else 0) + int(overflowed),
+    }
+
+def pick(candidates: Iterable[Tuple[datetime, str]], budget: int = REQUEST_BUDGET, cost: int = SYNC_COST) -> List[str]:
+    """
+    User ids from (deadline, user_id) pairs, earliest deadline first, as
+    many as budget requests pay for (0 means all).
+    """
+    heap = list(candidates)
+    heapq.heapify(heap)
+    n = len(heap) if not budget else min(len(heap), budget // cost)
+    return [heapq.heappop(heap)[1] for _ in range(n)]
+
+def due_users(conn, now: Optional[datetime] = None, budget: int = REQUEST_BUDGET) -> List[str]:
+    """
+    Users due at now in sync order, never scheduled users first.
+    """
+    now = now or now_utc()
+    rows = conn.execute(
+        select(user_info.c.user_id, sync_schedule.c.deadline)
+        .select_from(user_info.outerjoin(sync_schedule, user_info.c.user_id == sync_schedule.c.user_id))
+        .where(or_(sync_schedule.c.user_id.is_(None), sync_schedule.c.next_due <= now))
+    ).all()
+    return pick(((as_utc(d) if d else _EPOCH, uid) for uid, d in rows), budget)
+
+def record(conn, user_id: str, new_plays: int, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Replan the user after a sync, call in a transaction that has not
+    written yet since archived months may be attached.
+    """
+    now = now or now_utc()
+    start = now - timedelta(days=PROFILE_DAYS)
+    p = plays_source(conn, start, now, user_id=user_id)
+    history = [as_utc(r[0]) for r in conn.execute(
+        select(p.c.played_at).where(and_(p.c.user_id == user_id, p.c.played_at >= start, p.c.played_at <= now))
+    )]
+    prev = conn.execute(select(sync_schedule).where(sync_schedule.c.user_id == user_id)).mappings().first()
+    plan = replan(prev, new_plays, history, now)
+    upsert(conn, sync_schedule, [dict(plan, user_id=user_id)], keys=["user_id"],
+           update=list(plan), extra_set={"updated_at": now_utc()})
+    return plan
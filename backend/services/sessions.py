@@ -0,0 +1,221 @@
+"""
+Listening sessions and daily streaks:
+- a session is a run of plays where the idle time between one play ending
+  and the next starting is at most SESSION_GAP_MINUTES
+- sessionize() works on numpy arrays so backfill and ingest share it
+- ingest re-sessionizes only from the last session before the new plays
+- streak state extends in place when new days arrive in order; streak
+  days are the user's local days, the ones daily_totals and the year in
+  review count
+"""
+
+from __future__ import annotations
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select, and_, delete
+
+from .. import config
+from ..models import get_engine, tracks, sessions, user_streaks, user_info, as_utc
+from .upsert import upsert, bulk_load
+from .partitions import plays_source
+from .timezones import _local_day_numbers, user_tz
+
+SESSION_GAP_MINUTES = config.SESSION_GAP_MINUTES
+DAY_MS = 86_400_000
+_EPOCH_DAY = date(1970, 1, 1)
+
+def _ms(dt: datetime) -> int:
+    return int(as_utc(dt).timestamp() * 1000)
+
+def _dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+def sessionize(start_ms: np.ndarray, elapsed_ms: np.ndarray, artist_idx: np.ndarray, gap_ms: int) -> Dict[str, np.ndarray]:
+    """
+    Split time ordered plays into sessions.
+    Returns parallel arrays: start, end, plays, ms and top_artist (index into
+    the caller's artist table, by summed elapsed).
+    """
+    n = len(start_ms)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return {"start": empty, "end": empty, "plays": empty, "ms": empty, "top_artist": empty}
+
+    ends = start_ms + elapsed_ms
+    idle = start_ms[1:] - ends[:-1]
+    bounds = np.concatenate(([0], np.flatnonzero(idle > gap_ms) + 1))
+    counts = np.diff(np.append(bounds, n))
+
+    sid = np.repeat(np.arange(len(bounds)), counts)
+    n_art = int(artist_idx.max()) + 1
+    key = sid * n_art + artist_idx
+    uniq, inv = np.unique(key, return_inverse=True)
+    totals = np.bincount(inv, weights=elapsed_ms)
+    k_sid = uniq // n_art
+    # per session, highest total first
+    order = np.lexsort((-totals, k_sid))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = k_sid[order][1:] != k_sid[order][:-1]
+
+    return {
+        "start": start_ms[bounds],
+        "end": np.maximum.reduceat(ends, bounds),
+        "plays": counts,
+        "ms": np.add.reduceat(elapsed_ms, bounds),
+        "top_artist": (uniq % n_art)[order][first],
+    }
+
+def _load_plays(conn, user_id: str, since: Optional[datetime]):
+    p = plays_source(conn, since, None, user_id=user_id)
+    q = (
+        select(p.c.played_at, p.c.elapsed_ms, tracks.c.artist_id)
+        .select_from(p.join(tracks, p.c.track_id == tracks.c.track_id))
+        .where(p.c.user_id == user_id)
+        .order_by(p.c.played_at)
+    )
+    if since is not None:
+        q = q.where(p.c.played_at >= since)
+    rows = conn.execute(q).fetchall()
+    start = np.fromiter((_ms(r[0]) for r in rows), dtype=np.int64, count=len(rows))
+    elapsed = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=len(rows))
+    artist_ids, artist_idx = np.unique(np.array([r[2] for r in rows], dtype=object), return_inverse=True)
+    return start, elapsed, artist_ids, artist_idx.astype(np.int64)
+
+def _write_sessions(conn, user_id: str, start, elapsed, artist_ids, artist_idx) -> int:
+    out = sessionize(start, elapsed, artist_idx, SESSION_GAP_MINUTES * 60_000)
+    if not len(out["start"]):
+        return 0
+    bulk_load(conn, sessions, [
+        {
+            "user_id": user_id,
+            "start_at": _dt(int(s)),
+            "end_at": _dt(int(e)),
+            "plays": int(p),
+            "ms": int(m),
+            "top_artist_id": artist_ids[int(a)],
+        }
+        for s, e, p, m, a in zip(out["start"], out["end"], out["plays"], out["ms"], out["top_artist"])
+    ])
+    return len(out["start"])
+
+def update_sessions(conn, user_id: str, first_new: datetime) -> int:
+    """
+    Rebuild sessions from the one in progress at first_new onward.
+    That session may gain plays, and the play before first_new may
+    just have had its elapsed_ms filled in.
+    """
+    anchor = conn.execute(
+        select(sessions.c.start_at)
+        .where(and_(sessions.c.user_id == user_id, sessions.c.start_at <= first_new))
+        .order_by(sessions.c.start_at.desc())
+        .limit(1)
+    ).scalar()
+    since = as_utc(anchor) if anchor is not None else first_new
+    loaded = _load_plays(conn, user_id, since)
+    conn.execute(delete(sessions).where(and_(sessions.c.user_id == user_id, sessions.c.start_at >= since)))
+    return _write_sessions(conn, user_id, *loaded)
+
+def _local_days(conn, user_id: str, start_ms: np.ndarray) -> np.ndarray:
+    # sorted unique local day numbers of play start times in the user's timezone
+    return np.unique(_local_day_numbers(start_ms // 1000, user_tz(conn, user_id)))
+
+def _runs(day_numbers: np.ndarray) -> Dict[str, Any]:
+    # day_numbers are sorted unique local days since epoch, stored as that date at midnight UTC
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(day_numbers) != 1) + 1))
+    lengths = np.diff(np.append(bounds, len(day_numbers)))
+    best = int(np.argmax(lengths))
+    day = lambda i: _dt(int(day_numbers[i]) * DAY_MS)
+    last = len(bounds) - 1
+    return {
+        "current_start": day(bounds[last]),
+        "current_end": day(len(day_numbers) - 1),
+        "current_days": int(lengths[last]),
+        "longest_start": day(bounds[best]),
+        "longest_end": day(bounds[best] + lengths[best] - 1),
+        "longest_days": int(lengths[best]),
+    }
+
+def _save_streak(conn, user_id: str, state: Dict[str, Any]) -> None:
+    upsert(conn, user_streaks, [dict(state, user_id=user_id)], keys=["user_id"], update=list(state))
+
+def recompute_streak(conn, user_id: str) -> Optional[Dict[str, Any]]:
+    start, _elapsed, _a, _i = _load_plays(conn, user_id, None)
+    if not len(start):
+        return None
+    state = _runs(_local_days(conn, user_id, start))
+    _save_streak(conn, user_id, state)
+    return state
+
+def save_streak_days(conn, user_id: str, days: Iterable[date]) -> Optional[Dict[str, Any]]:
+    """
+    Replace the streak state from the local dates the user played on.
+    """
+    numbers = np.unique(np.fromiter(((d - _EPOCH_DAY).days for d in days), dtype=np.int64))
+    if not len(numbers):
+        conn.execute(delete(user_streaks).where(user_streaks.c.user_id == user_id))
+        return None
+    state = _runs(numbers)
+    _save_streak(conn, user_id, state)
+    return state
+
+def update_streak(conn, user_id: str, played: Iterable[datetime]) -> Optional[Dict[str, Any]]:
+    """
+    Fold the local days of newly stored plays into the streak state.
+    Falls back to a full recompute when a day lands before the current streak.
+    """
+    start = np.fromiter((_ms(t) for t in played), dtype=np.int64)
+    if not len(start):
+        return None
+    days = [_dt(int(d) * DAY_MS) for d in _local_days(conn, user_id, start)]
+    row = conn.execute(select(user_streaks).where(user_streaks.c.user_id == user_id)).mappings().fetchone()
+    if not row or row["current_end"] is None or days[0] < as_utc(row["current_start"]):
+        return recompute_streak(conn, user_id)
+
+    state = {k: (as_utc(v) if isinstance(v, datetime) else v) for k, v in row.items() if k != "user_id"}
+    for d in days:
+        if d <= state["current_end"]:
+            continue
+        if d == state["current_end"] + timedelta(days=1):
+            state["current_end"] = d
+            state["current_days"] += 1
+        else:
+            state["current_start"] = state["current_end"] = d
+            state["current_days"] = 1
+        if state["current_days"] > state["longest_days"]:
+            state.update(
+                longest_start=state["current_start"],
+                longest_end=state["current_end"],
+                longest_days=state["current_days"],
+            )
+    _save_streak(conn, user_id, state)
+    return state
+
+def backfill(user_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Recompute sessions and streaks from the full play history.
+    """
+    eng = get_engine()
+    if user_ids is None:
+        with eng.begin() as conn:
+            user_ids = [r[0] for r in conn.execute(select(user_info.c.user_id))]
+    written = 0
+    for uid in user_ids:
+        with eng.begin() as conn:
+            written += backfill_user(conn, uid)
+    return {"users": len(user_ids), "sessions_written": written}
+
+def backfill_user(conn, user_id: str) -> int:
+    """
+    Replace one user's sessions and streak from all of their plays.
+    """
+    loaded = _load_plays(conn, user_id, None)
+    conn.execute(delete(sessions).where(sessions.c.user_id == user_id))
+    written = _write_sessions(conn, user_id, *loaded)
+    start = loaded[0]
+    if len(start):
+        _save_streak(conn, user_id, _runs(_local_days(conn, user_id, start)))
+    else:
+        conn.execute(delete(user_streaks).where(user_streaks.c.user_id == user_id))
+    return written
@@ -0,0 +1,432 @@
+"""
+Per user nearest neighbour index over listening history:
+- tracks played within COOC_WINDOW plays of each other in one session
+  (the SESSION_GAP_MINUTES rule from sessions.py) co-occur, pair counts
+  are kept as a CSR matrix over the user's tracks with play counts and
+  last played times alongside
+- every local day (the days of daily_totals, bucketed from the 15 minute
+  base) is a vector of minutes over the user's DAY_ARTISTS most played
+  artists plus one column for the rest, scaled to unit length so a dot
+  product is the cosine
+- the arrays are .npy files under SIMILARITY_DIR/<user>/<version>/ and
+  are opened with mmap_mode="r", meta.json names the current version and
+  the last played_at folded in
+- build() reads the whole history; update() folds the plays after that
+  cursor into a new version, re-bucketing only the days they touched. A
+  timezone change rebuilds, artists new since the build go to the rest
+  column until the next build
+numpy is imported on first use, the app imports this for the routes.
+"""
+
+from __future__ import annotations
+import fcntl
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+
+from .. import config
+from ..models import get_read_engine, as_utc, now_utc
+from . import timezones
+from .partitions import plays_source
+
+SIMILARITY_DIR = config.SIMILARITY_DIR
+COOC_WINDOW = 5  # a play co-occurs with the next COOC_WINDOW - 1 plays of its session
+DAY_ARTISTS = 256
+REVISIT_SEEDS = 25  # most recently played tracks the revisit list starts from
+REVISIT_QUIET_DAYS = 30
+KEEP_VERSIONS = 2
+# a play further back than this cannot share a session with a new one
+CONTEXT = timedelta(days=1)
+
+_EPOCH = date(1970, 1, 1)
+_ARRAYS = ("track_ids", "plays", "last_ms", "indptr", "indices", "counts",
+           "days", "day_minutes", "day_vectors", "day_artists")
+
+def _user_dir(user_id: str) -> str:
+    return os.path.join(SIMILARITY_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", user_id))
+
+def _ms(dt: datetime) -> int:
+    return int(as_utc(dt).timestamp() * 1000)
+
+def _dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+def _read_meta(user_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(user_dir, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _locked(user_dir: str):
+    # one writer per user across processes, readers never take it
+    os.makedirs(user_dir, exist_ok=True)
+    with open(os.path.join(user_dir, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class Index:
+    """
+    One published version, arrays memory-mapped read only.
+    """
+
+    __slots__ = ("version", "through_ms", "tz") + _ARRAYS + ("_track_pos",)
+
+    def __init__(self, user_dir: str, meta: Dict[str, Any]):
+        import numpy as np
+
+        self.version = meta["version"]
+        self.through_ms = meta["through_ms"]
+        self.tz = meta["timezone"]
+        path = os.path.join(user_dir, str(self.version))
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        self._track_pos: Optional[Dict[str, int]] = None
+
+    def track_pos(self, track_id: str) -> Optional[int]:
+        if self._track_pos is None:
+            self._track_pos = {t: i for i, t in enumerate(self.track_ids.tolist())}
+        return self._track_pos.get(track_id)
+
+_indexes: Dict[str, Index] = {}
+
+def load(user_id: str) -> Optional[Index]:
+    """
+    The user's current index, None before the first build. Reopened when
+    another process has published a newer version.
+    """
+    user_dir = _user_dir(user_id)
+    meta = _read_meta(user_dir)
+    if meta is None:
+        return None
+    idx = _indexes.get(user_id)
+    if idx is None or idx.version != meta["version"]:
+        idx = _indexes[user_id] = Index(user_dir, meta)
+    return idx
+
+def _publish(user_id: str, arrays: Dict[str, Any], through_ms: int, tz: str) -> Dict[str, Any]:
+    import numpy as np
+
+    user_dir = _user_dir(user_id)
+    prev = _read_meta(user_dir)
+    version = (prev["version"] + 1) if prev else 1
+    path = os.path.join(user_dir, str(version))
+    os.makedirs(path, exist_ok=True)
+    size = 0
+    for name in _ARRAYS:
+        np.save(os.path.join(path, name + ".npy"), arrays[name])
+        size += os.path.getsize(os.path.join(path, name + ".npy"))
+    meta = {
+        "version": version,
+        "through_ms": through_ms,
+        "through": _dt(through_ms).isoformat() if through_ms else None,
+        "timezone": tz,
+        "built_at": now_utc().isoformat(),
+        "tracks": int(len(arrays["track_ids"])),
+        "pairs": int(len(arrays["indices"])),
+        "days": int(len(arrays["days"])),
+        "bytes": size,
+    }
+    tmp = os.path.join(user_dir, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(user_dir, "meta.json"))
+    # open maps of pruned versions stay valid until their readers drop them
+    for old in os.listdir(user_dir):
+        if old.isdigit() and int(old) <= version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(user_dir, old), ignore_errors=True)
+    return meta
+
+def _load_plays(conn, user_id: str, since: Optional[datetime] = None):
+    import numpy as np
+
+    p = plays_source(conn, since, None, user_id=user_id)
+    q = select(p.c.played_at, p.c.elapsed_ms, p.c.track_id).where(p.c.user_id == user_id).order_by(p.c.played_at)
+    if since is not None:
+        q = q.where(p.c.played_at >= since)
+    rows = conn.execute(q).fetchall()
+    start = np.fromiter((_ms(r[0]) for r in rows), dtype=np.int64, count=len(rows))
+    elapsed = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=len(rows))
+    return start, elapsed, [r[2] for r in rows]
+
+def _pairs(start, elapsed, t_idx, first: int = 0):
+    """
+    (row, col) track index pairs, both directions, for plays at most
+    COOC_WINDOW - 1 apart in one session where the later play is at or
+    after position first.
+    """
+    import numpy as np
+
+    n = len(start)
+    gap = config.SESSION_GAP_MINUTES * 60_000
+    sid = np.cumsum(np.concatenate(([1], (start[1:] - (start + elapsed)[:-1]) > gap)))
+    rows, cols = [], []
+    for d in range(1, COOC_WINDOW):
+        i = np.arange(max(first - d, 0), max(n - d, 0))
+        ok = (sid[i] == sid[i + d]) & (t_idx[i] != t_idx[i + d])
+        a, b = t_idx[i][ok], t_idx[i + d][ok]
+        rows += [a, b]
+        cols += [b, a]
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(rows), np.concatenate(cols)
+
+def _csr(rows, cols, weights, n: int):
+    import numpy as np
+
+    keys, inv = np.unique(rows.astype(np.int64) * n + cols, return_inverse=True)
+    counts = np.bincount(inv, weights=weights, minlength=len(keys)).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // n, minlength=n), out=indptr[1:])
+    return indptr, (keys % n).astype(np.int32), counts
+
+def _quarter_days(conn, user_id: str, tz: str, lo: Optional[int] = None, hi: Optional[int] = None):
+    """
+    (local day number, artist_id, ms) per quarter row of the base.
+    """
+    import numpy as np
+
+    rows = timezones._load_quarters(conn, user_id, lo, hi)
+    secs = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)) * timezones.BUCKET_SECONDS
+    days = timezones._local_day_numbers(secs, tz) if len(rows) else secs
+    ms = np.fromiter((r[4] for r in rows), dtype=np.float64, count=len(rows))
+    return days, [r[2] or "" for r in rows], ms
+
+def _day_matrix(days, artist_ids: List[str], ms, columns: Dict[str, int]):
+    """
+    Unit day vectors and whole minutes for the distinct days, artists
+    outside columns summed into the last column.
+    """
+    import numpy as np
+
+    other = len(columns)
+    col = np.fromiter((columns.get(a, other) for a in artist_ids), dtype=np.int64, count=len(artist_ids))
+    uniq, d_idx = np.unique(days, return_inverse=True)
+    m = np.zeros((len(uniq), other + 1), dtype=np.float64)
+    np.add.at(m, (d_idx, col), ms / 60_000.0)
+    minutes = m.sum(axis=1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    vectors = np.divide(m, norms, out=np.zeros_like(m), where=norms > 0).astype(np.float32)
+    return uniq.astype(np.int32), np.rint(minutes).astype(np.int32), vectors
+
+def build(user_id: str) -> Dict[str, Any]:
+    """
+    Index the user's whole history and publish it as a new version.
+    """
+    with _locked(_user_dir(user_id)):
+        return _build(user_id)
+
+def _build(user_id: str) -> Dict[str, Any]:
+    import numpy as np
+
+    with get_read_engine().connect() as conn:
+        tz = timezones.user_tz(conn, user_id)
+        start, elapsed, track_list = _load_plays(conn, user_id)
+        days, artist_list, ms = _quarter_days(conn, user_id, tz)
+
+    track_ids, t_idx = np.unique(np.array(track_list, dtype=str), return_inverse=True)
+    n = len(track_ids)
+    rows, cols = _pairs(start, elapsed, t_idx)
+    indptr, indices, counts = _csr(rows, cols, None, n)
+    last_ms = np.zeros(n, dtype=np.int64)
+    np.maximum.at(last_ms, t_idx, start)
+
+    columns: Dict[str, int] = {}
+    if artist_list:
+        a_ids, a_idx = np.unique(np.array(artist_list, dtype=str), return_inverse=True)
+        top = a_ids[np.argsort(-np.bincount(a_idx, weights=ms), kind="stable")[:DAY_ARTISTS]]
+        columns = {a: i for i, a in enumerate(top.tolist())}
+    day_numbers, day_minutes, day_vectors = _day_matrix(days, artist_list, ms, columns)
+
+    return _publish(user_id, {
+        "track_ids": track_ids,
+        "plays": np.bincount(t_idx, minlength=n).astype(np.int32),
+        "last_ms": last_ms,
+        "indptr": indptr,
+        "indices": indices,
+        "counts": counts,
+        "days": day_numbers,
+        "day_minutes": day_minutes,
+        "day_vectors": day_vectors,
+        "day_artists": np.array(list(columns), dtype=str),
+    }, int(start[-1]) if len(start) else 0, tz)
+
+def update(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fold plays newer than the index cursor into a new version. None when
+    the user has no index yet, the nightly build makes the first one.
+    """
+    import numpy as np
+
+    if _read_meta(_user_dir(user_id)) is None:
+        return None
+    with _locked(_user_dir(user_id)):
+        idx = load(user_id)
+        with get_read_engine().connect() as conn:
+            tz = timezones.user_tz(conn, user_id)
+            if tz != idx.tz:
+                return dict(_build(user_id), rebuilt=True)
+            since = _dt(idx.through_ms) - CONTEXT if idx.through_ms else None
+            start, elapsed, track_list = _load_plays(conn, user_id, since)
+            first = int(np.searchsorted(start, idx.through_ms, side="right")) if idx.through_ms else 0
+            if first == len(start):
+                return {"version": idx.version, "new_plays": 0, "pairs_added": 0, "days_touched": 0}
+            # the merge also fills in elapsed_ms of the play just before the new ones
+            touched = np.unique(timezones._local_day_numbers(start[max(first - 1, 0):] // 1000, tz))
+            # base buckets of the touched local days, a day either side covers any offset
+            per_day = timezones.DAY_SECONDS // timezones.BUCKET_SECONDS
+            q_days, q_artists, q_ms = _quarter_days(
+                conn, user_id, tz, (int(touched[0]) - 1) * per_day, (int(touched[-1]) + 2) * per_day)
+        return _fold(user_id, idx, tz, start, elapsed, track_list, first, touched, q_days, q_artists, q_ms)
+
+def _fold(user_id: str, idx: Index, tz: str, start, elapsed, track_list: List[str], first: int,
+          touched, q_days, q_artists: List[str], q_ms) -> Dict[str, Any]:
+    import numpy as np
+
+    # plays already folded in are only context for the pairs
+    ctx = max(first - (COOC_WINDOW - 1), 0)
+    start, elapsed, track_list, first = start[ctx:], elapsed[ctx:], track_list[ctx:], first - ctx
+
+    old_n = len(idx.plays)
+    extra: Dict[str, int] = {}
+    t_idx = np.empty(len(track_list), dtype=np.int64)
+    for i, t in enumerate(track_list):
+        pos = idx.track_pos(t)
+        t_idx[i] = pos if pos is not None else extra.setdefault(t, old_n + len(extra))
+    n = old_n + len(extra)
+    track_ids = np.asarray(idx.track_ids)
+    if extra:
+        track_ids = np.concatenate((track_ids, np.array(list(extra), dtype=str)))
+
+    rows, cols = _pairs(start, elapsed, t_idx, first)
+    indptr, indices, counts = _csr(
+        np.concatenate((np.repeat(np.arange(old_n, dtype=np.int64), np.diff(idx.indptr)), rows)),
+        np.concatenate((np.asarray(idx.indices, dtype=np.int64), cols)),
+        np.concatenate((np.asarray(idx.counts, dtype=np.float64), np.ones(len(rows)))),
+        n,
+    )
+    new_idx = t_idx[first:]
+    plays_n = np.zeros(n, dtype=np.int32)
+    plays_n[:old_n] = idx.plays
+    plays_n += np.bincount(new_idx, minlength=n).astype(np.int32)
+    last_ms = np.zeros(n, dtype=np.int64)
+    last_ms[:old_n] = idx.last_ms
+    np.maximum.at(last_ms, new_idx, start[first:])
+
+    # touched days are re-bucketed whole against the build's artist columns
+    columns = {a: i for i, a in enumerate(idx.day_artists.tolist())}
+    keep = np.isin(q_days, touched)
+    t_numbers, t_minutes, t_vectors = _day_matrix(
+        q_days[keep], [a for a, k in zip(q_artists, keep) if k], q_ms[keep], columns)
+    days = np.union1d(idx.days, t_numbers).astype(np.int32)
+    day_minutes = np.zeros(len(days), dtype=np.int32)
+    day_vectors = np.zeros((len(days), len(columns) + 1), dtype=np.float32)
+    for numbers, minutes, vectors in ((idx.days, idx.day_minutes, idx.day_vectors), (t_numbers, t_minutes, t_vectors)):
+        at = np.searchsorted(days, numbers)
+        day_minutes[at] = minutes
+        day_vectors[at] = vectors
+
+    meta = _publish(user_id, {
+        "track_ids": track_ids,
+        "plays": plays_n,
+        "last_ms": last_ms,
+        "indptr": indptr,
+        "indices": indices,
+        "counts": counts,
+        "days": days,
+        "day_minutes": day_minutes,
+        "day_vectors": day_vectors,
+        "day_artists": np.asarray(idx.day_artists),
+    }, int(start[-1]), tz)
+    return dict(meta, new_plays=len(new_idx), pairs_added=len(rows), days_touched=len(t_numbers))
+
+def _top(scores, k: int):
+    import numpy as np
+
+    k = min(k, int((scores > 0).sum()))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+def similar_tracks(user_id: str, track_id: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Tracks most often played near track_id, scored by pair count over
+    the geometric mean of both play counts. None without an index or
+    when the track never co-occurred.
+    """
+    import numpy as np
+
+    idx = load(user_id)
+    pos = idx.track_pos(track_id) if idx is not None else None
+    if pos is None:
+        return None
+    lo, hi = int(idx.indptr[pos]), int(idx.indptr[pos + 1])
+    nb = np.asarray(idx.indices[lo:hi])
+    together = np.asarray(idx.counts[lo:hi])
+    scores = together / np.sqrt(float(idx.plays[pos]) * idx.plays[nb])
+    out = []
+    for i in _top(scores, limit):
+        out.append({"id": str(idx.track_ids[nb[i]]), "score": round(float(scores[i]), 4),
+                    "together": int(together[i]), "plays": int(idx.plays[nb[i]])})
+    return out
+
+def revisit(user_id: str, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    Tracks not played for REVISIT_QUIET_DAYS that co-occur most with the
+    REVISIT_SEEDS most recently played ones.
+    """
+    import numpy as np
+
+    idx = load(user_id)
+    if idx is None:
+        return None
+    n = len(idx.plays)
+    last_ms = np.asarray(idx.last_ms)
+    seeds = np.argpartition(-last_ms, min(REVISIT_SEEDS, n) - 1)[:REVISIT_SEEDS] if n else np.zeros(0, dtype=np.int64)
+    scores = np.zeros(n, dtype=np.float64)
+    plays_n = np.asarray(idx.plays, dtype=np.float64)
+    for s in seeds:
+        lo, hi = int(idx.indptr[s]), int(idx.indptr[s + 1])
+        nb = np.asarray(idx.indices[lo:hi])
+        scores[nb] += idx.counts[lo:hi] / np.sqrt(plays_n[s] * plays_n[nb])
+    scores[last_ms >= idx.through_ms - REVISIT_QUIET_DAYS * 86_400_000] = 0.0
+    items = [{"id": str(idx.track_ids[i]), "score": round(float(scores[i]), 4), "plays": int(idx.plays[i]),
+              "last_played": _dt(int(last_ms[i])).isoformat()} for i in _top(scores, limit)]
+    return {"as_of": _dt(idx.through_ms) if idx.through_ms else None, "seeds": len(seeds), "items": items}
+
+def similar_days(user_id: str, day: date, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Local days whose artist minute mix is closest to day's by cosine.
+    None without an index or when day has no plays.
+    """
+    import numpy as np
+
+    idx = load(user_id)
+    if idx is None:
+        return None
+    dn = (day - _EPOCH).days
+    pos = int(np.searchsorted(idx.days, dn))
+    if pos == len(idx.days) or idx.days[pos] != dn:
+        return None
+    sims = idx.day_vectors @ idx.day_vectors[pos]
+    sims[pos] = 0.0
+    n_named = len(idx.day_artists)
+    out = []
+    for i in _top(sims, limit):
+        vec = idx.day_vectors[i, :n_named]
+        top = [str(idx.day_artists[a]) for a in np.argsort(-vec, kind="stable")[:3] if vec[a] > 0]
+        out.append({"day": _EPOCH + timedelta(days=int(idx.days[i])), "similarity": round(float(sims[i]), 4),
+                    "minutes": int(idx.day_minutes[i]), "top_artists": top})
+    return out
@@ -0,0 +1,309 @@
+"""
+Approximate long window analytics from per user, per month sketches:
+- Space-Saving summaries of the top tracks by ms, top tracks by skips and
+  top artists by ms
+- Count-Min of plays and ms per track, for the counts of any listed track
+- HyperLogLog of distinct tracks
+- exact plays, ms and skips totals
+Sketches are rebuilt from user_track_quarter for the months a sync
+touches and persisted in user_month_sketches. A window merges the whole
+months it covers and adds the partial months at either edge exactly
+from plays, so only the full months are approximate.
+
+Error bounds, N being the window's total of the ranked quantity:
+- a Space-Saving entry's count overestimates the truth by at most its
+  err, err <= N / CAPACITY; an item not listed is at most floor
+- Count-Min overestimates by at most e / WIDTH * N with probability
+  1 - e^-DEPTH (0.27% of N, 98%)
+- HyperLogLog distinct counts have a relative standard error of
+  1.04 / sqrt(2^P) (1.6%)
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import math
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+
+from ..models import tracks, user_track_quarter, user_month_sketches, as_utc
+from . import statements
+from .partitions import month_start, next_month, plays_source
+from .timezones import BUCKET_SECONDS, bucket_of
+from .upsert import upsert
+
+CAPACITY = 200
+WIDTH = 1024
+DEPTH = 4
+P = 12
+REGISTERS = 1 << P
+
+def _hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class SpaceSaving:
+    """
+    Top counts with per item error. entries maps key -> [count, err], the
+    true value lies in [count - err, count]; keys not listed are at most
+    floor. capacity None keeps every key (exact).
+    """
+
+    __slots__ = ("capacity", "entries", "floor")
+
+    def __init__(self, capacity: Optional[int] = CAPACITY, entries: Optional[Dict[str, List[int]]] = None, floor: int = 0):
+        self.capacity = capacity
+        self.entries = entries or {}
+        self.floor = floor
+
+    @classmethod
+    def exact(cls, counts: Dict[str, int], capacity: Optional[int] = CAPACITY) -> "SpaceSaving":
+        ranked = sorted(((k, v) for k, v in counts.items() if v > 0), key=lambda kv: (-kv[1], kv[0]))
+        out = cls(capacity, {k: [v, 0] for k, v in ranked[:capacity]})
+        if capacity is not None and len(ranked) > capacity:
+            out.floor = ranked[capacity][1]
+        return out
+
+    @classmethod
+    def merge_all(cls, parts: List["SpaceSaving"], capacity: Optional[int] = CAPACITY) -> "SpaceSaving":
+        # a key missing from a part counts as that part's floor, all of it error,
+        # so start every key at the summed floor and add what each part knows
+        base = sum(p.floor for p in parts)
+        merged: Dict[str, List[int]] = {}
+        for p in parts:
+            for k, (c, e) in p.entries.items():
+                m = merged.get(k)
+                if m is None:
+                    m = merged[k] = [base, base]
+                m[0] += c - p.floor
+                m[1] += e - p.floor
+        floor = base
+        if capacity is not None and len(merged) > capacity:
+            ranked = sorted(merged.items(), key=lambda kv: (-kv[1][0], kv[0]))
+            floor = max(floor, ranked[capacity][1][0])
+            merged = dict(ranked[:capacity])
+        return cls(capacity, merged, floor)
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        ranked = sorted(self.entries.items(), key=lambda kv: (-kv[1][0], kv[0]))[:n]
+        return [(k, c, e) for k, (c, e) in ranked]
+
+    def to_json(self) -> List[Any]:
+        return [self.floor, self.entries]
+
+    @classmethod
+    def from_json(cls, data: List[Any]) -> "SpaceSaving":
+        return cls(CAPACITY, data[1], data[0])
+
+def _cm_cols(key: str) -> List[int]:
+    # double hashing, DEPTH columns from one 64 bit hash
+    h = _hash64(key)
+    h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+    return [(h1 + i * h2) % WIDTH for i in range(DEPTH)]
+
+def _hll_add(registers, key: str) -> None:
+    h = _hash64(key)
+    idx = h >> (64 - P)
+    rest = h & ((1 << (64 - P)) - 1)
+    rank = (64 - P) - rest.bit_length() + 1
+    if rank > registers[idx]:
+        registers[idx] = rank
+
+def hll_estimate(registers) -> float:
+    import numpy as np
+
+    m = REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    est = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if est <= 2.5 * m and zeros:
+        # small range, linear counting
+        est = m * math.log(m / zeros)
+    return est
+
+def cm_error(total: int) -> float:
+    # Count-Min overestimate bound for a quantity summing to total
+    return math.e / WIDTH * total
+
+class Sketch:
+    """
+    One user's summary of a span of plays, mergeable with any other.
+    """
+
+    __slots__ = ("plays", "ms", "skips", "track_ms", "track_skips", "artist_ms", "cm", "hll")
+
+    def __init__(self, cm=None, hll=None):
+        import numpy as np
+
+        self.plays = self.ms = self.skips = 0
+        self.track_ms = SpaceSaving()
+        self.track_skips = SpaceSaving()
+        self.artist_ms = SpaceSaving()
+        # cm[0] plays, cm[1] ms per track
+        self.cm = cm if cm is not None else np.zeros((2, DEPTH, WIDTH), dtype=np.int64)
+        self.hll = hll if hll is not None else np.zeros(REGISTERS, dtype=np.uint8)
+
+    @classmethod
+    def from_counts(cls, rows: Iterable[Tuple[str, Optional[str], int, int, int]], capacity: Optional[int] = CAPACITY) -> "Sketch":
+        """
+        Sketch of exact per track (track_id, artist_id, plays, ms, skips).
+        """
+        out = cls()
+        track_ms: Dict[str, int] = {}
+        track_skips: Dict[str, int] = {}
+        artist_ms: Dict[str, int] = {}
+        for track_id, artist_id, n, ms, skips in rows:
+            n, ms, skips = int(n or 0), int(ms or 0), int(skips or 0)
+            out.plays += n
+            out.ms += ms
+            out.skips += skips
+            track_ms[track_id] = track_ms.get(track_id, 0) + ms
+            track_skips[track_id] = track_skips.get(track_id, 0) + skips
+            if artist_id:
+                artist_ms[artist_id] = artist_ms.get(artist_id, 0) + ms
+            cols = _cm_cols(track_id)
+            for i, c in enumerate(cols):
+                out.cm[0, i, c] += n
+                out.cm[1, i, c] += ms
+            _hll_add(out.hll, track_id)
+        out.track_ms = SpaceSaving.exact(track_ms, capacity)
+        out.track_skips = SpaceSaving.exact(track_skips, capacity)
+        out.artist_ms = SpaceSaving.exact(artist_ms, capacity)
+        return out
+
+    @classmethod
+    def merge_all(cls, parts: List["Sketch"]) -> "Sketch":
+        import numpy as np
+
+        if not parts:
+            return cls()
+        out = cls(np.sum([p.cm for p in parts], axis=0), np.max([p.hll for p in parts], axis=0))
+        out.plays = sum(p.plays for p in parts)
+        out.ms = sum(p.ms for p in parts)
+        out.skips = sum(p.skips for p in parts)
+        out.track_ms = SpaceSaving.merge_all([p.track_ms for p in parts])
+        out.track_skips = SpaceSaving.merge_all([p.track_skips for p in parts])
+        out.artist_ms = SpaceSaving.merge_all([p.artist_ms for p in parts])
+        return out
+
+    def track_counts(self, track_id: str) -> Tuple[int, int]:
+        """
+        Count-Min (plays, ms) estimate for one track, both overestimates.
+        """
+        cols = _cm_cols(track_id)
+        rows = range(DEPTH)
+        return int(self.cm[0, rows, cols].min()), int(self.cm[1, rows, cols].min())
+
+    def distinct_tracks(self) -> int:
+        return int(round(hll_estimate(self.hll)))
+
+    def dumps(self) -> bytes:
+        meta = {
+            "plays": self.plays, "ms": self.ms, "skips": self.skips,
+            "track_ms": self.track_ms.to_json(), "track_skips": self.track_skips.to_json(),
+            "artist_ms": self.artist_ms.to_json(),
+        }
+        # json never contains a raw NUL, so it separates the header from the arrays
+        return zlib.compress(json.dumps(meta, separators=(",", ":")).encode() + b"\0" + self.hll.tobytes() + self.cm.tobytes())
+
+    @classmethod
+    def loads(cls, blob: bytes) -> "Sketch":
+        import numpy as np
+
+        raw = zlib.decompress(blob)
+        cut = raw.index(b"\0")
+        meta = json.loads(raw[:cut])
+        hll = np.frombuffer(raw, dtype=np.uint8, count=REGISTERS, offset=cut + 1).copy()
+        cm = np.frombuffer(raw, dtype=np.int64, offset=cut + 1 + REGISTERS).reshape(2, DEPTH, WIDTH).copy()
+        out = cls(cm, hll)
+        out.plays, out.ms, out.skips = meta["plays"], meta["ms"], meta["skips"]
+        out.track_ms = SpaceSaving.from_json(meta["track_ms"])
+        out.track_skips = SpaceSaving.from_json(meta["track_skips"])
+        out.artist_ms = SpaceSaving.from_json(meta["artist_ms"])
+        return out
+
+def _month_rows(conn, user_id: str, month: datetime):
+    q = (
+        select(
+            user_track_quarter.c.track_id, tracks.c.artist_id,
+            func.sum(user_track_quarter.c.plays), func.sum(user_track_quarter.c.ms), func.sum(user_track_quarter.c.skips),
+        )
+        .select_from(user_track_quarter.join(tracks, user_track_quarter.c.track_id == tracks.c.track_id))
+        .where(and_(
+            user_track_quarter.c.user_id == user_id,
+            user_track_quarter.c.bucket >= bucket_of(month),
+            user_track_quarter.c.bucket < bucket_of(next_month(month)),
+        ))
+        .group_by(user_track_quarter.c.track_id, tracks.c.artist_id)
+    )
+    return conn.execute(q).fetchall()
+
+def refresh_months(conn, user_id: str, days: Iterable[datetime]) -> int:
+    """
+    Rebuild the sketches of the UTC months containing days from the base.
+    """
+    rows = []
+    for month in sorted({month_start(as_utc(d)) for d in days}):
+        rows.append({"user_id": user_id, "month": month, "data": Sketch.from_counts(_month_rows(conn, user_id, month)).dumps()})
+    if not rows:
+        return 0
+    return upsert(conn, user_month_sketches, rows, keys=["user_id", "month"], update=["data"], extra_set={"updated_at": func.now()})
+
+def rebuild(conn, user_id: str) -> int:
+    """
+    Rebuild every month of the user's history from the base.
+    """
+    lo, hi = conn.execute(
+        select(func.min(user_track_quarter.c.bucket), func.max(user_track_quarter.c.bucket))
+        .where(user_track_quarter.c.user_id == user_id)
+    ).one()
+    if lo is None:
+        return 0
+    months = []
+    m = month_start(datetime.fromtimestamp(lo * BUCKET_SECONDS, tz=timezone.utc))
+    last = datetime.fromtimestamp(hi * BUCKET_SECONDS, tz=timezone.utc)
+    while m <= last:
+        months.append(m)
+        m = next_month(m)
+    return refresh_months(conn, user_id, months)
+
+def window(conn, user_id: str, start: Optional[datetime], end: datetime) -> Sketch:
+    """
+    Sketch of [start, end): stored sketches for the whole months inside,
+    exact counts from plays for the partial months at the edges. start
+    None means the whole history.
+    """
+    if start is None:
+        first = conn.execute(
+            select(func.min(user_month_sketches.c.month)).where(user_month_sketches.c.user_id == user_id)
+        ).scalar()
+        start = as_utc(first) if first is not None else month_start(end)
+    m = month_start(start)
+    if m < start:
+        m = next_month(m)
+    months = []
+    while next_month(m) <= end:
+        months.append(m)
+        m = next_month(m)
+
+    edges = [(start, end)]
+    if months:
+        edges = [(start, months[0]), (next_month(months[-1]), end)]
+    parts: List[Sketch] = []
+    if months:
+        blobs = conn.execute(
+            select(user_month_sketches.c.data).where(and_(
+                user_month_sketches.c.user_id == user_id,
+                user_month_sketches.c.month >= months[0],
+                user_month_sketches.c.month <= months[-1],
+            ))
+        ).scalars().all()
+        parts.extend(Sketch.loads(blob) for blob in blobs)
+    for lo, hi in edges:
+        if lo < hi:
+            p = plays_source(conn, lo, hi, user_id=user_id)
+            rows = conn.execute(statements.track_counts(p), {"user_id": user_id, "start": lo, "end": hi}).fetchall()
+            parts.append(Sketch.from_counts(rows, capacity=None))
+    return Sketch.merge_all(parts)
@@ -6,48 +6,52 @@ Spotify helpers:
 """
 
 from __future__ import annotations
-import os
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional, Iterator
 
-import requests
-from flask import session
-from dotenv import load_dotenv
-
 from sqlalchemy import select, update
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from .. import config
 from ..models import get_engine, user_info
 
-load_dotenv()
-
-CLIENT_ID = os.getenv("CLIENT_ID", "")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET", "")
-SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
-SPOTIFY_API_BASE = "https://api.spotify.com/v1"
+CLIENT_ID = config.CLIENT_ID
+CLIENT_SECRET = config.CLIENT_SECRET
+SPOTIFY_TOKEN_URL = config.SPOTIFY_TOKEN_URL
+SPOTIFY_API_BASE = config.SPOTIFY_API_BASE
 
 DEFAULT_TIMEOUT = 10  # seconds
 
+# flask is imported inside the session helpers so cron imports stay Flask free,
+# requests inside the calls so importing this module stays cheap
 def _session_expired() -> bool:
+    from flask import session
     exp = session.get("expires_at")
     if not exp:
         return True
     # buffer to avoid edge expiry
     return datetime.now(timezone.utc) >= (datetime.fromisoformat(exp) - timedelta(seconds=30))
 
+def _in_request() -> bool:
+    # worker threads and cron have no session to refresh
+    from flask import has_request_context
+    return has_request_context()
+
 def _update_session_token(access_token: str, expires_in: int) -> None:
+    from flask import session
     session["access_token"] = access_token
     expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
     session["expires_at"] = expires_at.isoformat()
 
-def current_session_token() -> Optional[str]:
+def current_session_token(refresh: bool = False) -> Optional[str]:
     """
     Returns a valid access token from the session.
-    If expired, tries to refresh using DB refresh_token for the session user.
+    If expired, or refresh is set after Spotify rejected the session token,
+    tries to refresh using DB refresh_token for the session user.
     """
+    from flask import session
     token = session.get("access_token")
-    if token and not _session_expired():
+    if token and not refresh and not _session_expired():
         return token
 
     user_id = session.get("user_id")
@@ -84,6 +88,8 @@ def mint_access_token(refresh_token: str) -> Optional[Dict[str, Any]]:
     """
     Exchange refresh_token for a new access token.
     """
+    import requests
+
     data = {
         "grant_type": "refresh_token",
         "refresh_token": refresh_token,
@@ -112,10 +118,12 @@ def _auth_header(token: str) -> Dict[str, str]:
 def sget(path: str, token: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Safe GET with retries:
-    - 401: refresh and retry once if in route context
+    - 401: refresh and retry once if in route context, raise otherwise
     - 429: wait Retry-After once
     - 5xx: retry once after short sleep
     """
+    import requests
+
     url = path if path.startswith("http") else f"{SPOTIFY_API_BASE.rstrip('/')}/{path.lstrip('/')}"
     tried_refresh = False
     tried_5xx = False
@@ -137,7 +145,7 @@ def sget(path: str, token: str, params: Optional[Dict[str, Any]] = None) -> Dict
         if resp.status_code == 401 and not tried_refresh:
             # Attempt refresh via session if available
             tried_refresh = True
-            new = current_session_token()
+            new = current_session_token(refresh=True) if _in_request() else None
             if new:
                 token = new
                 continue
@@ -0,0 +1,229 @@
+"""
+Prebuilt statements for the hot paths:
+- built once per plays source with bindparam placeholders, values are
+  passed at execute time
+- reusing the same object keeps SQLAlchemy's memoized cache key, so a
+  repeat call skips both construction and compilation
+- shared by ingest, the staged merge, rollups, summary, most skipped and
+  the full re-rollup
+Source dependent builders take the selectable from plays_source(), which
+hands back the same object for the same storage layout.
+"""
+
+from __future__ import annotations
+import functools
+from typing import Any, Dict
+
+from sqlalchemy import and_, bindparam, case, desc, exists, func, select, update
+
+from ..models import user_info, artists, tracks, plays, daily_totals, ingest_staging
+from .upsert import dialect_insert
+
+def _user_window(p):
+    return and_(
+        p.c.user_id == bindparam("user_id"),
+        p.c.played_at >= bindparam("start"),
+        p.c.played_at < bindparam("end"),
+    )
+
+# per user window aggregates, params user_id, start, end
+
+@functools.lru_cache(maxsize=128)
+def window_totals(p):
+    # total ms, plays, distinct tracks and skips in one pass
+    return select(
+        func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"),
+        func.count().label("plays"),
+        func.count(func.distinct(p.c.track_id)).label("distinct_tracks"),
+        func.coalesce(func.sum(case((p.c.is_skip.is_(True), 1), else_=0)), 0).label("skips"),
+    ).select_from(p).where(_user_window(p))
+
+@functools.lru_cache(maxsize=128)
+def top_tracks(p):
+    # params plus limit, titles come from services/dimensions.py
+    return (
+        select(p.c.track_id, func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"))
+        .where(_user_window(p))
+        .group_by(p.c.track_id)
+        .order_by(desc("ms"))
+        .limit(bindparam("limit"))
+    )
+
+@functools.lru_cache(maxsize=128)
+def top_artists(p):
+    # params plus limit, the tracks join only maps tracks to artists
+    return (
+        select(tracks.c.artist_id, func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"))
+        .select_from(p.join(tracks, p.c.track_id == tracks.c.track_id))
+        .where(_user_window(p))
+        .group_by(tracks.c.artist_id)
+        .order_by(desc("ms"))
+        .limit(bindparam("limit"))
+    )
+
+@functools.lru_cache(maxsize=128)
+def track_counts(p):
+    # per track plays, ms and skips with the track's artist
+    return (
+        select(
+            p.c.track_id,
+            tracks.c.artist_id,
+            func.count().label("plays"),
+            func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"),
+            func.sum(case((p.c.is_skip.is_(True), 1), else_=0)).label("skips"),
+        )
+        .select_from(p.join(tracks, p.c.track_id == tracks.c.track_id))
+        .where(_user_window(p))
+        .group_by(p.c.track_id, tracks.c.artist_id)
+    )
+
+@functools.lru_cache(maxsize=128)
+def most_skipped(p):
+    # params plus limit
+    return (
+        select(
+            p.c.track_id,
+            func.count().label("plays"),
+            func.sum(case((p.c.is_skip.is_(True), 1), else_=0)).label("skips"),
+            func.coalesce(func.sum(p.c.elapsed_ms), 0).label("ms"),
+        )
+        .where(_user_window(p))
+        .group_by(p.c.track_id)
+        .order_by(desc("skips"), desc("plays"))
+        .limit(bindparam("limit"))
+    )
+
+# ingest, all against the hot plays table
+
+@functools.lru_cache(maxsize=None)
+def recent_cursor():
+    # params user_id
+    return select(user_info.c.last_recent_cursor).where(user_info.c.user_id == bindparam("user_id"))
+
+@functools.lru_cache(maxsize=None)
+def set_recent_cursor():
+    # params b_user_id, cursor
+    return (
+        update(user_info)
+        .where(user_info.c.user_id == bindparam("b_user_id"))
+        .values(last_recent_cursor=bindparam("cursor"))
+    )
+
+@functools.lru_cache(maxsize=None)
+def set_elapsed_at():
+    # executemany params b_user_id, b_played_at, b_elapsed_ms, b_is_skip
+    return (
+        update(plays)
+        .where(and_(plays.c.user_id == bindparam("b_user_id"), plays.c.played_at == bindparam("b_played_at")))
+        .values(elapsed_ms=bindparam("b_elapsed_ms"), is_skip=bindparam("b_is_skip"))
+    )
+
+@functools.lru_cache(maxsize=None)
+def set_elapsed_by_id():
+    # params b_id, b_elapsed_ms, b_is_skip
+    return (
+        update(plays)
+        .where(plays.c.id == bindparam("b_id"))
+        .values(elapsed_ms=bindparam("b_elapsed_ms"), is_skip=bindparam("b_is_skip"))
+    )
+
+@functools.lru_cache(maxsize=None)
+def play_before():
+    # newest play strictly before, params user_id, before
+    return (
+        select(plays.c.id, plays.c.played_at, plays.c.track_id, plays.c.elapsed_ms, tracks.c.duration_ms)
+        .select_from(plays.outerjoin(tracks, plays.c.track_id == tracks.c.track_id))
+        .where(and_(plays.c.user_id == bindparam("user_id"), plays.c.played_at < bindparam("before")))
+        .order_by(plays.c.played_at.desc())
+        .limit(1)
+    )
+
+@functools.lru_cache(maxsize=None)
+def play_sequence():
+    # keyset page of a user's plays with durations, params user_id, after, limit
+    return (
+        select(plays.c.played_at, plays.c.elapsed_ms, plays.c.is_skip, tracks.c.duration_ms)
+        .select_from(plays.outerjoin(tracks, plays.c.track_id == tracks.c.track_id))
+        .where(and_(plays.c.user_id == bindparam("user_id"), plays.c.played_at > bindparam("after")))
+        .order_by(plays.c.played_at)
+        .limit(bindparam("limit"))
+    )
+
+# staged merge, params top_id and the expanding user_ids
+
+def _staged():
+    st = ingest_staging
+    return and_(st.c.id <= bindparam("top_id"), st.c.user_id.in_(bindparam("user_ids", expanding=True)))
+
+@functools.lru_cache(maxsize=None)
+def staged_rows():
+    st = ingest_staging
+    return (
+        select(st.c.user_id, st.c.played_at, st.c.track_id, st.c.duration_ms,
+               st.c.track_title, st.c.album_name, st.c.artist_id, st.c.artist_name)
+        .where(_staged())
+        .order_by(st.c.user_id, st.c.played_at)
+    )
+
+@functools.lru_cache(maxsize=None)
+def staged_new_counts():
+    # per user staged plays, artists and tracks not stored yet
+    st = ingest_staging
+    return (
+        select(
+            st.c.user_id,
+            func.sum(case((~exists().where(and_(plays.c.user_id == st.c.user_id, plays.c.played_at == st.c.played_at)), 1), else_=0)).label("new_plays"),
+            func.count(func.distinct(case((~exists().where(artists.c.artist_id == st.c.artist_id), st.c.artist_id)))).label("new_artists"),
+            func.count(func.distinct(case((~exists().where(tracks.c.track_id == st.c.track_id), st.c.track_id)))).label("new_tracks"),
+        )
+        .where(_staged())
+        .group_by(st.c.user_id)
+    )
+
+_merges: Dict[tuple, Any] = {}
+
+def staged_merge(conn, target: str):
+    """
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING from ingest_staging into
+    artists, tracks or plays for the connection's dialect.
+    """
+    key = (conn.dialect.name, target)
+    stmt = _merges.get(key)
+    if stmt is None:
+        st = ingest_staging
+        if target == "artists":
+            cols = ["artist_id", "name"]
+            sel = (select(st.c.artist_id, func.max(st.c.artist_name))
+                   .where(and_(_staged(), st.c.artist_id.is_not(None))).group_by(st.c.artist_id))
+            keys = ["artist_id"]
+        elif target == "tracks":
+            cols = ["track_id", "artist_id", "title", "album_name", "duration_ms"]
+            sel = (select(st.c.track_id, func.max(st.c.artist_id), func.max(st.c.track_title),
+                          func.max(st.c.album_name), func.max(st.c.duration_ms))
+                   .where(_staged()).group_by(st.c.track_id))
+            keys = ["track_id"]
+        else:
+            cols = ["user_id", "track_id", "played_at"]
+            sel = select(st.c.user_id, st.c.track_id, st.c.played_at).where(_staged())
+            keys = ["user_id", "played_at"]
+        table = {"artists": artists, "tracks": tracks, "plays": plays}[target]
+        stmt = _merges[key] = dialect_insert(conn, table).from_select(cols, sel).on_conflict_do_nothing(index_elements=keys)
+    return stmt
+
+# writes
+
+_daily_upserts: Dict[str, Any] = {}
+
+def daily_upsert(conn):
+    """
+    Single row daily_totals upsert for the connection's dialect,
+    params are the row itself.
+    """
+    stmt = _daily_upserts.get(conn.dialect.name)
+    if stmt is None:
+        ins = dialect_insert(conn, daily_totals)
+        stmt = _daily_upserts[conn.dialect.name] = ins.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={c: ins.excluded[c] for c in ("minutes_listened", "top_track_id", "top_artist_id", "repeats", "skips")},
+        )
+    return stmt
@@ -0,0 +1,267 @@
+"""
+Local day rollups from a 15 minute base aggregate:
+- user_track_quarter holds plays, ms and skips per user, 15 minute UTC
+  bucket and track, refreshed per touched UTC day at ingest
+- every zone's midnight falls on a bucket boundary, so daily_totals for
+  any timezone is a re-bucketing of those rows, plays are never re-read
+- set_timezone() and the bulk job rebuild daily_totals that way, the
+  heatmap can bucket on the fly for a zone other than the stored one
+"""
+
+from __future__ import annotations
+import functools
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import and_, delete, select
+
+from ..models import get_engine, tracks, daily_totals, user_settings, user_track_quarter, as_utc, now_utc
+from .partitions import plays_source
+from .upsert import bulk_load, upsert
+
+BUCKET_SECONDS = 900
+DAY_SECONDS = 86_400
+DEFAULT_TZ = "UTC"
+
+@functools.lru_cache(maxsize=256)
+def zone(name: str) -> ZoneInfo:
+    """
+    ZoneInfo for an IANA name, ValueError when unknown.
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"unknown timezone {name!r}") from e
+
+def user_tz(conn, user_id: str) -> str:
+    tz = conn.execute(select(user_settings.c.timezone).where(user_settings.c.user_id == user_id)).scalar()
+    return tz or DEFAULT_TZ
+
+def bucket_of(dt: datetime) -> int:
+    return int(as_utc(dt).timestamp()) // BUCKET_SECONDS
+
+def local_day_bounds(day: date, tz: str) -> Tuple[datetime, datetime]:
+    """
+    UTC instants of local midnight starting day and the one after it.
+    """
+    z = zone(tz)
+    nxt = day + timedelta(days=1)
+    # DST days come out 23 or 25 hours long
+    start = datetime(day.year, day.month, day.day, tzinfo=z)
+    end = datetime(nxt.year, nxt.month, nxt.day, tzinfo=z)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+def local_days_touching(utc_days: Iterable[datetime], tz: str) -> Set[date]:
+    """
+    Local dates overlapping any of the given UTC days.
+    """
+    z = zone(tz)
+    out: Set[date] = set()
+    for d in utc_days:
+        start = as_utc(d)
+        out.add(start.astimezone(z).date())
+        out.add((start + timedelta(days=1) - timedelta(seconds=1)).astimezone(z).date())
+    return out
+
+def _day_start(d: date) -> datetime:
+    # daily_totals.day stores the local date as midnight UTC
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+def _quarter_rows(user_id: str, rows) -> List[Dict[str, Any]]:
+    acc: Dict[Tuple[int, str], List[int]] = {}
+    for played_at, track_id, elapsed_ms, is_skip in rows:
+        key = (bucket_of(played_at), track_id)
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = [0, 0, 0]
+        a[0] += 1
+        a[1] += elapsed_ms or 0
+        a[2] += 1 if is_skip else 0
+    return [
+        {"user_id": user_id, "bucket": b, "track_id": t, "plays": a[0], "ms": a[1], "skips": a[2]}
+        for (b, t), a in acc.items()
+    ]
+
+def refresh_base(conn, user_id: str, utc_days: Iterable[datetime]) -> int:
+    """
+    Recompute the user's quarter rows for whole UTC days from plays.
+    """
+    days = sorted({as_utc(x) for x in utc_days})
+    if not days:
+        return 0
+    # attach archives once up front, DETACH is refused after the first write
+    p = plays_source(conn, days[0], days[-1] + timedelta(days=1), user_id=user_id)
+    written = 0
+    for d in days:
+        start, end = d, d + timedelta(days=1)
+        rows = conn.execute(
+            select(p.c.played_at, p.c.track_id, p.c.elapsed_ms, p.c.is_skip)
+            .where(and_(p.c.user_id == user_id, p.c.played_at >= start, p.c.played_at < end))
+        ).fetchall()
+        conn.execute(delete(user_track_quarter).where(and_(
+            user_track_quarter.c.user_id == user_id,
+            user_track_quarter.c.bucket >= bucket_of(start),
+            user_track_quarter.c.bucket < bucket_of(end),
+        )))
+        written += bulk_load(conn, user_track_quarter, _quarter_rows(user_id, rows))
+    return written
+
+def _load_quarters(conn, user_id: str, lo: Optional[int] = None, hi: Optional[int] = None):
+    q = (
+        select(user_track_quarter.c.bucket, user_track_quarter.c.track_id, tracks.c.artist_id,
+               user_track_quarter.c.plays, user_track_quarter.c.ms, user_track_quarter.c.skips)
+        .select_from(user_track_quarter.join(tracks, user_track_quarter.c.track_id == tracks.c.track_id))
+        .where(user_track_quarter.c.user_id == user_id)
+    )
+    if lo is not None:
+        q = q.where(user_track_quarter.c.bucket >= lo)
+    if hi is not None:
+        q = q.where(user_track_quarter.c.bucket < hi)
+    return conn.execute(q).fetchall()
+
+def _local_day_numbers(secs, tz: str):
+    """
+    Local day number (days since 1970-01-01 local) for UTC unix seconds.
+    Offsets are looked up once per UTC day, and per hour only on days
+    where the offset changes.
+    """
+    import numpy as np
+
+    z = zone(tz)
+
+    def offset(t: int) -> int:
+        return int(datetime.fromtimestamp(t, z).utcoffset().total_seconds())
+
+    utc_day = secs // DAY_SECONDS
+    days, inv = np.unique(utc_day, return_inverse=True)
+    first = np.array([offset(int(d) * DAY_SECONDS) for d in days], dtype=np.int64)
+    last = np.array([offset(int(d) * DAY_SECONDS + DAY_SECONDS - 1) for d in days], dtype=np.int64)
+    off = first[inv]
+    for i in np.flatnonzero(first != last):
+        rows = np.flatnonzero(inv == i)
+        hours = secs[rows] // 3600
+        uh, hinv = np.unique(hours, return_inverse=True)
+        off[rows] = np.array([offset(int(h) * 3600) for h in uh], dtype=np.int64)[hinv]
+    return (secs + off) // DAY_SECONDS
+
+def aggregate_days(rows, tz: str) -> Dict[date, Dict[str, Any]]:
+    """
+    daily_totals fields per local date from quarter rows of
+    (bucket, track_id, artist_id, plays, ms, skips).
+    """
+    import numpy as np
+
+    if not rows:
+        return {}
+    secs = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)) * BUCKET_SECONDS
+    track_ids, t_idx = np.unique(np.array([r[1] for r in rows], dtype=object), return_inverse=True)
+    artist_ids, a_idx = np.unique(np.array([r[2] or "" for r in rows], dtype=object), return_inverse=True)
+    n_plays = np.fromiter((r[3] for r in rows), dtype=np.int64, count=len(rows))
+    ms = np.fromiter((r[4] for r in rows), dtype=np.int64, count=len(rows))
+    skips = np.fromiter((r[5] for r in rows), dtype=np.int64, count=len(rows))
+
+    days, d_idx = np.unique(_local_day_numbers(secs, tz), return_inverse=True)
+    n_days = len(days)
+    day_ms = np.bincount(d_idx, weights=ms, minlength=n_days)
+    day_plays = np.bincount(d_idx, weights=n_plays, minlength=n_days)
+    day_skips = np.bincount(d_idx, weights=skips, minlength=n_days)
+
+    def top(idx, n):
+        # per day argmax of summed ms, ties to the smallest id
+        keys, inv = np.unique(d_idx * n + idx, return_inverse=True)
+        totals = np.bincount(inv, weights=ms)
+        k_day = keys // n
+        order = np.lexsort((keys % n, -totals, k_day))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = k_day[order][1:] != k_day[order][:-1]
+        return (keys % n)[order][first], np.bincount(k_day, minlength=n_days)
+
+    top_track, distinct_tracks = top(t_idx, len(track_ids))
+    top_artist, _ = top(a_idx, len(artist_ids))
+
+    epoch = date(1970, 1, 1)
+    out = {}
+    for i, dn in enumerate(days):
+        out[epoch + timedelta(days=int(dn))] = {
+            "minutes_listened": int(day_ms[i]) // 60000,
+            "top_track_id": track_ids[top_track[i]],
+            "top_artist_id": artist_ids[top_artist[i]] or None,
+            "repeats": int(day_plays[i]) - int(distinct_tracks[i]),
+            "skips": int(day_skips[i]),
+        }
+    return out
+
+def local_daily(conn, user_id: str, tz: str, first: date, last: date) -> Dict[date, Dict[str, Any]]:
+    """
+    daily_totals fields for local dates first..last inclusive, bucketed
+    on the fly from the base.
+    """
+    lo = bucket_of(local_day_bounds(first, tz)[0])
+    hi = bucket_of(local_day_bounds(last, tz)[1])
+    out = aggregate_days(_load_quarters(conn, user_id, lo, hi), tz)
+    return {d: v for d, v in out.items() if first <= d <= last}
+
+def rollup_local_days(conn, user_id: str, tz: str, days: Iterable[date]) -> int:
+    """
+    Upsert daily_totals for the given local dates, empty days get zeros.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    got = local_daily(conn, user_id, tz, days[0], days[-1])
+    empty = {"minutes_listened": 0, "top_track_id": None, "top_artist_id": None, "repeats": 0, "skips": 0}
+    rows = [dict(got.get(d, empty), user_id=user_id, day=_day_start(d)) for d in days]
+    return upsert(conn, daily_totals, rows, keys=["user_id", "day"],
+                  update=["minutes_listened", "top_track_id", "top_artist_id", "repeats", "skips"])
+
+def rebucket(conn, user_id: str, tz: Optional[str] = None) -> int:
+    """
+    Replace all of the user's daily_totals with local days in tz
+    (default the stored one), from the base alone. The streak moves
+    to the same days.
+    """
+    from .sessions import save_streak_days
+
+    tz = tz or user_tz(conn, user_id)
+    got = aggregate_days(_load_quarters(conn, user_id), tz)
+    conn.execute(delete(daily_totals).where(daily_totals.c.user_id == user_id))
+    save_streak_days(conn, user_id, got)
+    return bulk_load(conn, daily_totals, [dict(v, user_id=user_id, day=_day_start(d)) for d, v in sorted(got.items())])
+
+def set_timezone(user_id: str, tz: str) -> int:
+    """
+    Store the user's timezone and re-bucket daily_totals into it.
+    """
+    zone(tz)
+    with get_engine().begin() as conn:
+        upsert(conn, user_settings, [{"user_id": user_id, "timezone": tz}], keys=["user_id"],
+               update=["timezone"], extra_set={"updated_at": now_utc()})
+        return rebucket(conn, user_id, tz)
+
+def rebuild_base(user_ids: Optional[List[str]] = None, batch: int = 10_000) -> Dict[str, int]:
+    """
+    Rebuild user_track_quarter from plays, including archived months.
+    One transaction, streamed user by user.
+    """
+    out = {"users": 0, "rows": 0}
+    with get_engine().begin() as conn:
+        p = plays_source(conn)
+        q = select(p.c.user_id, p.c.played_at, p.c.track_id, p.c.elapsed_ms, p.c.is_skip).order_by(p.c.user_id)
+        if user_ids:
+            q = q.where(p.c.user_id.in_(user_ids))
+            conn.execute(delete(user_track_quarter).where(user_track_quarter.c.user_id.in_(user_ids)))
+        else:
+            conn.execute(delete(user_track_quarter))
+        current, buf = None, []
+        for r in conn.execute(q.execution_options(yield_per=batch)):
+            if r.user_id != current:
+                if buf:
+                    out["rows"] += bulk_load(conn, user_track_quarter, _quarter_rows(current, buf))
+                    out["users"] += 1
+                current, buf = r.user_id, []
+            buf.append((r.played_at, r.track_id, r.elapsed_ms, r.is_skip))
+        if buf:
+            out["rows"] += bulk_load(conn, user_track_quarter, _quarter_rows(current, buf))
+            out["users"] += 1
+    return out
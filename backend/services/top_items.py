@@ -0,0 +1,257 @@
+"""
+Spotify top tracks and artists as rank snapshots:
+- the six lists (tracks and artists, short, medium and long term) are
+  fetched concurrently, each through spaginate; the threads run outside
+  the request context, so a rejected token is refreshed by the caller
+  once and the lists fetched again
+- a list whose sha1 over the ordered ids matches the latest stored
+  snapshot is skipped, nothing is written for it
+- changed lists are stored as copy/insert ops against the previous
+  snapshot, with a full keyframe every KEYFRAME_EVERY snapshots or when
+  the ops would not be smaller, so rebuilding any snapshot reads at most
+  KEYFRAME_EVERY rows
+- artists and tracks the name cache does not know are inserted in bulk
+  in the same transaction and primed into the cache after commit
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, select
+
+from ..models import get_engine, get_read_engine, artists, tracks, top_snapshots, as_utc, now_utc
+from .dimensions import dimensions
+from .spotify import spaginate
+from .upsert import insert_ignore
+
+KINDS = ("tracks", "artists")
+RANGES = ("short_term", "medium_term", "long_term")
+PAGE_LIMIT = 50
+KEYFRAME_EVERY = 8
+
+_same_list = and_(
+    top_snapshots.c.user_id == bindparam("user_id"),
+    top_snapshots.c.kind == bindparam("kind"),
+    top_snapshots.c.time_range == bindparam("time_range"),
+)
+# newest keyframe at or before :at, walks the unique index backwards
+_keyframe_at = (
+    select(top_snapshots.c.taken_at)
+    .where(and_(_same_list, top_snapshots.c.keyframe.is_(True), top_snapshots.c.taken_at <= bindparam("at")))
+    .order_by(top_snapshots.c.taken_at.desc())
+    .limit(1)
+    .scalar_subquery()
+)
+# that keyframe and the deltas after it up to :at, oldest first
+_chain = (
+    select(top_snapshots.c.taken_at, top_snapshots.c.keyframe, top_snapshots.c.hash, top_snapshots.c.data)
+    .where(and_(_same_list, top_snapshots.c.taken_at >= _keyframe_at, top_snapshots.c.taken_at <= bindparam("at")))
+    .order_by(top_snapshots.c.taken_at)
+)
+_first_taken = select(func.min(top_snapshots.c.taken_at)).where(_same_list)
+
+class Snapshot:
+    __slots__ = ("taken_at", "hash", "ids", "depth")
+
+    def __init__(self, taken_at: datetime, hash: str, ids: List[str], depth: int):
+        self.taken_at = taken_at
+        self.hash = hash
+        self.ids = ids
+        self.depth = depth  # deltas since the keyframe
+
+def list_hash(ids: List[str]) -> str:
+    return hashlib.sha1("\n".join(ids).encode()).hexdigest()
+
+def encode(prev: List[str], cur: List[str]) -> List[Any]:
+    """
+    Ops rebuilding cur from prev: [start, end] copies prev[start:end], a
+    list of ids inserts them.
+    """
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, prev, cur, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(cur[j1:j2])
+    return ops
+
+def decode(prev: List[str], ops: List[Any]) -> List[str]:
+    out: List[str] = []
+    for op in ops:
+        if isinstance(op[0], int):
+            out.extend(prev[op[0]:op[1]])
+        else:
+            out.extend(op)
+    return out
+
+def snapshot_at(conn, user_id: str, kind: str, time_range: str, at: Optional[datetime] = None) -> Optional[Snapshot]:
+    """
+    The list as stored at or before at (default the latest), rebuilt from
+    its keyframe. None when nothing was stored by then.
+    """
+    params = {"user_id": user_id, "kind": kind, "time_range": time_range, "at": at or now_utc()}
+    ids: List[str] = []
+    last = None
+    depth = 0
+    for r in conn.execute(_chain, params):
+        data = json.loads(r.data)
+        if r.keyframe:
+            ids, depth = data, 0
+        else:
+            ids, depth = decode(ids, data), depth + 1
+        last = r
+    if last is None:
+        return None
+    return Snapshot(as_utc(last.taken_at), last.hash, ids, depth)
+
+def first_taken(conn, user_id: str, kind: str, time_range: str) -> Optional[datetime]:
+    at = conn.execute(_first_taken, {"user_id": user_id, "kind": kind, "time_range": time_range}).scalar()
+    return as_utc(at) if at else None
+
+def fetch_top(access_token: str, kind: str, time_range: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    for page in spaginate(f"me/top/{kind}?time_range={time_range}&limit={PAGE_LIMIT}", access_token):
+        items.extend(it for it in page.get("items") or () if it and it.get("id"))
+    return items
+
+def _fan_out(access_token: str, lists: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    with ThreadPoolExecutor(max_workers=len(lists)) as ex:
+        got = ex.map(lambda kr: fetch_top(access_token, *kr), lists)
+        return dict(zip(lists, got))
+
+def fetch_all(access_token: str, refresh: Optional[Callable[[], Optional[str]]] = None
+              ) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """
+    All six lists, one thread per list since each is a round trip or two.
+    On a 401, refresh (when given) is called in this thread for a new
+    token and the lists are fetched once more with it.
+    """
+    import requests
+
+    lists = [(k, r) for k in KINDS for r in RANGES]
+    try:
+        return _fan_out(access_token, lists)
+    except requests.HTTPError as e:
+        if refresh is None or e.response is None or e.response.status_code != 401:
+            raise
+        token = refresh()
+        if not token:
+            raise
+    return _fan_out(token, lists)
+
+def _dimension_rows(fetched) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    artist_rows: Dict[str, Dict[str, Any]] = {}
+    track_rows: Dict[str, Dict[str, Any]] = {}
+    for (kind, _), items in fetched.items():
+        for it in items:
+            if kind == "artists":
+                genres = it.get("genres")
+                artist_rows[it["id"]] = {"artist_id": it["id"], "name": it.get("name") or "",
+                                         "genres": json.dumps(genres) if genres else None}
+                continue
+            primary = next((a for a in it.get("artists") or () if a.get("id")), None)
+            if primary is None:
+                continue
+            artist_rows.setdefault(primary["id"], {"artist_id": primary["id"], "name": primary.get("name") or "", "genres": None})
+            track_rows[it["id"]] = {
+                "track_id": it["id"],
+                "artist_id": primary["id"],
+                "title": it.get("name") or "",
+                "album_name": (it.get("album") or {}).get("name"),
+                "duration_ms": int(it.get("duration_ms") or 0),
+            }
+    return artist_rows, track_rows
+
+def store(user_id: str, fetched: Dict[Tuple[str, str], List[Dict[str, Any]]],
+          taken_at: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Write the lists that changed since the latest snapshot, plus any new
+    artists and tracks, in one transaction. taken_at defaults to now.
+    """
+    counts = {"lists": len(fetched), "changed": 0, "unchanged": 0, "keyframes": 0,
+              "new_artists": 0, "new_tracks": 0, "bytes": 0}
+    taken_at = taken_at or now_utc()
+    # the cache answers for known ids, only the rest go into the INSERT
+    dims = dimensions()
+    artist_rows, track_rows = _dimension_rows(fetched)
+    known_artists = dims.artists(artist_rows)
+    known_tracks = dims.tracks(track_rows)
+    new_artists = [r for a, r in artist_rows.items() if a not in known_artists]
+    new_tracks = [r for t, r in track_rows.items() if t not in known_tracks]
+    rows: List[Dict[str, Any]] = []
+    with get_engine().begin() as conn:
+        for (kind, time_range), items in fetched.items():
+            ids = [it["id"] for it in items]
+            h = list_hash(ids)
+            prev = snapshot_at(conn, user_id, kind, time_range, taken_at)
+            if prev is not None and prev.hash == h:
+                counts["unchanged"] += 1
+                continue
+            full = json.dumps(ids, separators=(",", ":"))
+            data, keyframe = full, True
+            if prev is not None and prev.depth + 1 < KEYFRAME_EVERY:
+                delta = json.dumps(encode(prev.ids, ids), separators=(",", ":"))
+                if len(delta) < len(full):
+                    data, keyframe = delta, False
+            rows.append({"user_id": user_id, "kind": kind, "time_range": time_range, "taken_at": taken_at,
+                         "hash": h, "keyframe": keyframe, "items": len(ids), "data": data})
+            counts["changed"] += 1
+            counts["keyframes"] += int(keyframe)
+            counts["bytes"] += len(data)
+        if not rows:
+            return counts
+
+        if new_artists:
+            counts["new_artists"] = insert_ignore(conn, artists, new_artists, ["artist_id"])
+        if new_tracks:
+            counts["new_tracks"] = insert_ignore(conn, tracks, new_tracks, ["track_id"])
+        conn.execute(top_snapshots.insert(), rows)
+
+    dims.put_artists((a["artist_id"], a["name"]) for a in new_artists)
+    dims.put_tracks((t["track_id"], t["title"], t["album_name"], t["artist_id"]) for t in new_tracks)
+    return counts
+
+def sync_top(user_id: str, access_token: str, refresh: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, int]:
+    """
+    Fetch and store the user's top lists, used by the route and cron.
+    """
+    return store(user_id, fetch_all(access_token, refresh))
+
+def movement(user_id: str, kind: str, time_range: str, since: Optional[datetime],
+             points: int = 1) -> Optional[Dict[str, Any]]:
+    """
+    The current list against the list as it was at since (default the
+    first snapshot) and, with points > 1, at evenly spaced instants in
+    between. Each lookup rebuilds one snapshot from its keyframe.
+    None when the list was never synced.
+    """
+    with get_read_engine().connect() as conn:
+        cur = snapshot_at(conn, user_id, kind, time_range)
+        if cur is None:
+            return None
+        first = first_taken(conn, user_id, kind, time_range)
+        start = min(max(since, first) if since else first, cur.taken_at)
+        step = (cur.taken_at - start) / points
+        past = [snapshot_at(conn, user_id, kind, time_range, start + step * i) for i in range(points)]
+
+    ranks = [{t: i + 1 for i, t in enumerate(s.ids)} for s in past]
+    base = ranks[0]
+    now_ids = set(cur.ids)
+    items = []
+    for i, t in enumerate(cur.ids):
+        prev = base.get(t)
+        items.append({"id": t, "rank": i + 1, "previous_rank": prev,
+                      "change": prev - (i + 1) if prev is not None else None,
+                      "history": [r.get(t) for r in ranks]})
+    return {
+        "as_of": cur.taken_at,
+        "compared_to": past[0].taken_at,
+        "points": [s.taken_at for s in past],
+        "items": items,
+        "dropped": [{"id": t, "previous_rank": base[t]} for t in past[0].ids if t not in now_ids],
+    }
@@ -0,0 +1,135 @@
+"""
+Dialect aware writes shared by ingest, rollups and the app:
+- insert for the connection's dialect, SQLite or PostgreSQL ON CONFLICT
+- multi row VALUES chunked under the bind parameter limit
+- executemany for large appends, one compiled statement for every row
+- COPY for bulk loads on PostgreSQL, executemany elsewhere
+"""
+
+from __future__ import annotations
+import csv
+import io
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+
+# SQLite before 3.32 caps a statement at 999 bind parameters
+SQLITE_MAX_VARS = 32_766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+PG_MAX_VARS = 65_535
+
+def dialect_insert(conn: Connection, table: Table):
+    """
+    Insert construct with on_conflict_* support for the bound dialect.
+    """
+    # dialect modules import on first use, SQLite only setups never load postgresql
+    name = conn.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(table)
+    if name == "sqlite":
+        from sqlalchemy.dialects import sqlite
+        return sqlite.insert(table)
+    raise NotImplementedError(f"no upsert support for dialect {name}")
+
+def _chunks(conn: Connection, rows: List[Dict[str, Any]]) -> Iterable[List[Dict[str, Any]]]:
+    if not rows:
+        return
+    limit = PG_MAX_VARS if conn.dialect.name == "postgresql" else SQLITE_MAX_VARS
+    size = max(1, limit // max(len(rows[0]), 1))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def insert_ignore(conn: Connection, table: Table, rows: List[Dict[str, Any]], keys: Sequence[str]) -> int:
+    """
+    Multi row INSERT ... ON CONFLICT DO NOTHING. Returns rows inserted.
+    All rows must share the same keys.
+    """
+    inserted = 0
+    for chunk in _chunks(conn, rows):
+        stmt = dialect_insert(conn, table).values(chunk).on_conflict_do_nothing(index_elements=list(keys))
+        inserted += conn.execute(stmt).rowcount or 0
+    return inserted
+
+def insert_ignore_many(conn: Connection, table: Table, rows: List[Dict[str, Any]], keys: Sequence[str]) -> int:
+    """
+    insert_ignore through executemany. The statement compiles once and
+    stays cached, where a multi row VALUES compiles per chunk, so this is
+    the cheaper path for thousands of rows. Returns rows inserted as the
+    driver reports them.
+    """
+    if not rows:
+        return 0
+    stmt = dialect_insert(conn, table).on_conflict_do_nothing(index_elements=list(keys))
+    return max(conn.execute(stmt, rows).rowcount or 0, 0)
+
+def upsert(
+    conn: Connection,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    keys: Sequence[str],
+    update: Sequence[str],
+    extra_set: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Multi row INSERT ... ON CONFLICT DO UPDATE setting update columns
+    from the incoming row, plus any fixed extra_set values.
+    """
+    written = 0
+    for chunk in _chunks(conn, rows):
+        stmt = dialect_insert(conn, table).values(chunk)
+        set_ = {c: stmt.excluded[c] for c in update}
+        set_.update(extra_set or {})
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=set_)
+        written += conn.execute(stmt).rowcount or 0
+    return written
+
+def increment(conn: Connection, table: Table, rows: List[Dict[str, Any]], keys: Sequence[str], counters: Sequence[str]) -> int:
+    """
+    Upsert that adds the incoming counter values onto an existing row.
+    """
+    written = 0
+    for chunk in _chunks(conn, rows):
+        stmt = dialect_insert(conn, table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={c: table.c[c] + stmt.excluded[c] for c in counters},
+        )
+        written += conn.execute(stmt).rowcount or 0
+    return written
+
+def bulk_load(conn: Connection, table: Table, rows: List[Dict[str, Any]]) -> int:
+    """
+    Append rows with no conflict handling. Uses COPY on PostgreSQL.
+    """
+    if not rows:
+        return 0
+    if conn.dialect.name == "postgresql":
+        return _pg_copy(conn, table, rows)
+    conn.execute(table.insert(), rows)
+    return len(rows)
+
+def _pg_copy(conn: Connection, table: Table, rows: List[Dict[str, Any]]) -> int:
+    cols = list(rows[0].keys())
+    prep = conn.dialect.identifier_preparer
+    sql = f"COPY {prep.format_table(table)} ({', '.join(prep.quote(c) for c in cols)}) FROM STDIN"
+    raw = conn.connection.dbapi_connection
+    cur = raw.cursor()
+    try:
+        if hasattr(cur, "copy"):
+            # psycopg 3
+            with cur.copy(sql) as cp:
+                for r in rows:
+                    cp.write_row(tuple(r[c] for c in cols))
+        else:
+            # psycopg2
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            for r in rows:
+                w.writerow([r[c].isoformat() if hasattr(r[c], "isoformat") else r[c] for c in cols])
+            buf.seek(0)
+            cur.copy_expert(sql + " WITH (FORMAT csv)", buf)
+    finally:
+        cur.close()
+    return len(rows)
@@ -0,0 +1,241 @@
+"""
+Year in review per user and local calendar year:
+- built from one grouped pass over the year's plays (per track plays, ms
+  and skips, with the track's artist) and one ordered scan of its
+  daily_totals rows; artists, albums and the most skipped track fold out
+  of the per track rows, months, the longest streak and the busiest day
+  out of the daily rows
+- stored in year_reports with a data version: the report logic version,
+  the user's timezone, the sync cursor capped at the year's end and a
+  count and sums over the year's daily_totals days with plays, so a
+  past year stays cached until a re-rollup or timezone change rewrites
+  its days
+- generate() serves the stored copy while the version matches and
+  rebuilds otherwise, jobs/year_review.py builds them in bulk
+"""
+
+from __future__ import annotations
+import contextlib
+import heapq
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, asc, func, select
+
+from ..models import get_engine, get_read_engine, daily_totals, year_reports, as_utc
+from . import statements, timezones
+from .dimensions import dimensions
+from .partitions import plays_source
+from .upsert import upsert
+
+REPORT_VERSION = 2  # bump when the report's contents change
+TOP_N = 10
+
+def year_bounds(year: int, tz: str) -> Tuple[datetime, datetime]:
+    """
+    UTC instants of local midnight on 1 January of year and of the next.
+    """
+    return timezones.local_day_bounds(date(year, 1, 1), tz)[0], timezones.local_day_bounds(date(year + 1, 1, 1), tz)[0]
+
+def _day_range(year: int) -> Tuple[datetime, datetime]:
+    # daily_totals.day holds the local date as midnight UTC
+    return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+def _days_in_year(user_id: str, year: int):
+    lo, hi = _day_range(year)
+    # rollups write zero rows for touched local days without plays, those
+    # have no top track; minutes alone would drop days under a minute
+    return and_(daily_totals.c.user_id == user_id, daily_totals.c.day >= lo, daily_totals.c.day < hi,
+                daily_totals.c.top_track_id.is_not(None))
+
+def data_version(conn, user_id: str, year: int, tz: str) -> str:
+    _start, end = year_bounds(year, tz)
+    cursor = conn.execute(statements.recent_cursor(), {"user_id": user_id}).scalar()
+    as_of = min(as_utc(cursor), end) if cursor is not None else None
+    days, minutes, skips = conn.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(daily_totals.c.minutes_listened), 0),
+            func.coalesce(func.sum(daily_totals.c.skips), 0),
+        ).where(_days_in_year(user_id, year))
+    ).one()
+    stamp = int(as_of.timestamp()) if as_of else 0
+    return f"{REPORT_VERSION}:{tz}:{stamp}:{days}:{minutes}:{skips}"
+
+def _top(acc: Dict[Any, List[int]], n: int) -> List[Tuple[Any, int, int]]:
+    # (key, ms, plays), most minutes first, then plays
+    ranked = heapq.nsmallest(n, acc.items(), key=lambda kv: (-kv[1][0], -kv[1][1], str(kv[0])))
+    return [(k, v[0], v[1]) for k, v in ranked]
+
+def _fold_tracks(rows) -> Dict[str, Any]:
+    by_track: Dict[str, List[int]] = {}
+    by_artist: Dict[str, List[int]] = {}
+    skipped: Optional[Tuple[int, int, str]] = None
+    plays_total = skips_total = ms_total = 0
+    for track_id, artist_id, n, ms, skips in rows:
+        n, ms, skips = int(n), int(ms or 0), int(skips or 0)
+        by_track[track_id] = [ms, n]
+        a = by_artist.get(artist_id)
+        if a is None:
+            a = by_artist[artist_id] = [0, 0]
+        a[0] += ms
+        a[1] += n
+        plays_total += n
+        skips_total += skips
+        ms_total += ms
+        # most skips, then most plays, as /api/most-skipped orders them
+        if skips and (skipped is None or (skips, n) > skipped[:2]):
+            skipped = (skips, n, track_id)
+
+    info = dimensions().tracks(by_track)
+    by_album: Dict[Tuple[str, str], List[int]] = {}
+    for track_id, (ms, n) in by_track.items():
+        title, album, artist_id = info.get(track_id, (None, None, None))
+        if album is None:
+            continue
+        a = by_album.get((album, artist_id))
+        if a is None:
+            a = by_album[(album, artist_id)] = [0, 0]
+        a[0] += ms
+        a[1] += n
+
+    return {
+        "plays": plays_total,
+        "skips": skips_total,
+        "ms": ms_total,
+        "distinct_tracks": len(by_track),
+        "distinct_artists": len(by_artist),
+        "top_tracks": _top(by_track, TOP_N),
+        "top_artists": _top(by_artist, TOP_N),
+        "top_albums": _top(by_album, TOP_N),
+        "most_skipped": skipped,
+    }
+
+def _fold_days(rows, year: int) -> Dict[str, Any]:
+    months = [[0, 0] for _ in range(12)]
+    busiest = None
+    best: Tuple[int, Optional[date], Optional[date]] = (0, None, None)
+    run_start = prev = None
+    for day, minutes, top_track_id, top_artist_id in rows:
+        d = as_utc(day).date()
+        minutes = int(minutes or 0)
+        m = months[d.month - 1]
+        m[0] += minutes
+        m[1] += 1
+        if busiest is None or minutes > busiest[1]:
+            busiest = (d, minutes, top_track_id, top_artist_id)
+        # only days with plays come in, a streak is a run of consecutive ones
+        if prev is None or d != prev + timedelta(days=1):
+            run_start = d
+        prev = d
+        length = (d - run_start).days + 1
+        if length > best[0]:
+            best = (length, run_start, d)
+    return {
+        "months": [
+            {"month": f"{year}-{i + 1:02d}", "minutes": m[0], "days": m[1]} for i, m in enumerate(months)
+        ],
+        "days_listened": sum(m[1] for m in months),
+        "streak": best,
+        "busiest": busiest,
+    }
+
+def build(conn, user_id: str, year: int, tz: Optional[str] = None) -> Dict[str, Any]:
+    """
+    The report for one user and year from the plays and daily_totals
+    visible on conn, labels included.
+    """
+    tz = tz or timezones.user_tz(conn, user_id)
+    start, end = year_bounds(year, tz)
+    p = plays_source(conn, start, end, user_id=user_id)
+    t = _fold_tracks(conn.execute(statements.track_counts(p), {"user_id": user_id, "start": start, "end": end}).all())
+    q = (
+        select(daily_totals.c.day, daily_totals.c.minutes_listened, daily_totals.c.top_track_id, daily_totals.c.top_artist_id)
+        .where(_days_in_year(user_id, year))
+        .order_by(asc(daily_totals.c.day))
+    )
+    d = _fold_days(conn.execute(q), year)
+
+    busiest, skipped = d["busiest"], t["most_skipped"]
+    track_ids = [k for k, _, _ in t["top_tracks"]]
+    track_ids += [busiest[2]] if busiest and busiest[2] else []
+    track_ids += [skipped[2]] if skipped else []
+    labels = dimensions().track_labels(track_ids)
+    names = dimensions().artists(
+        [k for k, _, _ in t["top_artists"]] + [a for (_album, a), _, _ in t["top_albums"]]
+        + ([busiest[3]] if busiest and busiest[3] else [])
+    )
+    label = lambda track_id, i: labels.get(track_id, (None, None, None))[i]
+
+    length, first, last = d["streak"]
+    return {
+        "year": year,
+        "timezone": tz,
+        "totals": {
+            "minutes_listened": int(t["ms"] // 60000),
+            "plays": t["plays"],
+            "skips": t["skips"],
+            "distinct_tracks": t["distinct_tracks"],
+            "distinct_artists": t["distinct_artists"],
+            "days_listened": d["days_listened"],
+        },
+        "top_tracks": [
+            {"track_id": k, "title": label(k, 0), "artist": label(k, 2), "plays": n, "minutes": int(ms // 60000)}
+            for k, ms, n in t["top_tracks"]
+        ],
+        "top_artists": [
+            {"artist_id": k, "name": names.get(k), "plays": n, "minutes": int(ms // 60000)}
+            for k, ms, n in t["top_artists"]
+        ],
+        "top_albums": [
+            {"album": album, "artist_id": a, "artist": names.get(a), "plays": n, "minutes": int(ms // 60000)}
+            for (album, a), ms, n in t["top_albums"]
+        ],
+        "months": d["months"],
+        "longest_streak": {"start": first.isoformat(), "end": last.isoformat(), "days": length} if length else None,
+        "most_skipped": {
+            "track_id": skipped[2], "title": label(skipped[2], 0), "artist": label(skipped[2], 2),
+            "skips": skipped[0], "plays": skipped[1], "skip_rate": round(skipped[0] / skipped[1], 3),
+        } if skipped else None,
+        "busiest_day": {
+            "day": busiest[0].isoformat(), "minutes": busiest[1],
+            "top_track_id": busiest[2], "top_track_title": label(busiest[2], 0),
+            "top_artist_id": busiest[3], "top_artist_name": names.get(busiest[3]),
+        } if busiest else None,
+    }
+
+def stored(conn, user_id: str, year: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    row = conn.execute(
+        select(year_reports.c.version, year_reports.c.data)
+        .where(and_(year_reports.c.user_id == user_id, year_reports.c.year == year))
+    ).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+def generate(user_id: str, year: int, force: bool = False, write_lock=None) -> Dict[str, Any]:
+    """
+    The user's report, rebuilt and stored unless the stored one has the
+    current data version. Returns the report under "report" with
+    "built" and "seconds".
+    """
+    t0 = time.perf_counter()
+    with get_read_engine().connect() as conn:
+        tz = timezones.user_tz(conn, user_id)
+        version = data_version(conn, user_id, year, tz)
+        hit = None if force else stored(conn, user_id, year)
+        if hit is not None and hit[0] == version:
+            return {"report": hit[1], "version": version, "built": False, "seconds": time.perf_counter() - t0}
+        report = build(conn, user_id, year, tz)
+    seconds = time.perf_counter() - t0
+
+    with write_lock or contextlib.nullcontext(), get_engine().begin() as conn:
+        upsert(conn, year_reports, [{
+            "user_id": user_id,
+            "year": year,
+            "version": version,
+            "data": json.dumps(report, separators=(",", ":")),
+            "build_ms": round(seconds * 1000.0, 3),
+        }], keys=["user_id", "year"], update=["version", "data", "build_ms"],
+            extra_set={"built_at": datetime.now(timezone.utc)})
+    return {"report": report, "version": version, "built": True, "seconds": seconds}
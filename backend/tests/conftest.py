@@ -0,0 +1,57 @@
+from __future__ import annotations
+import os
+
+import pytest
+
+from ..bench.synth import SynthConfig, Catalog, populate, user_ids
+from ..models import get_engine, reset_engine, metadata
+
+@pytest.fixture(scope="session")
+def synth(tmp_path_factory):
+    """
+    One synthetic database for the session: two users, a year and a half
+    of plays, global tables and the first user's month sketches.
+    """
+    from ..services import sketches
+    from ..services.aggregates import rebuild_global
+
+    cfg = SynthConfig(users=2, years=1.5)
+    catalog = Catalog(cfg)
+    reset_engine(f"sqlite:///{os.path.join(tmp_path_factory.mktemp('db'), 'test.db')}")
+    metadata.drop_all(get_engine())
+    cursors = populate(get_engine(), cfg, catalog)["cursors"]
+    rebuild_global()
+    uid = user_ids(cfg)[0]
+    with get_engine().begin() as conn:
+        sketches.rebuild(conn, uid)
+    yield {"cfg": cfg, "catalog": catalog, "cursors": cursors, "uid": uid}
+    reset_engine()
+
+@pytest.fixture(scope="session")
+def pg_url():
+    """
+    TEST_POSTGRES_URL (every app table in it is dropped), else a throwaway
+    cluster when the server binaries are on PATH or PG_BIN, else skip.
+    """
+    url = os.getenv("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    pytest.importorskip("psycopg")
+    from ..bench.throwaway_pg import _bin, throwaway_pg
+
+    try:
+        _bin("initdb")
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    with throwaway_pg() as url:
+        yield url
+
+@pytest.fixture()
+def client(synth):
+    from ..app import create_app
+
+    c = create_app().test_client()
+    with c.session_transaction() as s:
+        s["user_id"] = synth["uid"]
+    return c
@@ -0,0 +1,50 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _loaded(code: str, names) -> list:
+    # which of names a fresh interpreter has imported after running code
+    probe = f"import sys; {code}; print(' '.join(n for n in {list(names)!r} if n in sys.modules))"
+    return subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, cwd=ROOT, check=True).stdout.split()
+
+def test_app_import_is_light():
+    assert _loaded("import backend.app", ["sqlalchemy", "requests", "numpy", "backend.routes.summary"]) == []
+
+def test_create_app_registers_blueprints_without_requests():
+    code = "import backend.app; app = backend.app.create_app(); assert len(app.blueprints) == len(backend.app.BLUEPRINTS)"
+    assert _loaded(code, ["requests", "numpy"]) == []
+
+def test_handlers_import_on_call(client):
+    # the session has a user but no Spotify token
+    assert client.post("/sync-recent").get_json() == {"error": "no_valid_token"}
+    assert client.post("/sync-top").get_json() == {"error": "no_valid_token"}
+
+def test_bench_covers_every_api_route(synth):
+    from urllib.parse import urlsplit
+    from ..app import create_app
+    from ..bench.run import api_routes
+
+    app = create_app()
+    urls = app.url_map.bind("localhost")
+    every = {r.endpoint for r in app.url_map.iter_rules() if r.rule.startswith("/api/") and "GET" in r.methods}
+    covered = {urls.match(urlsplit(p).path)[0] for p in api_routes(synth["cfg"]).values()}
+    # the event stream never ends, bench/sse_load.py drives it
+    assert every - covered == {"live.live_stream"}
+
+def test_live_refuses_sync_workers(synth):
+    from ..app import create_app
+    from ..bench.synth import user_ids
+    from ..serve import options
+
+    assert options("127.0.0.1:0", 1, 32)["worker_class"] == "gthread"
+    app = create_app()
+    app.config["LIVE_STREAMS"] = options("127.0.0.1:0", 1, 1)["worker_class"] != "sync"
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_ids(synth["cfg"])[0]
+    resp = client.get("/api/live")
+    assert resp.status_code == 503
+    assert resp.get_json() == {"error": "live_needs_threads"}
@@ -0,0 +1,30 @@
+from __future__ import annotations
+import os
+
+from sqlalchemy import text
+
+from ..models import get_engine, get_read_engine
+
+def test_fork_keeps_parent_connections(synth):
+    # a prefork worker builds its own engines, the master's pooled connections keep working
+    engines = (get_engine(), get_read_engine())
+    conns = [e.connect() for e in engines]
+    try:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                fresh = (get_engine(), get_read_engine())
+                with fresh[0].connect() as c:
+                    c.execute(text("select 1")).scalar()
+                code = 0 if all(f is not e for f, e in zip(fresh, engines)) else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        for c in conns:
+            assert c.execute(text("select count(*) from plays")).scalar() > 0
+        assert get_engine() is engines[0]
+    finally:
+        for c in conns:
+            c.close()
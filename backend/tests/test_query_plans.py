@@ -0,0 +1,51 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+
+from ..bench.query_plans import classify
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# plays keyed on (played_at, user_id) with no user_id led index, every per user read scans
+UNINDEXED = """
+from sqlalchemy import UniqueConstraint
+import backend.models as m
+for i in list(m.plays.indexes):
+    m.plays.indexes.discard(i)
+m.plays.constraints.discard(next(c for c in m.plays.constraints if c.name == 'uq_user_played_at'))
+m.plays.append_constraint(UniqueConstraint('played_at', 'user_id', name='uq_played_at_user'))
+"""
+
+def _guard(tmp_path, setup: str = ""):
+    # a fresh interpreter, the guard swaps the process wide engine for its own database
+    out = str(tmp_path / "plans.json")
+    args = ["--users", "1", "--years", "0.5", "--out", out]
+    code = f"{setup}\nfrom backend.bench.query_plans import main\nmain({args!r})"
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, timeout=300)
+    with open(out) as f:
+        return proc, json.load(f)
+
+def _failed_scans(result, table: str):
+    return [line for e in result["statements"] for line in e["fail"] if line.split()[:2] == ["SCAN", table]]
+
+def test_classify():
+    sql = "SELECT plays.played_at FROM plays WHERE plays.user_id = ? ORDER BY plays.played_at"
+    assert classify(sql, ["SCAN plays"])["fail"] == ["SCAN plays"]
+    assert classify(sql, ["SEARCH plays USING INDEX ix_user_played_at (user_id=?)"])["fail"] == []
+    assert classify(sql, ["SEARCH plays USING INDEX ix_user_track (user_id=?)", "USE TEMP B-TREE FOR ORDER BY"])["fail"]
+    assert classify(sql, ["SCAN user_artist_totals"])["allowed"]
+    grouped = "SELECT track_id, count(*) FROM plays WHERE user_id = ? GROUP BY track_id"
+    assert classify(grouped, ["SEARCH plays USING INDEX ix_user_played_at (user_id=?)", "USE TEMP B-TREE FOR GROUP BY"])["temp"]
+
+def test_hot_paths_use_indexes(tmp_path):
+    proc, result = _guard(tmp_path)
+    assert proc.returncode == 0, proc.stdout[-4000:] + proc.stderr[-2000:]
+    assert result["failures"] == 0 and not result["errors"]
+    assert not _failed_scans(result, "plays")
+
+def test_missing_index_fails(tmp_path):
+    proc, result = _guard(tmp_path, UNINDEXED)
+    assert proc.returncode == 1, proc.stdout[-2000:] + proc.stderr[-2000:]
+    assert _failed_scans(result, "plays")
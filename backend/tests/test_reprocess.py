@@ -0,0 +1,23 @@
+from __future__ import annotations
+import threading
+
+from sqlalchemy import select
+
+from ..bench.synth import user_ids
+from ..models import get_engine, user_track_daily, user_track_quarter
+from ..services.reprocess import rebuild_rollups
+
+def _rows(conn, table, uid):
+    return sorted(tuple(r) for r in conn.execute(select(table).where(table.c.user_id == uid)))
+
+def test_rebuild_rollups_month_by_month(synth):
+    # the second user, the first one's rows back the window tests
+    uid = user_ids(synth["cfg"])[1]
+    with get_engine().connect() as conn:
+        before = {t.name: _rows(conn, t, uid) for t in (user_track_quarter, user_track_daily)}
+    out = rebuild_rollups(uid, threading.Lock())
+    with get_engine().connect() as conn:
+        after = {t.name: _rows(conn, t, uid) for t in (user_track_quarter, user_track_daily)}
+    assert out["quarters"] == len(before["user_track_quarter"]) > 0
+    assert out["track_days"] == len(before["user_track_daily"]) > 0
+    assert after == before
@@ -0,0 +1,59 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+
+from ..bench.fake_spotify import FakeSpotify
+from ..bench.synth import Listener, to_recent_item, user_ids
+from ..services import similarity
+
+def test_similarity_updates_after_the_response(synth, tmp_path, monkeypatch):
+    from ..app import create_app
+
+    monkeypatch.setattr(similarity, "SIMILARITY_DIR", str(tmp_path))
+    uid = user_ids(synth["cfg"])[1]
+    similarity.build(uid)
+    before = similarity.load(uid).version
+
+    client = create_app().test_client()
+    with FakeSpotify() as fake:
+        fake.use()
+        stream = Listener(synth["cfg"], synth["catalog"], uid, synth["cursors"][uid] + timedelta(minutes=5))
+        fake.push(uid, [to_recent_item(synth["catalog"], next(stream)) for _ in range(fake.window)])
+        with client.session_transaction() as s:
+            s["user_id"] = uid
+            s["access_token"] = uid
+            s["expires_at"] = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+        resp = client.post("/sync-recent", buffered=False)
+        assert resp.status_code == 200
+        assert resp.get_json()["counts"]["new_plays"] == fake.window
+        # the index is folded once the server closes the response
+        assert similarity.load(uid).version == before
+        resp.close()
+    assert similarity.load(uid).version != before
+
+def test_sync_top_refreshes_a_rejected_token(synth):
+    from ..app import create_app
+
+    uid = user_ids(synth["cfg"])[1]
+    client = create_app().test_client()
+    with FakeSpotify() as fake:
+        fake.use()
+        # unexpired in the session but rejected by Spotify, the fetch threads see the 401
+        fake.revoked.add("stale")
+        with client.session_transaction() as s:
+            s["user_id"] = uid
+            s["access_token"] = "stale"
+            s["expires_at"] = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+        resp = client.post("/sync-top")
+        assert resp.status_code == 200, resp.get_data(as_text=True)
+        assert resp.get_json()["counts"]["lists"] == 6
+        assert fake.token_requests == 1
+        with client.session_transaction() as s:
+            assert s["access_token"] == uid
+
+        # a refresh Spotify rejects too ends in no_valid_token, not a 500
+        fake.revoked.add(uid)
+        with client.session_transaction() as s:
+            s["access_token"] = "stale"
+        resp = client.post("/sync-top")
+        assert resp.status_code == 401
+        assert resp.get_json() == {"error": "no_valid_token"}
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+
+from ..routes.params import parse_window
+
+@pytest.mark.parametrize("raw,days", [("30d", 30), ("7", 7), (" ALL ", None), ("0d", 1), ("junk", 30)])
+def test_parse_window(raw, days):
+    assert parse_window(raw) == days
+
+@pytest.mark.parametrize("path", [
+    "/api/global/top-tracks?window=all",
+    "/api/global/top-artists?window=all",
+    "/api/most-skipped?window=all&approx=1",
+    "/api/summary/last30?window=all&approx=1",
+    "/api/top/tracks/movement?range=short_term&window=all",
+])
+def test_window_all(client, path):
+    resp = client.get(path)
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+
+def test_global_top_all_covers_every_day(client):
+    month = client.get("/api/global/top-tracks?window=30d&limit=100").get_json()
+    every = client.get("/api/global/top-tracks?window=all&limit=100").get_json()
+    assert every["window_days"] is None
+    assert every["items"]
+    assert sum(i["plays"] for i in every["items"]) > sum(i["plays"] for i in month["items"])
+
+@pytest.mark.parametrize("path", ["/api/summary/last30?window=all", "/api/most-skipped?window=all"])
+def test_exact_all_needs_approx(client, path):
+    resp = client.get(path)
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "window_all_needs_approx"}
+
+def test_summary_all_approx_totals_match_exact(client):
+    # a window longer than the history is exact over every play
+    exact = client.get("/api/summary/last30?window=100000d").get_json()
+    approx = client.get("/api/summary/last30?window=all&approx=1").get_json()
+    assert approx["totals"]["plays"] == exact["totals"]["plays"]
+    assert approx["totals"]["minutes_listened"] == exact["totals"]["minutes_listened"]
+    assert approx["totals"]["skips"] == exact["totals"]["skips"]
+    assert approx["top_tracks"][0]["track_id"] == exact["top_tracks"][0]["track_id"]
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from ..bench.synth import user_ids
+from ..models import get_engine, daily_totals, as_utc
+from ..services import timezones, year_review
+from ..services.partitions import plays_source
+
+TZ = "America/New_York"
+
+def test_non_utc_year_skips_empty_days(synth):
+    # the second user, the first one's days back the window tests
+    uid = user_ids(synth["cfg"])[1]
+    year = synth["cfg"].end_dt().year - 1
+    timezones.set_timezone(uid, TZ)
+    with get_engine().begin() as conn:
+        # a rollup over the whole year writes zero rows for local days without plays
+        first = date(year, 1, 1)
+        timezones.rollup_local_days(conn, uid, TZ, [first + timedelta(days=i) for i in range(366)])
+        empty = conn.execute(
+            select(func.count()).select_from(daily_totals)
+            .where(daily_totals.c.user_id == uid, daily_totals.c.top_track_id.is_(None))
+        ).scalar()
+        start, end = year_review.year_bounds(year, TZ)
+        p = plays_source(conn, start, end, user_id=uid)
+        played = conn.execute(
+            select(p.c.played_at).where(p.c.user_id == uid, p.c.played_at >= start, p.c.played_at < end)
+        ).scalars().all()
+    assert empty > 0
+
+    zone = timezones.zone(TZ)
+    days = sorted({as_utc(t).astimezone(zone).date() for t in played})
+    longest = run = 1
+    for a, b in zip(days, days[1:]):
+        run = run + 1 if b == a + timedelta(days=1) else 1
+        longest = max(longest, run)
+
+    report = year_review.generate(uid, year, force=True)["report"]
+    assert report["timezone"] == TZ
+    assert report["totals"]["days_listened"] == len(days)
+    assert sum(m["days"] for m in report["months"]) == len(days)
+    for m in report["months"]:
+        month = int(m["month"][5:])
+        assert m["days"] == sum(1 for d in days if d.month == month)
+    assert report["longest_streak"]["days"] == longest
+
+def test_streaks_count_local_days(synth):
+    from ..app import create_app
+    from ..services.sessions import recompute_streak
+
+    uid = user_ids(synth["cfg"])[1]
+    timezones.set_timezone(uid, TZ)
+    with get_engine().connect() as conn:
+        p = plays_source(conn, user_id=uid)
+        played = conn.execute(select(p.c.played_at).where(p.c.user_id == uid)).scalars().all()
+
+    zone = timezones.zone(TZ)
+    days = sorted({as_utc(t).astimezone(zone).date() for t in played})
+    best = (1, days[0], days[0])
+    start = days[0]
+    for a, b in zip(days, days[1:]):
+        start = start if b == a + timedelta(days=1) else b
+        if (b - start).days + 1 > best[0]:
+            best = ((b - start).days + 1, start, b)
+
+    client = create_app().test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = uid
+    longest = client.get("/api/streaks").get_json()["longest"]
+    # set_timezone moved the streak onto the local days
+    assert (longest["days"], longest["start"], longest["end"]) == (best[0], best[1].isoformat(), best[2].isoformat())
+    with get_engine().begin() as conn:
+        # and a recompute from plays agrees
+        assert recompute_streak(conn, uid)["longest_days"] == best[0]
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { apiGet } from "../utils/api";
+import { apiStream } from "../utils/api";
 
 function formatDay(iso) {
   const d = new Date(iso);
@@ -11,9 +11,11 @@ export default function Heatmap() {
   const [err, setErr] = useState("");
 
   useEffect(() => {
-    apiGet("/api/heatmap")
-      .then((d) => setItems(d.items))
-      .catch(() => setErr("Failed to load. Try syncing and reload."));
+    // one chunk per month, rendered as each arrives
+    setItems([]);
+    apiStream("/api/heatmap?stream=1", (chunk) => {
+      if (chunk.items) setItems((prev) => prev.concat(chunk.items));
+    }).catch(() => setErr("Failed to load. Try syncing and reload."));
   }, []);
 
   return (
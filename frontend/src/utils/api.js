@@ -9,6 +9,29 @@ export async function apiGet(path) {
   return res.json();
 }
 
+// GET an NDJSON stream, calling onLine with each parsed line as it arrives
+export async function apiStream(path, onLine) {
+  const res = await fetch(`${BASE}${path}`, {
+    credentials: "include",
+  });
+  if (!res.ok) throw new Error(`GET ${path} ${res.status}`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl);
+      buf = buf.slice(nl + 1);
+      if (line) onLine(JSON.parse(line));
+    }
+  }
+  if (buf.trim()) onLine(JSON.parse(buf));
+}
+
 export async function apiPost(path, body) {
   const res = await fetch(`${BASE}${path}`, {
     method: "POST",